@@ -1,16 +1,148 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
 import dash
 from dash import html, dcc
 import dash_bootstrap_components as dbc
 import dash_ag_grid as dag
 import plotly.express as px
-from dash.dependencies import Input, Output
+from dash.dependencies import ALL, ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import pandas as pd
 import dash_table
-from db_sql import BrickSQLAlchemy, connection_string
-from flask import Flask
+from db_sql import SHARED_DIR, BrickSQLAlchemy, connection_string
+from check_runner import CheckRunner
+from edit_queue import EditQueue
+from export import csv_chunks, parquet_chunks
+from grid_payload import GRID_PAYLOAD, encode_columns, row_delta, with_row_ids
+from metrics import Exporter, observe, set_source
+from query_cancel import QueryCancelled
+from sampling import ERROR_BOUNDED, SAMPLE_PERCENT
+from table_stats import TableStats
+from flask import Flask, Response, abort, g, request, stream_with_context
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process anyway
+    fcntl = None
+
+try:
+    import diskcache
+except ImportError:  # check results stay in each process
+    diskcache = None
+
+
+# Per-process state, created by init_worker(). Under gunicorn this module is
+# imported once by the master and the workers are forked from it, and a
+# warehouse engine, its pooled sessions or background threads must not be
+# shared across a fork.
+brick = None
+edit_queue = None
+check_runner = None
+table_stats = None
+metrics_exporter = None
+_worker_pid = None
+_init_lock = threading.Lock()
+# Held (open) by the one worker that maintains rollups and the replica.
+_background_lock = None
+
+
+def _elect_background_worker():
+    """
+    Whether this process maintains the rollups and the local replica. With
+    several processes sharing BRICK_SHARED_DIR only the first to take a lock
+    there does, as they write to the same files; the others only read what
+    it built.
+    """
+    global _background_lock
+    if not SHARED_DIR or fcntl is None:
+        return True
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    lock_file = open(os.path.join(SHARED_DIR, "background.lock"), "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    _background_lock = lock_file
+    return True
+
+
+def init_worker():
+    """
+    Create this process's BrickSQLAlchemy (engine, connection pool, table
+    list) and the background workers using it, and set the layout, which
+    lists the tables. Does nothing if this process already did it, so it can
+    be called on every request; gunicorn's post_fork hook calls it up front.
+    """
+    global brick, edit_queue, check_runner, table_stats, metrics_exporter, _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _init_lock:
+        if _worker_pid == os.getpid():
+            return
+        if brick is not None:
+            # Inherited from the parent: forget its sessions without closing them.
+            brick.engine.dispose(close=False)
+
+        # Every worker reads the rollups and the replica, one maintains them.
+        brick = BrickSQLAlchemy(connection_string=connection_string, background=_elect_background_worker())
 
+        # Grid edits are buffered and written in batches by a background
+        # thread. Their outcomes are shared by the workers, if they can be,
+        # since the next poll of a session may reach another worker.
+        edit_queue = EditQueue(
+            brick,
+            max_batch=int(os.environ.get("EDIT_MAX_BATCH", 200)),
+            flush_interval=float(os.environ.get("EDIT_FLUSH_INTERVAL", 2.0)),
+            results=diskcache.Cache(os.path.join(SHARED_DIR, "edits")) if SHARED_DIR and diskcache else None,
+            result_ttl=float(os.environ.get("EDIT_RESULT_TTL", 600)),
+        ).start()
 
-brick = BrickSQLAlchemy(connection_string=connection_string)
+        # Rollups (see rollups.py) are built and kept up to date in the
+        # background, by the elected worker (start does nothing in the others).
+        if brick.rollups is not None:
+            brick.rollups.start()
+
+        # Hot tables are copied to the local replica in the background, if configured.
+        if brick.replica is not None:
+            brick.replica.start()
+
+        # Data-quality checks run in the background as soon as a dataset is
+        # selected. Their results are shared by the workers, if they can be.
+        check_runner = CheckRunner(
+            brick,
+            max_workers=int(os.environ.get("CHECK_WORKERS", 4)),
+            combined=os.environ.get("CHECK_COMBINED", "1") == "1",
+            store=diskcache.Cache(os.path.join(SHARED_DIR, "checks")) if SHARED_DIR and diskcache else None,
+        )
+
+        # Row counts and per-column cardinality, computed lazily in the background.
+        table_stats = TableStats(brick)
+
+        # Served on /metrics, added up over the workers sharing BRICK_SHARED_DIR.
+        metrics_exporter = Exporter(SHARED_DIR).start()
+
+        csv_files.clear()
+        for table_name in brick.get_table_names():
+            csv_files[table_name] = table_name
+        print(f"CSV files: {csv_files}")
+
+        app.layout = serve_layout
+        _worker_pid = os.getpid()
+
+
+# Columns with more distinct values than this can't be picked as group-by.
+GROUP_BY_MAX_GROUPS = int(os.environ.get("GROUP_BY_MAX_GROUPS", 100000))
+
+# Seconds the dropdowns wait for the statistics of a table seen for the first time.
+STATS_WAIT = float(os.environ.get("STATS_WAIT", 2.0))
 
 # app = dash.Dash(__name__, external_stylesheets=[dbc.themes.FLATLY])
 server = Flask(__name__)
@@ -20,11 +152,26 @@ app = dash.Dash(__name__, server=server, external_stylesheets=[dbc.themes.FLATLY
 # Data
 # --------------------------------------------------------
 df = px.data.gapminder()
+# Table name -> table name, filled by init_worker.
 csv_files = {}
-for table_name in brick.get_table_names():
-    csv_files[table_name] = table_name
 
-print(f"CSV files: {csv_files}")
+# "infinite" streams the grid from the warehouse one block of rows at a time,
+# "clientSide" loads a single page of rows into the browser.
+GRID_ROW_MODEL = os.environ.get("GRID_ROW_MODEL", "infinite")
+GRID_BLOCK_SIZE = int(os.environ.get("GRID_BLOCK_SIZE", 100))
+# Keyset cursors kept in the page, one per block the grid has loaded.
+GRID_MAX_CURSORS = 100
+
+# Rows fetched per batch when streaming an export.
+EXPORT_BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", 50000))
+
+# In sampled mode the grid first shows results from a sample of the rows
+# while the exact query runs here; query key -> Future, for the
+# MAX_REFINEMENTS most recent queries.
+refine_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refine")
+MAX_REFINEMENTS = 500
+refinements = OrderedDict()
+refinements_lock = threading.Lock()
 # --------------------------------------------------------
 # Layout Components (Modular functions)
 # --------------------------------------------------------
@@ -33,50 +180,68 @@ print(f"CSV files: {csv_files}")
 def make_aggrid_table():
     """
     Returns a dash_ag_grid.AgGrid component with the gapminder data.
+    In infinite mode the grid requests blocks of rows through getRowsRequest
+    instead of holding rowData.
     """
+    grid_options = {"rowHeight": 32, "animateRows": False}
+    if GRID_ROW_MODEL == "infinite":
+        grid_options.update(
+            {
+                "cacheBlockSize": GRID_BLOCK_SIZE,
+                "maxBlocksInCache": 20,
+                "infiniteInitialRowCount": GRID_BLOCK_SIZE,
+            }
+        )
+        row_props = {"rowModelType": "infinite"}
+    else:
+        # Stable row ids let edits and refreshes update rows in place.
+        row_props = {"rowData": [], "getRowId": "params.data._row_id"}
     return dcc.Loading(
         id="grid-loading",
         children=dag.AgGrid(
             id="data-table",
             columnDefs=[{"headerName": col, "field": col} for col in df.columns],
-            rowData=[],
-            dashGridOptions={"rowHeight": 32, "animateRows": False},
+            dashGridOptions=grid_options,
             defaultColDef={"filter": True, "editable": True},
             style={"height": "400px", "width": "100%"},
+            **row_props,
         ),
         
     )
 
 
-def make_tab1_content():
-    return dcc.Loading(
-        dbc.Card(
-            dbc.CardBody(
-                [
-                    html.H4("Tab 1 Table"),
-                    dbc.Alert(id="empty-message-1", color="info", dismissable=True, is_open=False),  # Styled alert  # To show a message if no data
-                    dash_table.DataTable(
-                        id="table-tab1",
-                        data=[],  # we’ll fill this via callback
-                        page_size=10,
-                    ),
-                ]
-            )
-        )
+def make_export_links():
+    """
+    Download links for the grid's current query, filled in by update_export_links.
+    """
+    link_style = {"margin-right": 15}
+    return html.Div(
+        [
+            html.A("Export CSV", id="export-csv", href="", style=link_style),
+            html.A("Export Parquet", id="export-parquet", href="", style=link_style),
+        ],
+        style={"margin-top": 8},
     )
 
 
-def make_tab2_content():
+def make_check_tab_content(rule):
+    """
+    Returns the content of the tab showing one data-quality rule's results.
+    """
     return dcc.Loading(
-        id="loading-2",
         children=dbc.Card(
             dbc.CardBody(
                 [
-                    html.H4("Tab 2 Table"),
-                    dbc.Alert(id="empty-message-2", color="info", dismissable=True, is_open=False),
+                    html.H4(rule.label),
+                    dbc.Alert(
+                        id={"type": "check-message", "rule": rule.name},
+                        color="info",
+                        dismissable=True,
+                        is_open=False,
+                    ),  # To show a message if no data
                     dash_table.DataTable(
-                        id="table-tab2",
-                        data=[],
+                        id={"type": "check-table", "rule": rule.name},
+                        data=[],  # we’ll fill this via callback
                         page_size=10,
                     ),
                 ]
@@ -85,49 +250,43 @@ def make_tab2_content():
     )
 
 
-def make_tab3_content():
+def make_check_status():
     """
-    Returns the content for Tab 3.
+    Progress of the background data-quality checks, with a cancel button.
     """
-    return dcc.Loading(
-        id="loading-3",
-        children=dbc.Card(
-            dbc.CardBody(
-                [
-                    html.H4("Tab 3 Table"),
-                    dbc.Alert(id="empty-message-3", color="info", dismissable=True, is_open=False),  # Styled alert  # To show a message if no data
-                    dash_table.DataTable(
-                        id="table-tab3",
-                        data=[],
-                        page_size=10,
-                    ),
-                ]
-            )
-        ),
+    return html.Div(
+        [
+            dbc.Progress(id="check-progress", value=0, label="", style={"flex": 1, "height": 20}),
+            dbc.Button(
+                "Cancel checks",
+                id="cancel-checks",
+                size="sm",
+                color="secondary",
+                style={"margin-left": 10},
+            ),
+            dcc.Interval(id="check-poll", interval=1000, disabled=True),
+        ],
+        style={"display": "flex", "align-items": "center", "margin-top": 30},
     )
 
 
 def make_tabs():
+    """
+    One tab per data-quality rule registered in brick.rules.
+    """
     return dbc.Tabs(
         [
             dbc.Tab(
-                make_tab1_content(), label="check_duplicates", id="tab-1", disabled=True
-            ),
-            dbc.Tab(
-                make_tab2_content(),
-                label="check_negative_debits_credits",
-                id="tab-2",
+                make_check_tab_content(rule),
+                label=rule.label,
+                id={"type": "check-tab", "rule": rule.name},
+                tab_id=rule.name,
                 disabled=True,
-            ),
-            dbc.Tab(
-                make_tab3_content(),
-                label="check_region_country_mismatch",
-                id="tab-3",
-                disabled=True,
-            ),
+            )
+            for rule in brick.rules
         ],
         id="main-tabs",
-        active_tab="tab-0",
+        active_tab=brick.rules.names()[0] if len(brick.rules) else None,
         style={"margin-top": 30},
     )
 
@@ -211,6 +370,8 @@ def make_left_panel():
                                     {"label": "COUNT", "value": "COUNT"},
                                     {"label": "MAX", "value": "MAX"},
                                     {"label": "MIN", "value": "MIN"},
+                                    {"label": "COUNT DISTINCT", "value": "COUNT_DISTINCT"},
+                                    {"label": "MEDIAN", "value": "MEDIAN"},
                                 ],
                                 clearable=True,
                                 optionHeight=40,
@@ -220,6 +381,16 @@ def make_left_panel():
                             ),
                         ]
                     ),
+                    html.Div(
+                        [
+                            html.H2("Exploration:"),
+                            dbc.Switch(
+                                id="sample-mode",
+                                label=f"Sampled ({SAMPLE_PERCENT:g}% of rows, approximate)",
+                                value=False,
+                            ),
+                        ]
+                    ),
                 ],
                 style={"margin-left": 15, "margin-right": 15, "margin-top": 30},
             ),
@@ -242,7 +413,29 @@ def make_main_content():
             html.Div(
                 [
                     make_aggrid_table(),  # The table
+                    make_export_links(),
+                    dcc.Store(id="grid-row-count"),
+                    # Enabled while the grid shows an estimated row count (see get_grid_rows).
+                    dcc.Interval(id="row-count-poll", interval=1000, disabled=True),
+                    # Keyset cursors of the grid's blocks (see get_grid_rows).
+                    dcc.Store(id="grid-cursors"),
+                    # Columnar grid rows, decoded in the browser (assets/grid_payload.js).
+                    dcc.Store(id="grid-payload"),
+                    # Version of the rows the grid holds, for incremental updates.
+                    dcc.Store(id="grid-version"),
+                    dcc.Store(id="grid-refresh"),
+                    # Enabled while the session has edits waiting to be saved.
+                    dcc.Interval(id="edit-result-poll", interval=2000, disabled=True),
+                    dbc.Alert(id="save-status", is_open=False, dismissable=True, duration=5000),
+                    # Filters the grid couldn't apply (see grid_filters.py).
+                    dbc.Alert(id="grid-status", is_open=False, color="warning", dismissable=True),
+                    dcc.Store(id="grid-purge"),
+                    dbc.Alert(id="sample-status", is_open=False, color="info"),
+                    dcc.Store(id="sample-query"),
+                    dcc.Store(id="refined-query"),
+                    dcc.Interval(id="refine-poll", interval=1000, disabled=True),
                     html.Pre(id="output-value-setter"),
+                    make_check_status(),
                     make_tabs(),  # The tabs below the table
                     html.Div(
                         id="tab-switch-output", style={"marginTop": 20}
@@ -278,9 +471,12 @@ def make_navbar():
 def serve_layout():
     """
     Combine the navbar, left panel, and main content into a dbc.Container.
+    Called on every page load, so each one gets its own session id.
     """
     return html.Div(
         [
+            # Identifies this page load, so its superseded queries can be cancelled.
+            dcc.Store(id="session-id", data=str(uuid.uuid4())),
             make_navbar(),  # Add the navbar at the top
             dbc.Container(
                 [
@@ -300,7 +496,6 @@ def serve_layout():
     )
 
 
-app.layout = serve_layout()
 
 
 @app.callback(
@@ -320,15 +515,158 @@ def populate_dropdowns(selected_file):
     column_options = [
         {"label": col.name, "value": col.name} for col in table_schema.fields
     ]
-    return column_options, column_options
+    return group_by_options(selected_file, table_schema), column_options
+
+
+def approx_number(n):
+    for divisor, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if n >= divisor:
+            return f"{n / divisor:.1f}{suffix}"
+    return str(n)
+
+
+def group_by_options(selected_file, table_schema):
+    """
+    Group-by options labelled with the estimated number of groups; columns
+    that would give more than GROUP_BY_MAX_GROUPS groups are disabled.
+    Without statistics (yet) every column is offered as is.
+    """
+    stats = table_stats.get(selected_file, timeout=STATS_WAIT)
+    options = []
+    for col in table_schema.fields:
+        col_stats = stats["columns"].get(col.name) if stats else None
+        if col_stats is None:
+            options.append({"label": col.name, "value": col.name})
+            continue
+        groups = col_stats["distinct"]
+        too_many = groups > GROUP_BY_MAX_GROUPS
+        options.append(
+            {
+                "label": f"{col.name} (~{approx_number(groups)} groups{', too many' if too_many else ''})",
+                "value": col.name,
+                "disabled": too_many,
+            }
+        )
+    return options
+
+
+def grid_query_args(group_by, aggregate_column, agg_function, filter_model=None):
+    """
+    Map the left panel selections and the grid filter model to
+    get_data_query keyword arguments.
+    """
+    # Group by and aggregate the data makes sense only if all 3 are selected
+    if not all([group_by, aggregate_column, agg_function]):
+        return {"filter_model": filter_model or None}
+    return {
+        "group_by": group_by,
+        "aggregate_columns": [{"column": aggregate_column, "agg": agg_function}],
+    }
+
+
+def query_key(selected_file, query_args):
+    return json.dumps([selected_file, query_args], sort_keys=True, default=str)
+
+
+def grid_sample(sample_mode, exact_key):
+    """
+    The sample percentage to query with: None unless sampled mode is on and
+    the exact results of the query aren't ready yet.
+    """
+    if not sample_mode:
+        return None
+    with refinements_lock:
+        future = refinements.get(exact_key)
+    if future is not None and future.done() and future.exception() is None:
+        return None
+    return SAMPLE_PERCENT
+
+
+def refine(exact_key, selected_file, query_args, sort_column=None, sort_order=None):
+    """
+    Run the exact version of a sampled grid query in the background (first
+    block and, for the infinite row model, the row count) so it is in the
+    result cache when the grid switches over. Without a result cache the
+    grid would run the exact query again anyway, so it keeps the sample.
+    """
+    if not brick.cache.enabled:
+        return
+    with refinements_lock:
+        if exact_key in refinements:
+            refinements.move_to_end(exact_key)
+            return
+        # Claimed before it is submitted, so it only runs once.
+        refinements[exact_key] = None
+        while len(refinements) > MAX_REFINEMENTS:
+            refinements.popitem(last=False)
+
+    def run_exact():
+        set_source("refine")
+        if GRID_ROW_MODEL == "infinite" and "group_by" not in query_args:
+            # The same statement get_grid_rows pages rows with, so its first
+            # block is served from the cache.
+            brick.get_page(
+                selected_file,
+                offset=0,
+                limit=GRID_BLOCK_SIZE,
+                sort_column=sort_column,
+                sort_order=sort_order,
+                **query_args,
+            )
+        else:
+            brick.get_data_query(
+                table_name=selected_file,
+                limit=GRID_BLOCK_SIZE,
+                sort_column=sort_column,
+                sort_order=sort_order,
+                **query_args,
+            )
+        if GRID_ROW_MODEL == "infinite":
+            brick.count_rows(selected_file, **query_args)
+
+    future = refine_executor.submit(run_exact)
+    with refinements_lock:
+        if exact_key in refinements:
+            refinements[exact_key] = future
 
 
-# For updating the data table based on grouping/aggregation
-# Callback to update table data
 @app.callback(
     [
-        Output("data-table", "columnDefs"),
-        Output("data-table", "rowData"),
+        Output("refine-poll", "disabled"),
+        Output("sample-status", "children"),
+        Output("sample-status", "is_open"),
+        Output("refined-query", "data"),
+    ],
+    [Input("sample-query", "data"), Input("refine-poll", "n_intervals")],
+    prevent_initial_call=True,
+)
+def track_refinement(sample_query, n_intervals):
+    """
+    While the grid shows sampled results, say so and wait for the exact
+    query; once it is done, refined-query makes the grid reload.
+    """
+    if not sample_query:
+        return True, dash.no_update, False, dash.no_update
+    note = (
+        f"Showing a {SAMPLE_PERCENT:g}% sample: SUM and COUNT are scaled up to the whole table "
+        "and the _error columns are 95% error bounds."
+    )
+    if not brick.cache.enabled:
+        note = f"{note} Exact results aren't loaded without the query cache (BRICK_CACHE_TTL=0)."
+        return True, note, True, dash.no_update
+    with refinements_lock:
+        future = refinements.get(sample_query)
+    if future is None or not future.done():
+        return False, f"{note} Exact results are loading...", True, dash.no_update
+    if future.exception() is not None:
+        return True, f"{note} The exact query failed: {future.exception()}", True, dash.no_update
+    return True, "Exact results loaded.", True, sample_query
+
+
+@app.callback(
+    [
+        Output("export-csv", "href"),
+        Output("export-parquet", "href"),
     ],
     [
         Input("dataset-dropdown", "value"),
@@ -336,106 +674,683 @@ def populate_dropdowns(selected_file):
         Input("aggregate-column-dropdown", "value"),
         Input("aggregation-function-dropdown", "value"),
         Input("data-table", "filterModel"),
-        Input("data-table", "cellValueChanged"),  # For edits
+        Input("data-table", "getRowsRequest"),
     ],
 )
-def update_group_by_table(
-    selected_file, group_by, aggregate_column, agg_function, filter_model, cell_value_changed
-):
+def update_export_links(selected_file, group_by, aggregate_column, agg_function, filter_model, rows_request):
+    """
+    Point the export links at the query the grid is currently showing.
+    """
     if not selected_file:
-        return [], []
+        return "", ""
+    params = {}
+    if all([group_by, aggregate_column, agg_function]):
+        params.update(group_by=group_by, aggregate_column=aggregate_column, agg_function=agg_function)
+    # The infinite row model sends the latest filter and sort with each block.
+    if rows_request:
+        filter_model = rows_request.get("filterModel")
+        sort_model = rows_request.get("sortModel") or []
+        if sort_model:
+            params.update(sort_column=sort_model[0]["colId"], sort_order=sort_model[0]["sort"])
+    if filter_model:
+        params["filter_model"] = json.dumps(filter_model)
+    base = f"/export/{selected_file}"
+    return (
+        f"{base}?{urlencode({**params, 'format': 'csv'})}",
+        f"{base}?{urlencode({**params, 'format': 'parquet'})}",
+    )
 
-    if selected_file and cell_value_changed:
-        brick.save_row_data(selected_file, cell_value_changed)
 
-    print(
-        f"Selected file: {selected_file}, Group by: {group_by}, Aggregate: {aggregate_column}, Function: {agg_function}, Filter: {filter_model}"
+@server.route("/export/<table_name>")
+def export_table(table_name):
+    """
+    Stream the grid query for table_name (filters, sort, group/aggregate,
+    no limit) as CSV or Parquet, one batch in memory at a time.
+    """
+    if table_name not in brick.get_table_names():
+        abort(404)
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "parquet"):
+        abort(400)
+    filter_model = request.args.get("filter_model")
+    query_args = grid_query_args(
+        request.args.get("group_by"),
+        request.args.get("aggregate_column"),
+        request.args.get("agg_function"),
+        json.loads(filter_model) if filter_model else None,
+    )
+    query_args.update(sort_column=request.args.get("sort_column"), sort_order=request.args.get("sort_order"))
+    batches = brick.export_batches(table_name, batch_size=EXPORT_BATCH_ROWS, **query_args)
+    if export_format == "csv":
+        chunks, mimetype = csv_chunks(batches), "text/csv"
+    else:
+        # Column types come from the query, not the first batch, where a
+        # column may be all NULL.
+        columns = brick.export_columns(table_name, **query_args)
+        chunks, mimetype = parquet_chunks(batches, columns), "application/vnd.apache.parquet"
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={table_name}.{export_format}"},
     )
-    # Group by and aggregate the data makes sense only if all 3 are selected
 
-    if not all([group_by, aggregate_column, agg_function]):
-        df = brick.get_data_query(table_name=selected_file, filter_model=filter_model)
+
+def request_name():
+    """
+    What a request is labelled with in the metrics: the outputs of a Dash
+    callback, else the route.
+    """
+    if request.path.endswith("/_dash-update-component"):
+        body = request.get_json(silent=True) or {}
+        return f"callback:{body.get('output', '?')}"
+    return f"route:{request.url_rule.rule if request.url_rule else 'unmatched'}"
+
+
+@server.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    # Statements run for this request are labelled with it too.
+    g.request_name = request_name()
+    set_source(g.request_name)
+
+
+@server.after_request
+def record_request_timing(response):
+    started = g.pop("request_started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    observe("http_request_seconds", elapsed, {"route": route, "status": str(response.status_code)})
+    if g.request_name.startswith("callback:"):
+        labels = {"callback": g.request_name.partition(":")[2]}
+        observe("dash_callback_seconds", elapsed, labels)
+        if not response.is_streamed:
+            observe("dash_callback_payload_bytes", response.calculate_content_length() or 0, labels)
+    return response
+
+
+@server.teardown_request
+def clear_request_source(exception):
+    set_source(None)
+
+
+@server.route("/metrics")
+def export_metrics():
+    """
+    Query, callback and cache metrics in the Prometheus text format.
+    """
+    exporter = metrics_exporter or Exporter()
+    return Response(exporter.export(), mimetype="text/plain; version=0.0.4")
+
+
+def save_status(save_result):
+    """
+    Text, color and is_open for the save-status alert from a save_row_data result.
+    """
+    if save_result["error"]:
+        return (
+            f"Could not save {save_result['cells']} edit(s): {save_result['error']}",
+            "danger",
+            True,
+        )
+    saved = f"Saved {save_result['cells']} edit(s) in {save_result['rows_applied']} row(s) ({save_result['elapsed_ms']} ms)."
+    if save_result.get("rows_failed"):
+        # Rows deleted (or never stored) under a transaction_id the grid still showed.
+        return f"{saved} {save_result['rows_failed']} edited row(s) no longer exist.", "warning", True
+    return saved, "success", True
+
+
+def grid_column_defs(selected_file, group_by, aggregate_column, agg_function, sample=None):
+    """
+    Column defs for the grid, derived from the schema so the infinite row
+    model knows its columns before the first block arrives.
+    """
+    if all([group_by, aggregate_column, agg_function]):
+        # Aggregated rows don't map back to a single transaction, so no edits.
+        columns = [group_by, f"{agg_function.upper()}_{aggregate_column}"]
+        if sample and agg_function.upper() in ERROR_BOUNDED:
+            columns.append(f"{columns[1]}_error")
+        return [{"headerName": col, "field": col, "editable": False} for col in columns]
+    columns = [field.name for field in brick.get_schema_for_table(selected_file).fields]
+    return [{"headerName": col, "field": col} for col in columns]
+
+
+def grid_rows(df, **extra):
+    """
+    The grid's rows in the GRID_PAYLOAD format, with `extra` keys (e.g. the
+    row count).
+    """
+    if GRID_PAYLOAD == "columnar":
+        return dict(encode_columns(df), **extra)
+    return dict(extra, rowData=df.to_dict("records"))
+
+
+if GRID_ROW_MODEL == "infinite":
+
+    @app.callback(
+        Output("data-table", "columnDefs"),
+        [
+            Input("dataset-dropdown", "value"),
+            Input("group-by-dropdown", "value"),
+            Input("aggregate-column-dropdown", "value"),
+            Input("aggregation-function-dropdown", "value"),
+            Input("sample-mode", "value"),
+            Input("refined-query", "data"),
+        ],
+        State("data-table", "columnDefs"),
+    )
+    def update_grid_columns(
+        selected_file, group_by, aggregate_column, agg_function, sample_mode, refined_query, current_defs
+    ):
+        if not selected_file:
+            return []
+        exact_key = query_key(selected_file, grid_query_args(group_by, aggregate_column, agg_function))
+        sample = grid_sample(sample_mode, exact_key)
+        column_defs = grid_column_defs(selected_file, group_by, aggregate_column, agg_function, sample)
+        # Same columns (e.g. another table with the same schema): nothing to resend.
+        return dash.no_update if column_defs == current_defs else column_defs
+
+    # A new query: drop the cached blocks so the grid asks again.
+    # grid-refresh does the same when edits could not be saved.
+    app.clientside_callback(
+        """
+        function() {
+            const api = dash_ag_grid.getApi("data-table");
+            if (api) {
+                api.purgeInfiniteCache();
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output("grid-purge", "data"),
+        [
+            Input("dataset-dropdown", "value"),
+            Input("group-by-dropdown", "value"),
+            Input("aggregate-column-dropdown", "value"),
+            Input("aggregation-function-dropdown", "value"),
+            Input("sample-mode", "value"),
+            Input("grid-refresh", "data"),
+            Input("refined-query", "data"),
+        ],
+        prevent_initial_call=True,
+    )
+
+    if GRID_PAYLOAD == "columnar":
+        grid_block_output = Output("grid-payload", "data")
+        app.clientside_callback(
+            ClientsideFunction(namespace="grid", function_name="decodeBlock"),
+            Output("data-table", "getRowsResponse"),
+            Input("grid-payload", "data"),
+            prevent_initial_call=True,
+        )
     else:
-        df = brick.get_data_query(
-            table_name=selected_file,
-            group_by=group_by,
-            aggregate_columns=[{"column": aggregate_column, "agg": agg_function}],
+        grid_block_output = Output("data-table", "getRowsResponse")
+
+    @app.callback(
+        [
+            grid_block_output,
+            Output("grid-row-count", "data"),
+            Output("sample-query", "data"),
+            Output("grid-cursors", "data"),
+            Output("grid-status", "children"),
+            Output("grid-status", "is_open"),
+            Output("row-count-poll", "disabled"),
+        ],
+        Input("data-table", "getRowsRequest"),
+        [
+            State("dataset-dropdown", "value"),
+            State("group-by-dropdown", "value"),
+            State("aggregate-column-dropdown", "value"),
+            State("aggregation-function-dropdown", "value"),
+            State("grid-row-count", "data"),
+            State("sample-mode", "value"),
+            State("session-id", "data"),
+            State("grid-cursors", "data"),
+        ],
+    )
+    def get_grid_rows(
+        request,
+        selected_file,
+        group_by,
+        aggregate_column,
+        agg_function,
+        row_count,
+        sample_mode,
+        session_id,
+        grid_cursors,
+    ):
+        """
+        Serve one block of the infinite row model: a single query for
+        startRow..endRow, plus a row count computed once per query.
+        Rows (not groups) are paged by keyset: each block leaves a cursor
+        for the block after it, so scrolling down costs the same at any
+        depth; a block reached without one (e.g. by dragging the scrollbar)
+        uses an offset.
+        The row count of a whole table is an estimate from the table's
+        metadata at first, if there is one, while the exact count runs in
+        the background (see fill_row_count).
+        In sampled mode the block comes from a sample until the exact query,
+        started here, has finished. Blocks of an older query (other filters,
+        sort or grouping) still running for this session are cancelled.
+        A filter that can't be applied gets an empty grid and a warning.
+        """
+        if not request or not selected_file:
+            return grid_rows(pd.DataFrame(), rowCount=0), None, None, None, dash.no_update, False, True
+
+        start_row = request.get("startRow", 0)
+        end_row = request.get("endRow", start_row + GRID_BLOCK_SIZE)
+        sort_model = request.get("sortModel") or []
+        query_args = grid_query_args(
+            group_by, aggregate_column, agg_function, request.get("filterModel")
+        )
+        sort_column = sort_model[0]["colId"] if sort_model else None
+        sort_order = sort_model[0]["sort"] if sort_model else None
+        exact_key = query_key(selected_file, query_args)
+        sample = grid_sample(sample_mode, exact_key)
+        if sample:
+            refine(exact_key, selected_file, query_args, sort_column, sort_order)
+        # The count only depends on the query, not on the block or the sort.
+        count_key = query_key(selected_file, dict(query_args, sample=sample))
+        # Cursors only hold for the query and sort they were made for.
+        cursors_key = query_key(selected_file, dict(query_args, sample=sample, sort=[sort_column, sort_order]))
+        cursors = grid_cursors["cursors"] if grid_cursors and grid_cursors.get("key") == cursors_key else {}
+        next_cursor = None
+        estimated = False
+        try:
+            with brick.queries.request((session_id, "grid"), key=(count_key, sort_column, sort_order)):
+                if "group_by" in query_args:
+                    df = brick.get_data_query(
+                        table_name=selected_file,
+                        offset=start_row,
+                        limit=end_row - start_row,
+                        sort_column=sort_column,
+                        sort_order=sort_order,
+                        sample=sample,
+                        **query_args,
+                    )
+                else:
+                    df, next_cursor = brick.get_page(
+                        selected_file,
+                        offset=start_row,
+                        limit=end_row - start_row,
+                        sort_column=sort_column,
+                        sort_order=sort_order,
+                        sample=sample,
+                        cursor=cursors.get(str(start_row)),
+                        **query_args,
+                    )
+                if len(df) < end_row - start_row:
+                    total = start_row + len(df)
+                elif row_count and row_count.get("key") == count_key and not row_count.get("estimated"):
+                    total = row_count["count"]
+                else:
+                    total = None
+                    if not sample and query_args == {"filter_model": None}:
+                        # The whole table: its cached row count saves a COUNT(*), an
+                        # estimate defers it to the background.
+                        total = table_stats.row_count(selected_file)
+                        if total is None:
+                            total = table_stats.estimated_row_count(selected_file)
+                            estimated = total is not None
+                    if total is None:
+                        total = brick.count_rows(selected_file, sample=sample, **query_args)
+        except QueryCancelled:
+            raise PreventUpdate
+        except ValueError as e:
+            return grid_rows(pd.DataFrame(), rowCount=0), None, None, None, f"Can't filter the rows: {e}", True, True
+        if next_cursor:
+            cursors = dict(cursors)
+            cursors.pop(str(end_row), None)
+            cursors[str(end_row)] = next_cursor
+            while len(cursors) > GRID_MAX_CURSORS:
+                del cursors[next(iter(cursors))]
+            cursors = {"key": cursors_key, "cursors": cursors}
+        else:
+            cursors = dash.no_update
+        return (
+            grid_rows(df, rowCount=total),
+            {"key": count_key, "count": total, "estimated": estimated},
+            exact_key if sample else None,
+            cursors,
+            dash.no_update,
+            False,
+            not estimated,
+        )
+
+    @app.callback(
+        [
+            Output("grid-row-count", "data", allow_duplicate=True),
+            Output("row-count-poll", "disabled", allow_duplicate=True),
+        ],
+        Input("row-count-poll", "n_intervals"),
+        [State("dataset-dropdown", "value"), State("grid-row-count", "data")],
+        prevent_initial_call=True,
+    )
+    def fill_row_count(n_intervals, selected_file, row_count):
+        """
+        Replace the estimated row count of the grid by the exact one once
+        the background count (see TableStats) has it.
+        """
+        if not selected_file or not row_count or not row_count.get("estimated"):
+            return dash.no_update, True
+        exact = table_stats.row_count(selected_file)
+        if exact is None:
+            return dash.no_update, False
+        return dict(row_count, count=exact, estimated=False, filled=True), True
+
+    # Hands the exact row count from fill_row_count to the grid, which keeps its blocks.
+    app.clientside_callback(
+        """
+        function(rowCount) {
+            const api = dash_ag_grid.getApi("data-table");
+            if (api && rowCount && rowCount.filled) {
+                api.setRowCount(rowCount.count, true);
+            }
+            return window.dash_clientside.no_update;
+        }
+        """,
+        Output("grid-purge", "data", allow_duplicate=True),
+        Input("grid-row-count", "data"),
+        prevent_initial_call=True,
+    )
+
+else:
+
+    # Rows go through grid-payload either way: applyRows (assets/grid_payload.js)
+    # sets rowData from a full payload or applies a row transaction.
+    app.clientside_callback(
+        ClientsideFunction(namespace="grid", function_name="applyRows"),
+        [Output("data-table", "rowData"), Output("data-table", "rowTransaction", allow_duplicate=True)],
+        Input("grid-payload", "data"),
+        prevent_initial_call=True,
+    )
+
+    # The rows last sent to each session's grid (see client_rows), for the
+    # GRID_SNAPSHOT_SESSIONS most recent sessions.
+    GRID_SNAPSHOT_SESSIONS = 1000
+    grid_snapshots = OrderedDict()
+    grid_snapshots_lock = threading.Lock()
+
+    def client_rows(session_id, client_version, df, key):
+        """
+        Returns (payload, version) for grid-payload / grid-version. When the
+        grid holds the rows this process last sent it (same version), the
+        payload is a row transaction adding, updating and removing only the
+        rows that changed, matched by `key`; otherwise it holds every row.
+        """
+        df = with_row_ids(df, key)
+        with grid_snapshots_lock:
+            snapshot = grid_snapshots.pop(session_id, None)
+        delta = None
+        if (
+            snapshot is not None
+            and snapshot["version"] == client_version
+            and snapshot["key"] == key
+            and list(snapshot["rows"].columns) == list(df.columns)
+        ):
+            delta = row_delta(snapshot["rows"], df)
+        if delta is not None and sum(len(rows) for rows in delta) > len(df) / 2:
+            delta = None  # reloading everything is cheaper
+        version = str(uuid.uuid4())
+        if delta is None:
+            payload = grid_rows(df)
+        else:
+            added, updated, removed = delta
+            if not len(added) and not len(updated) and not removed:
+                payload, version = dash.no_update, client_version
+            else:
+                payload = {
+                    "transaction": {
+                        "add": grid_rows(added),
+                        "update": grid_rows(updated),
+                        "remove": removed,
+                    }
+                }
+        with grid_snapshots_lock:
+            grid_snapshots[session_id] = {"version": version, "key": key, "rows": df}
+            while len(grid_snapshots) > GRID_SNAPSHOT_SESSIONS:
+                grid_snapshots.popitem(last=False)
+        return payload, version
+
+    # For updating the data table based on grouping/aggregation
+    # Callback to update table data
+    @app.callback(
+        [
+            Output("data-table", "columnDefs"),
+            Output("grid-payload", "data"),
+            Output("grid-version", "data"),
+            Output("sample-query", "data"),
+            Output("grid-status", "children"),
+            Output("grid-status", "is_open"),
+        ],
+        [
+            Input("dataset-dropdown", "value"),
+            Input("group-by-dropdown", "value"),
+            Input("aggregate-column-dropdown", "value"),
+            Input("aggregation-function-dropdown", "value"),
+            Input("data-table", "filterModel"),
+            Input("sample-mode", "value"),
+            Input("refined-query", "data"),
+        ],
+        [State("session-id", "data"), State("data-table", "columnDefs"), State("grid-version", "data")],
+    )
+    def update_group_by_table(
+        selected_file,
+        group_by,
+        aggregate_column,
+        agg_function,
+        filter_model,
+        sample_mode,
+        refined_query,
+        session_id,
+        current_defs,
+        grid_version,
+    ):
+        """
+        Load the grid's rows for the left panel selections and filters. When
+        only some rows change (e.g. exact results replacing sampled ones, or
+        a filter narrowed), the grid gets just those as a row transaction.
+        Edits are saved by save_grid_edits and never reload the rows. A
+        filter that can't be applied empties the grid and shows a warning.
+        """
+        if not selected_file:
+            return [], grid_rows(pd.DataFrame()), None, None, dash.no_update, False
+
+        print(
+            f"Selected file: {selected_file}, Group by: {group_by}, Aggregate: {aggregate_column}, Function: {agg_function}, Filter: {filter_model}"
         )
-    # dash_ag_grid expects "columnDefs" in the form [{"headerName": ..., "field": ...}]
-    column_defs = [{"headerName": col, "field": col} for col in df.columns]
-    row_data = df.to_dict("records")
-    return column_defs, row_data
+        query_args = grid_query_args(group_by, aggregate_column, agg_function, filter_model)
+        exact_key = query_key(selected_file, query_args)
+        sample = grid_sample(sample_mode, exact_key)
+        if sample:
+            refine(exact_key, selected_file, query_args)
+        # A query still running for older selections of this session is cancelled.
+        try:
+            with brick.queries.request((session_id, "grid"), key=(exact_key, sample)):
+                df = brick.get_data_query(table_name=selected_file, limit=GRID_BLOCK_SIZE, sample=sample, **query_args)
+        except QueryCancelled:
+            raise PreventUpdate
+        except ValueError as e:
+            # No rows, and the grid no longer holds those of grid_version.
+            return dash.no_update, grid_rows(pd.DataFrame()), None, None, f"Can't filter the rows: {e}", True
+        # dash_ag_grid expects "columnDefs" in the form [{"headerName": ..., "field": ...}]
+        column_defs = grid_column_defs(selected_file, group_by, aggregate_column, agg_function, sample)
+        if column_defs == current_defs:
+            column_defs = dash.no_update
+        else:
+            grid_version = None  # new columns: send every row
+        payload, version = client_rows(session_id, grid_version, df, query_args.get("group_by") or "transaction_id")
+        return column_defs, payload, version, exact_key if sample else None, dash.no_update, False
+
+
+edit_outputs = [
+    Output("save-status", "children"),
+    Output("save-status", "color"),
+    Output("save-status", "is_open"),
+    Output("edit-result-poll", "disabled"),
+]
+if GRID_ROW_MODEL != "infinite":
+    edit_outputs.append(Output("data-table", "rowTransaction", allow_duplicate=True))
 
 
 @app.callback(
-    [
-        Output("tab-1", "disabled"),
-        Output("tab-2", "disabled"),
-        Output("tab-3", "disabled"),
-    ],
+    edit_outputs,
+    Input("data-table", "cellValueChanged"),
+    State("dataset-dropdown", "value"),
+    State("session-id", "data"),
+    prevent_initial_call=True,
+)
+def save_grid_edits(cell_value_changed, selected_file, session_id):
+    """
+    Acknowledge edits right away and hand them to the edit queue. The grid
+    already shows the new value, in client-side mode a row transaction
+    confirms the edited rows instead of reloading every row.
+    """
+    if not selected_file or not cell_value_changed:
+        return [dash.no_update] * len(edit_outputs)
+    pending = edit_queue.submit(selected_file, cell_value_changed, session_id)
+    # Poll for the outcome until every edit is saved (see report_saved_edits).
+    status = [f"{pending} edit(s) waiting to be saved.", "secondary", True, False]
+    if GRID_ROW_MODEL != "infinite":
+        status.append({"update": [change["data"] for change in cell_value_changed]})
+    return status
+
+
+edit_result_outputs = [
+    Output("save-status", "children", allow_duplicate=True),
+    Output("save-status", "color", allow_duplicate=True),
+    Output("save-status", "is_open", allow_duplicate=True),
+    Output("edit-result-poll", "disabled", allow_duplicate=True),
+]
+if GRID_ROW_MODEL == "infinite":
+    edit_result_outputs.append(Output("grid-refresh", "data"))
+else:
+    edit_result_outputs.append(Output("data-table", "rowTransaction", allow_duplicate=True))
+
+
+@app.callback(
+    edit_result_outputs,
+    Input("edit-result-poll", "n_intervals"),
+    State("dataset-dropdown", "value"),
+    State("session-id", "data"),
+    prevent_initial_call=True,
+)
+def report_saved_edits(n_intervals, selected_file, session_id):
+    """
+    Report what the edit queue flushed of this session's edits. Edits it
+    could not save are shown as an error and their old values are put back
+    in the grid. Polling stops once none of the session's edits are waiting.
+    """
+    results = edit_queue.drain_results(selected_file, session_id) if selected_file else []
+    done = not selected_file or edit_queue.waiting(selected_file, session_id) == 0
+    failures = [(save_result, batch) for save_result, batch in results if save_result["error"]]
+    if not failures:
+        if not results:
+            return [dash.no_update] * 3 + [done, dash.no_update]
+        return [*save_status(results[-1][0]), done, dash.no_update]
+
+    changes = [change for _, batch in failures for change in batch]
+    errors = "; ".join(sorted({save_result["error"] for save_result, _ in failures}))
+    status = [f"Could not save {len(changes)} edit(s): {errors}", "danger", True, done]
+    if GRID_ROW_MODEL == "infinite":
+        # Reload the visible blocks so they show what is actually stored.
+        status.append(n_intervals)
+    else:
+        # Walk back from the newest edit so each cell ends on its oldest value.
+        reverted = {}
+        for change in reversed(changes):
+            row = reverted.setdefault(change["data"]["_row_id"], dict(change["data"]))
+            row[change["colId"]] = change.get("oldValue")
+        status.append({"update": list(reverted.values())})
+    return status
+
+
+@app.callback(
+    Output({"type": "check-tab", "rule": ALL}, "disabled"),
     Input("dataset-dropdown", "value"),
 )
 def toggle_tabs_when_no_dataset(selected_dataset):
-    if not selected_dataset:
-        # No dataset selected -> disable all tabs
-        return True, True, True
-    # Otherwise, enable them
-    return False, False, False
+    # No dataset selected -> disable all tabs, otherwise enable them
+    return [not selected_dataset] * len(brick.rules)
 
 
-# Only load data for each tab if that tab is active AND dataset is chosen
 @app.callback(
-    [
-        Output("table-tab1", "data"),
-        Output("empty-message-1", "children"),  # Add this output for the message
-        Output("empty-message-1", "is_open"),
-    ],
-    [Input("main-tabs", "active_tab"), Input("dataset-dropdown", "value")],
+    Output("check-poll", "disabled"),
+    Input("dataset-dropdown", "value"),
+    State("sample-mode", "value"),
 )
-def update_table_tab1(active_tab, selected_dataset):
-    if active_tab != "tab-0" or not selected_dataset:
-        return [], "Please select a dataset.", True
-    print(f"Updating table for tab 1 with dataset: {selected_dataset}")
-    df1 = brick.check_duplicates(table_name=selected_dataset)
-    if df1.size == 0:
-        return [], "All good! No duplicates found.", True
-    return df1.to_dict("records"), "", False
+def start_checks(selected_dataset, sample_mode):
+    # Kick off every check right away so switching tabs costs nothing.
+    if not selected_dataset:
+        return True
+    check_runner.start(selected_dataset, sample=SAMPLE_PERCENT if sample_mode else None)
+    return False
 
 
 @app.callback(
-    [
-        Output("table-tab2", "data"),
-        Output("empty-message-2", "children"),  # Add this output for the message
-        Output("empty-message-2", "is_open"),
-    ],
-    [Input("main-tabs", "active_tab"), Input("dataset-dropdown", "value")],
+    Output("check-poll", "disabled", allow_duplicate=True),
+    Input("cancel-checks", "n_clicks"),
+    State("dataset-dropdown", "value"),
+    prevent_initial_call=True,
 )
-def update_table_tab2(active_tab, selected_dataset):
-    if active_tab != "tab-1" or not selected_dataset:
-        return [], "Please select a dataset.", True
-    # Example data for tab 2
-    df2 = brick.check_negative_debits_credits(table_name=selected_dataset)
-    if df2.size == 0:
-        return [], "All good! No mismatches found.", True
-    return df2.to_dict("records"), "", False
+def cancel_checks(n_clicks, selected_dataset):
+    if selected_dataset:
+        check_runner.cancel(selected_dataset)
+    return dash.no_update
 
 
 @app.callback(
     [
-        Output("table-tab3", "data"),
-        Output("empty-message-3", "children"),  # Add this output for the message
-        Output("empty-message-3", "is_open"),
+        Output({"type": "check-table", "rule": ALL}, "data"),
+        Output({"type": "check-message", "rule": ALL}, "children"),
+        Output({"type": "check-message", "rule": ALL}, "is_open"),
+        Output("check-progress", "value"),
+        Output("check-progress", "label"),
+        Output("check-poll", "disabled", allow_duplicate=True),
     ],
-    [Input("main-tabs", "active_tab"), Input("dataset-dropdown", "value")],
+    [Input("check-poll", "n_intervals"), Input("dataset-dropdown", "value")],
+    prevent_initial_call=True,
 )
-def update_table_tab3(active_tab, selected_dataset):
-    if active_tab != "tab-2" or not selected_dataset:
-        return [], "Please select a dataset.", True
-    # Example data for tab 3
-    df3 = brick.check_region_country_mismatch(table_name=selected_dataset)
-    if df3.size == 0:
-        return [], "All good! No mismatches found.", True
-    return df3.to_dict("records"), "", False
+def update_check_tables(n_intervals, selected_dataset):
+    """
+    Fill the check tabs from the check runner's results and stop polling
+    once every check has finished.
+    """
+    # Pattern-matched outputs come in layout order, look each rule up by id.
+    rule_names = [output["id"]["rule"] for output in dash.callback_context.outputs_list[0]]
+    if not selected_dataset:
+        return [[]] * len(rule_names), ["Please select a dataset."] * len(rule_names), [True] * len(rule_names), 0, "", True
+
+    statuses = check_runner.status(selected_dataset)
+    data, messages, is_open = [], [], []
+    for rule_name in rule_names:
+        entry = statuses.get(rule_name)
+        status = entry["status"] if entry else "pending"
+        if status == "done" and entry.get("sample"):
+            found = f"{len(entry['records'])} row(s)" if entry["records"] else "nothing"
+            row = (entry["records"], f"Found {found} in a {entry['sample']:g}% sample, exact check running...", True)
+        elif status == "done" and entry["records"]:
+            row = (entry["records"], "", False)
+        elif status == "done":
+            row = ([], brick.rules.get(rule_name).empty_message, True)
+        elif status == "error":
+            row = ([], f"Check failed: {entry['error']}", True)
+        elif status == "cancelled":
+            row = ([], "Check cancelled.", True)
+        else:
+            row = ([], "Running check...", True)
+        data.append(row[0])
+        messages.append(row[1])
+        is_open.append(row[2])
+
+    finished, total = check_runner.progress(selected_dataset)
+    done = finished == total and not check_runner.refining(selected_dataset)
+    percent = 100 * finished / total if total else 100
+    return data, messages, is_open, percent, f"{finished}/{total} checks", done
+
 
 if __name__ == "__main__":
+    # Flask's development server; see wsgi.py / gunicorn.conf.py for production.
+    init_worker()
     app.run_server(debug=False, host='0.0.0.0', port=8080, use_reloader=False)
@@ -0,0 +1,62 @@
+// Decodes the grid payloads built by app.grid_rows (see grid_payload.py)
+// into the row objects AG Grid expects.
+(function () {
+    function decodeRows(payload) {
+        if (payload.rowData) {
+            return payload.rowData;
+        }
+        const rows = new Array(payload.length);
+        for (let i = 0; i < payload.length; i++) {
+            rows[i] = {};
+        }
+        payload.columns.forEach(function (column) {
+            const name = column.name;
+            if (column.codes) {
+                const dictionary = column.dictionary;
+                column.codes.forEach(function (code, i) {
+                    rows[i][name] = code < 0 ? null : dictionary[code];
+                });
+            } else {
+                column.values.forEach(function (value, i) {
+                    rows[i][name] = value;
+                });
+            }
+        });
+        return rows;
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        grid: {
+            // Infinite row model: a block of rows plus the total row count.
+            decodeBlock: function (payload) {
+                if (!payload) {
+                    return window.dash_clientside.no_update;
+                }
+                return {rowData: decodeRows(payload), rowCount: payload.rowCount};
+            },
+
+            // Client-side row model: [rowData, rowTransaction], one of them
+            // set, from every row or from a transaction of the changed ones.
+            applyRows: function (payload) {
+                const no_update = window.dash_clientside.no_update;
+                if (!payload) {
+                    return [no_update, no_update];
+                }
+                if (!payload.transaction) {
+                    return [decodeRows(payload), no_update];
+                }
+                const transaction = payload.transaction;
+                return [
+                    no_update,
+                    {
+                        add: decodeRows(transaction.add),
+                        update: decodeRows(transaction.update),
+                        remove: transaction.remove.map(function (id) {
+                            return {_row_id: id};
+                        }),
+                    },
+                ];
+            },
+        },
+    });
+})();
@@ -0,0 +1,437 @@
+# benchmark.py
+"""
+Benchmark of the app's hot paths against a local stand-in for the warehouse:
+a SQLite or DuckDB file holding a synthetic `transactions` table
+(transaction_id, debit, credit, region, country, updated_at).
+
+    python benchmark.py --engine duckdb --rows 1000000
+    python benchmark.py --engine sqlite --rows 10000 --update-baseline
+
+Every case (grid queries, counts, each data-quality check, bulk edits,
+DataFrame serialization and Dash callbacks through Flask's test client) is
+run --iterations times and reported with its latency percentiles,
+throughput and the peak memory Python allocated for one run. Results are
+compared with benchmark_baseline.json (per engine and size): any case whose
+median or peak memory got worse than the baseline by more than --tolerance
+is reported as a regression and the script exits with status 1. Baseline
+medians are scaled by how long a fixed CPU-only calibration workload took in
+this run compared with the baseline's, so the gate holds on a faster or
+slower machine; a case that looks slower is timed a second time and judged
+on that second median.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from plotly.io.json import to_json_plotly
+
+from grid_payload import encode_columns
+
+TABLE = "transactions"
+
+REGIONS = {
+    "EU": ["Germany", "France", "Spain"],
+    "APAC": ["India", "China", "Japan"],
+    "AMER": ["USA", "Canada", "Mexico"],
+    "MEA": ["South Africa", "Egypt", "UAE"],
+}
+
+# Rows generated and inserted at a time.
+CHUNK_ROWS = 1000000
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Name of the calibration workload in the results and the baseline.
+CALIBRATION = "calibration"
+
+# Cases faster than FAST_CASE_MS are mostly timer and scheduler noise: they
+# only regress when their median also grows by more than MIN_REGRESSION_MS.
+FAST_CASE_MS = 1.0
+MIN_REGRESSION_MS = 0.5
+# Peak memory differences below this are noise, whatever the tolerance.
+MIN_REGRESSION_MB = 5.0
+
+
+def synthetic_chunk(start, stop, seed=42):
+    """
+    Rows start..stop of the synthetic table. About 2% of the rows repeat the
+    previous transaction_id, 5% have a country outside their region and some
+    have a zero debit or credit, so every data-quality check finds something.
+    """
+    rng = np.random.default_rng(seed + start)
+    n = stop - start
+    ids = np.arange(start, stop)
+    regions = np.array(list(REGIONS))
+    countries = np.array(list(REGIONS.values()))
+    region_index = rng.integers(0, len(regions), n)
+    country = countries[region_index, rng.integers(0, 3, n)]
+    country[rng.random(n) < 0.05] = "Brazil"
+    return pd.DataFrame(
+        {
+            "transaction_id": np.where(rng.random(n) < 0.02, np.maximum(ids - 1, 0), ids),
+            "debit": rng.integers(0, 101, n).astype(float),
+            "credit": rng.integers(0, 101, n).astype(float),
+            "region": regions[region_index],
+            "country": country,
+            "updated_at": ids,
+        }
+    )
+
+
+def build_database(engine, rows, directory):
+    """
+    Create (or reuse) the synthetic database file and return its SQLAlchemy URL.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.abspath(os.path.join(directory, f"{TABLE}_{rows}.{'duckdb' if engine == 'duckdb' else 'db'}"))
+    if engine == "duckdb":
+        import duckdb
+
+        connect = duckdb.connect
+    else:
+        connect = sqlite3.connect
+
+    if os.path.exists(path):
+        conn = connect(path)
+        try:
+            if conn.execute(f"SELECT count(*) FROM {TABLE}").fetchone()[0] == rows:
+                return f"{engine}:///{path}"
+        except Exception:
+            pass
+        finally:
+            conn.close()
+        os.remove(path)
+
+    print(f"Generating {rows} rows in {path}")
+    start = time.perf_counter()
+    conn = connect(path)
+    conn.execute(
+        f"CREATE TABLE {TABLE} (transaction_id BIGINT, debit DOUBLE, credit DOUBLE, "
+        f"region VARCHAR, country VARCHAR, updated_at BIGINT)"
+    )
+    for chunk_start in range(0, rows, CHUNK_ROWS):
+        chunk = synthetic_chunk(chunk_start, min(chunk_start + CHUNK_ROWS, rows))
+        if engine == "duckdb":
+            conn.register("chunk", chunk)
+            conn.execute(f"INSERT INTO {TABLE} SELECT * FROM chunk")
+            conn.unregister("chunk")
+        else:
+            conn.executemany(f"INSERT INTO {TABLE} VALUES (?, ?, ?, ?, ?, ?)", chunk.itertuples(index=False))
+    conn.commit()
+    conn.close()
+    print(f"Generated in {time.perf_counter() - start:.1f} s")
+    return f"{engine}:///{path}"
+
+
+def dash_request(outputs, inputs, state):
+    """
+    Body of a /_dash-update-component request. outputs/inputs/state are
+    lists of (component id, property[, value]).
+    """
+    output_ids = [f"{component}.{prop}" for component, prop in outputs]
+    return {
+        "output": f"..{'...'.join(output_ids)}.." if len(outputs) > 1 else output_ids[0],
+        "outputs": [{"id": component, "property": prop} for component, prop in outputs]
+        if len(outputs) > 1
+        else {"id": outputs[0][0], "property": outputs[0][1]},
+        "inputs": [{"id": component, "property": prop, "value": value} for component, prop, value in inputs],
+        "changedPropIds": [f"{component}.{prop}" for component, prop, _ in inputs],
+        "state": [{"id": component, "property": prop, "value": value} for component, prop, value in state],
+    }
+
+
+def benchmark_cases(brick, app_module, rows):
+    """
+    name -> function running one iteration of the case.
+    """
+    filter_model = {
+        "country": {"filterType": "text", "type": "contains", "filter": "an"},
+        "debit": {"filterType": "number", "type": "greaterThan", "filter": 50},
+    }
+    rng = random.Random(0)
+    block = brick.get_data_query(TABLE, limit=1000)
+    # Cursors of the page at rows // 2, left by the page before it. The
+    # synthetic table has no primary key and duplicate transaction ids, but
+    # updated_at is unique.
+    keys = ["updated_at"]
+    deep_cursor = brick.get_page(TABLE, offset=rows // 2 - 100, limit=100, key_columns=keys)[1]
+    deep_sorted_cursor = brick.get_page(
+        TABLE, offset=rows // 2 - 100, limit=100, sort_column="debit", sort_order="desc", key_columns=keys
+    )[1]
+
+    def save_edits():
+        ids = rng.sample(range(rows), min(100, rows))
+        changes = [
+            {"data": {"transaction_id": i}, "colId": "credit", "value": float(rng.randint(1, 100))} for i in ids
+        ]
+        result = brick.save_row_data(TABLE, changes)
+        if result["error"]:
+            raise RuntimeError(result["error"])
+
+    cases = {
+        "page": lambda: brick.get_data_query(TABLE, limit=100),
+        "page_sorted": lambda: brick.get_data_query(TABLE, limit=100, sort_column="debit", sort_order="desc"),
+        "page_deep_offset": lambda: brick.get_data_query(TABLE, offset=rows // 2, limit=100),
+        "page_deep_keyset": lambda: brick.get_page(TABLE, limit=100, cursor=deep_cursor, key_columns=keys),
+        "page_deep_keyset_sorted": lambda: brick.get_page(
+            TABLE, limit=100, sort_column="debit", sort_order="desc", cursor=deep_sorted_cursor, key_columns=keys
+        ),
+        "page_filtered": lambda: brick.get_data_query(TABLE, limit=100, filter_model=filter_model),
+        "group_by": lambda: brick.get_data_query(
+            TABLE, limit=100, group_by="region", aggregate_columns=[{"column": "debit", "agg": "SUM"}]
+        ),
+        "group_by_two_columns": lambda: brick.get_data_query(
+            TABLE, limit=100, group_by=["region", "country"], aggregate_columns=[{"column": "credit", "agg": "AVG"}]
+        ),
+        "count_filtered": lambda: brick.count_rows(TABLE, filter_model=filter_model),
+    }
+    for rule_name in brick.rules.names():
+        cases[f"check:{rule_name}"] = lambda rule_name=rule_name: brick.run_rule(TABLE, rule_name)
+    cases["check_all"] = lambda: brick.check_all(TABLE)
+    cases["save_row_data_100"] = save_edits
+    cases["serialize_1000_records"] = lambda: to_json_plotly(block.to_dict("records"))
+    cases["serialize_1000_columnar"] = lambda: to_json_plotly(encode_columns(block))
+
+    client = app_module.server.test_client()
+    grid_state = [
+        ("dataset-dropdown", "value", TABLE),
+        ("group-by-dropdown", "value", None),
+        ("aggregate-column-dropdown", "value", None),
+        ("aggregation-function-dropdown", "value", None),
+        ("grid-row-count", "data", None),
+        ("sample-mode", "value", False),
+        ("session-id", "data", "benchmark"),
+        ("grid-cursors", "data", None),
+    ]
+    if app_module.GRID_ROW_MODEL == "infinite":
+        block_output = (app_module.grid_block_output.component_id, app_module.grid_block_output.component_property)
+
+        def grid_rows(start_row=0):
+            body = dash_request(
+                [
+                    block_output,
+                    ("grid-row-count", "data"),
+                    ("sample-query", "data"),
+                    ("grid-cursors", "data"),
+                    ("grid-status", "children"),
+                    ("grid-status", "is_open"),
+                    ("row-count-poll", "disabled"),
+                ],
+                [("data-table", "getRowsRequest", {"startRow": start_row, "endRow": start_row + 100})],
+                grid_state,
+            )
+            response = client.post("/_dash-update-component", json=body)
+            if response.status_code != 200:
+                raise RuntimeError(f"Callback failed with {response.status_code}")
+
+        cases["callback:grid_rows"] = grid_rows
+        cases["callback:grid_rows_deep"] = lambda: grid_rows(rows // 2)
+
+    def dropdowns():
+        body = dash_request(
+            [("group-by-dropdown", "options"), ("aggregate-column-dropdown", "options")],
+            [("dataset-dropdown", "value", TABLE)],
+            [],
+        )
+        response = client.post("/_dash-update-component", json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"Callback failed with {response.status_code}")
+
+    cases["callback:dropdowns"] = dropdowns
+    return cases
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_case(fn, iterations, warmup, quiet):
+    out = open(os.devnull, "w") if quiet else sys.stdout
+    with contextlib.redirect_stdout(out):
+        for _ in range(warmup):
+            fn()
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        # One more run to measure memory, as tracing slows everything down.
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    total_s = sum(timings) / 1000
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "ops_per_s": round(len(timings) / total_s, 1) if total_s else None,
+        "peak_mb": round(peak / 1024 / 1024, 2),
+    }
+
+
+def calibration():
+    """
+    Fixed CPU-only work (Python loops, a pandas group-by and JSON encoding)
+    timed with the cases. It touches no database, so its time only depends on
+    the machine and the load on it.
+    """
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"key": rng.integers(0, 100, 20000), "value": rng.random(20000)})
+    df.groupby("key")["value"].agg(["sum", "mean", "count"])
+    json.dumps(df.head(2000).to_dict("records"))
+    sorted(str(i * 7919 % 10007) for i in range(20000))
+
+
+def run_concurrent(fn, requests, concurrency, quiet):
+    out = open(os.devnull, "w") if quiet else sys.stdout
+    with contextlib.redirect_stdout(out), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        list(executor.map(lambda _: fn(), range(requests)))
+        elapsed = time.perf_counter() - start
+    return {"requests": requests, "concurrency": concurrency, "ops_per_s": round(requests / elapsed, 1)}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Regression messages for the cases slower (median) or hungrier (peak
+    memory) than the baseline by more than tolerance. Baseline medians are
+    first scaled by how much slower or faster the calibration ran this time.
+    """
+    regressions = []
+    speed = 1.0
+    if CALIBRATION in results and CALIBRATION in baseline:
+        speed = results[CALIBRATION]["p50_ms"] / baseline[CALIBRATION]["p50_ms"]
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or "p50_ms" not in result or name == CALIBRATION:
+            continue
+        expected_ms = round(base["p50_ms"] * speed, 3)
+        noise_ms = MIN_REGRESSION_MS if base["p50_ms"] < FAST_CASE_MS else 0
+        if result["p50_ms"] > expected_ms * (1 + tolerance) and result["p50_ms"] - expected_ms > noise_ms:
+            regressions.append(
+                f"{name}: median {result['p50_ms']} ms, baseline {base['p50_ms']} ms ({expected_ms} ms on this machine)"
+            )
+        if (
+            result["peak_mb"] > base["peak_mb"] * (1 + tolerance)
+            and result["peak_mb"] - base["peak_mb"] > MIN_REGRESSION_MB
+        ):
+            regressions.append(f"{name}: peak memory {result['peak_mb']} MB, baseline {base['peak_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=("sqlite", "duckdb"), default="duckdb")
+    parser.add_argument("--rows", type=int, default=10000, help="rows in the synthetic table (10k to 100M)")
+    parser.add_argument("--dir", default="benchmark_data", help="where the synthetic databases are kept")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=8, help="threads for the concurrent callback case")
+    parser.add_argument("--cache", action="store_true", help="keep the result cache on (off by default)")
+    parser.add_argument("--cases", help="comma-separated names of the cases to run (default all)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown before failing, 0.15 = 15%%")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the baseline")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's output")
+    args = parser.parse_args()
+
+    url = build_database(args.engine, args.rows, args.dir)
+    # The app reads its configuration at import.
+    os.environ["BRICK_CONNECTION_URL"] = url
+    os.environ["BRICK_ROLLUPS_PATH"] = ""
+    os.environ["BRICK_REPLICA_TABLES"] = ""
+    os.environ.pop("BRICK_SHARED_DIR", None)
+    if not args.cache:
+        os.environ["BRICK_CACHE_TTL"] = "0"
+
+    with contextlib.redirect_stdout(io.StringIO() if not args.verbose else sys.stdout):
+        import app as app_module
+
+        app_module.init_worker()
+        cases = benchmark_cases(app_module.brick, app_module, args.rows)
+    if args.cases:
+        wanted = args.cases.split(",")
+        cases = {name: fn for name, fn in cases.items() if name in wanted}
+
+    results = {}
+    print(f"{'case':<45} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'peak MB':>10}")
+    # The calibration is timed before and after the cases, so a change in the
+    # machine's load halfway through shows in its median too.
+    calibrations = [run_case(calibration, args.iterations, args.warmup, not args.verbose)]
+    for name, fn in cases.items():
+        result = results[name] = run_case(fn, args.iterations, args.warmup, not args.verbose)
+        print(
+            f"{name:<45} {result['p50_ms']:>10} {result['p95_ms']:>10} {result['p99_ms']:>10} "
+            f"{result['ops_per_s']:>10} {result['peak_mb']:>10}"
+        )
+    calibrations.append(run_case(calibration, args.iterations, args.warmup, not args.verbose))
+    result = results[CALIBRATION] = dict(
+        calibrations[-1], p50_ms=round(statistics.mean(run["p50_ms"] for run in calibrations), 3)
+    )
+    print(
+        f"{CALIBRATION:<45} {result['p50_ms']:>10} {result['p95_ms']:>10} {result['p99_ms']:>10} "
+        f"{result['ops_per_s']:>10} {result['peak_mb']:>10}"
+    )
+    if "callback:grid_rows" in cases:
+        result = results["concurrent:grid_rows"] = run_concurrent(
+            cases["callback:grid_rows"], args.iterations * args.concurrency, args.concurrency, not args.verbose
+        )
+        print(f"{'concurrent:grid_rows':<45} {'':>10} {'':>10} {'':>10} {result['ops_per_s']:>10}")
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak RSS: {peak_rss_mb:.0f} MB")
+
+    key = f"{args.engine}:{args.rows}"
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({key: results}, f, indent=2)
+    if args.update_baseline:
+        baselines[key] = results
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline for {key} written to {args.baseline}")
+        return 0
+    if key not in baselines:
+        print(f"No baseline for {key} in {args.baseline}")
+        return 0
+    if CALIBRATION in baselines[key]:
+        speed = results[CALIBRATION]["p50_ms"] / baselines[key][CALIBRATION]["p50_ms"]
+        print(f"Calibration ran {speed:.2f}x the baseline's time")
+    # A case that looks slower is timed once more, as a single noisy
+    # stretch on a shared machine is enough to move a median; the second
+    # run's results are the ones compared.
+    for name, fn in cases.items():
+        if compare({name: results[name], CALIBRATION: results[CALIBRATION]}, baselines[key], args.tolerance):
+            results[name] = run_case(fn, args.iterations, args.warmup, not args.verbose)
+            print(f"{name} timed again: p50 {results[name]['p50_ms']} ms, peak {results[name]['peak_mb']} MB")
+    regressions = compare(results, baselines[key], args.tolerance)
+    if regressions:
+        print(f"\nREGRESSIONS against the {key} baseline (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"No regressions against the {key} baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
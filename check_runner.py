@@ -0,0 +1,197 @@
+# check_runner.py
+import contextlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import source
+from query_cancel import QueryCancelled
+
+# A check is finished once its status is one of these.
+FINISHED = ("done", "error", "cancelled")
+
+# Check name under which the store keeps the latest run of a table:
+# {"id": ..., "cancelled": bool, "started_at": time.time()}.
+RUN = "_run"
+
+
+class CheckRunner:
+    """
+    Runs every registered data-quality rule (brick.rules, unless `checks`
+    names a subset) for a table concurrently on a bounded thread pool.
+
+    With combined=True all checks are evaluated by one brick.check_all scan;
+    if that query fails the checks are retried one by one.
+
+    Results are written to `store`, a dict-like object keyed by
+    (table_name, check_name). Each value is a dict with a status (pending,
+    running, done, error or cancelled), the result rows as records, the error
+    message if any and the elapsed time, so callbacks can read progress and
+    results without waiting on the warehouse.
+
+    The run itself is recorded in `store` as well (under (table_name, RUN)).
+    With a store shared by several processes only one of them starts a run
+    while another one's is going (see start), and a run is cancelled
+    whichever process started it, after which it no longer writes its
+    results. A run unfinished after `stale_after` seconds (its process died)
+    no longer counts as going.
+
+    A run started with a sample percentage first checks only that sample of
+    the rows; those results are stored with a "sample" key and replaced by
+    the exact results once the full checks, run right after, are done.
+    """
+
+    def __init__(self, brick, checks=None, max_workers=4, store=None, combined=False, stale_after=3600):
+        self.brick = brick
+        self.checks = list(checks or brick.rules.names())
+        self.combined = combined
+        self.store = store if store is not None else {}
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="checks")
+        self._futures = {}  # table_name -> {check_name: Future}
+        self._lock = threading.Lock()
+
+    def start(self, table_name, sample=None):
+        """
+        Run all checks for table_name, unless a run for it is still going,
+        in this process or another one sharing the store. Returns whether
+        this call started one.
+        """
+        with self._lock:
+            futures = self._futures.get(table_name, {})
+            if any(not future.done() for future in futures.values()):
+                return False
+            # Check and claim in one transaction, so two processes can't both start a run.
+            with self._store_transaction():
+                if self._running(table_name):
+                    return False
+                run_id = str(uuid.uuid4())
+                self.store[(table_name, RUN)] = {"id": run_id, "cancelled": False, "started_at": time.time()}
+                for check_name in self.checks:
+                    self.store[(table_name, check_name)] = {"status": "pending"}
+            if self.combined:
+                future = self._executor.submit(self._run_combined, table_name, run_id, sample)
+                self._futures[table_name] = {check_name: future for check_name in self.checks}
+            else:
+                self._futures[table_name] = {
+                    check_name: self._executor.submit(self._run_check, table_name, run_id, check_name, sample)
+                    for check_name in self.checks
+                }
+            return True
+
+    def _running(self, table_name):
+        # Whether the latest run of table_name, by any process, is still going.
+        run = self.store.get((table_name, RUN))
+        if run is None or run.get("cancelled") or time.time() - run.get("started_at", 0) > self.stale_after:
+            return False
+        return any(
+            entry and (entry["status"] not in FINISHED or entry.get("sample"))
+            for entry in self.status(table_name).values()
+        )
+
+    def _store_transaction(self):
+        # Makes a read-modify-write of the store atomic across processes,
+        # for a disk cache.
+        transact = getattr(self.store, "transact", None)
+        return transact() if transact is not None else contextlib.nullcontext()
+
+    def cancel(self, table_name):
+        """
+        Cancel the checks of table_name that haven't finished. Queued checks
+        never start; queries of checks already running in this process are
+        cancelled on the warehouse, those running in another process have
+        their results dropped.
+        """
+        with self._lock:
+            run = self.store.get((table_name, RUN))
+            if run is not None:
+                self.store[(table_name, RUN)] = dict(run, cancelled=True)
+            for future in self._futures.get(table_name, {}).values():
+                future.cancel()
+            for check_name in self.checks:
+                entry = self.store.get((table_name, check_name)) or {}
+                # Sampled results whose exact run is cut short are dropped too.
+                if entry.get("status") not in FINISHED or entry.get("sample"):
+                    self.store[(table_name, check_name)] = {"status": "cancelled"}
+        self.brick.queries.cancel(("checks", table_name))
+
+    def status(self, table_name):
+        """
+        Return {check_name: entry} for table_name, with entry None for checks
+        that were never started.
+        """
+        return {check_name: self.store.get((table_name, check_name)) for check_name in self.checks}
+
+    def progress(self, table_name):
+        """
+        Return (finished, total) for the latest run on table_name.
+        """
+        entries = self.status(table_name).values()
+        finished = sum(1 for entry in entries if entry and entry["status"] in FINISHED)
+        return finished, len(self.checks)
+
+    def refining(self, table_name):
+        """
+        Whether some results of table_name are from a sample, with the exact
+        checks still running.
+        """
+        return any(entry and entry.get("sample") for entry in self.status(table_name).values())
+
+    def _cancelled(self, table_name, run_id):
+        # Whether run_id was cancelled or superseded by a newer run, in any process.
+        run = self.store.get((table_name, RUN)) or {}
+        return run.get("id") != run_id or run.get("cancelled", False)
+
+    def _run_combined(self, table_name, run_id, sample=None, refining=False):
+        if self._cancelled(table_name, run_id):
+            return
+        if not refining:
+            for check_name in self.checks:
+                self.store[(table_name, check_name)] = {"status": "running"}
+        start = time.perf_counter()
+        try:
+            with self.brick.queries.request(("checks", table_name)), source("check:combined"):
+                results = self.brick.check_all(table_name, checks=self.checks, sample=sample)
+        except QueryCancelled:
+            return
+        except Exception as e:
+            print(f"Combined checks on {table_name} failed, running them one by one: {e}")
+            for check_name in self.checks:
+                self._run_check(table_name, run_id, check_name, sample, refining)
+            return
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        if self._cancelled(table_name, run_id):
+            return
+        for check_name, df in results.items():
+            entry = {"status": "done", "records": df.to_dict("records"), "elapsed_ms": elapsed_ms}
+            if sample:
+                entry["sample"] = sample
+            self.store[(table_name, check_name)] = entry
+        if sample:
+            # Now the exact checks; their results replace the sampled ones.
+            self._run_combined(table_name, run_id, refining=True)
+
+    def _run_check(self, table_name, run_id, check_name, sample=None, refining=False):
+        if self._cancelled(table_name, run_id):
+            return
+        if not refining:
+            self.store[(table_name, check_name)] = {"status": "running"}
+        start = time.perf_counter()
+        try:
+            with self.brick.queries.request(("checks", table_name)), source(f"check:{check_name}"):
+                df = self.brick.run_rule(table_name, check_name, sample=sample)
+            entry = {"status": "done", "records": df.to_dict("records")}
+            if sample:
+                entry["sample"] = sample
+        except QueryCancelled:
+            return
+        except Exception as e:
+            print(f"Check {check_name} on {table_name} failed: {e}")
+            entry = {"status": "error", "error": str(e)}
+        entry["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        if self._cancelled(table_name, run_id):
+            return
+        self.store[(table_name, check_name)] = entry
+        if sample and entry["status"] == "done":
+            self._run_check(table_name, run_id, check_name, refining=True)
@@ -1,12 +1,31 @@
 # brick_sqlalchemy.py
 from dotenv import load_dotenv
 import os
-from sqlalchemy import create_engine, select, Column, Date, Float, Integer, String, text, and_
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from sqlalchemy import create_engine, select, Column, Date, Float, Integer, String, text, inspect, bindparam
 import pandas as pd
 
 from sqlalchemy import create_engine, MetaData, Table, select, asc, desc, func
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 import pandas as pd
 
+from dq_rules import CAPPED_CHECK_DIALECTS, flagged_select, load_rules
+from grid_filters import filter_clause, filter_params, filter_shape
+from keyset import decode_cursor, encode_cursor, keyset_columns, keyset_select, seek_kind, seek_params
+from metrics import add_collector, current_source, inc, instrument_engine, observe, query_labels
+from query_cache import MISS, QueryCache, SingleFlight, TableWrites
+from query_cancel import QUERY_TIMEOUT, QueryCancelled, QueryTracker, track_engine
+from replica import Replica, parse_replica_tables
+from rollups import RollupManager, load_rollups
+from sampling import ERROR_BOUNDED, add_error_bounds, approximate_aggregate, error_helpers, median, sampled
+
 
 load_dotenv()
 
@@ -19,6 +38,54 @@ CATALOG = os.environ.get("DATABRICKS_CATALOG")
 SCHEMA = os.environ.get("DATABRICKS_SCHEMA")
 
 connection_string = f"databricks://token:{ACCESS_TOKEN}@{SERVER_HOSTNAME}?http_path={HTTP_PATH}&catalog={CATALOG}&schema={SCHEMA}"
+# Any other SQLAlchemy URL, e.g. duckdb:///replica/replica.duckdb to run
+# offline against a local replica.
+connection_string = os.environ.get("BRICK_CONNECTION_URL", connection_string)
+
+# Result cache: seconds an entry stays valid (0 disables it) and memory budget.
+CACHE_TTL = int(os.environ.get("BRICK_CACHE_TTL", 300))
+CACHE_MAX_MB = int(os.environ.get("BRICK_CACHE_MAX_MB", 256))
+
+# Fetch results as Arrow tables when the driver supports it (Databricks).
+ARROW_FETCH = os.environ.get("BRICK_ARROW_FETCH", "1") == "1"
+
+# Rows per MERGE statement when saving grid edits on Databricks.
+MERGE_BATCH_ROWS = 500
+
+# Optional file where reflected table schemas are snapshotted across restarts.
+SCHEMA_CACHE_PATH = os.environ.get("BRICK_SCHEMA_CACHE")
+
+# Connection pool. Opening a Databricks (Thrift) session is slow, so keep
+# enough of them around for concurrent dashboard users and check them before
+# use instead of opening a fresh one per query.
+POOL_SIZE = int(os.environ.get("BRICK_POOL_SIZE", 10))
+POOL_MAX_OVERFLOW = int(os.environ.get("BRICK_POOL_MAX_OVERFLOW", 20))
+POOL_TIMEOUT = float(os.environ.get("BRICK_POOL_TIMEOUT", 30))
+# Seconds after which a session is replaced (-1 never), below the warehouse's
+# idle session timeout.
+POOL_RECYCLE = int(os.environ.get("BRICK_POOL_RECYCLE", 1800))
+POOL_PRE_PING = os.environ.get("BRICK_POOL_PRE_PING", "1") == "1"
+# Reuse the most recently returned session first, so idle ones can expire.
+POOL_LIFO = os.environ.get("BRICK_POOL_LIFO", "0") == "1"
+# Sessions opened at startup so the first users don't pay for them.
+POOL_WARM = int(os.environ.get("BRICK_POOL_WARM", 0))
+
+# Log every statement SQLAlchemy runs.
+SQL_ECHO = os.environ.get("BRICK_SQL_ECHO", "0") == "1"
+
+# Directory shared by the app's processes on this host (e.g. gunicorn
+# workers). When set, identical queries running at the same time in several
+# processes are only sent to the warehouse once, and query results are also
+# cached on disk there (with diskcache installed) for every process to reuse.
+SHARED_DIR = os.environ.get("BRICK_SHARED_DIR")
+SHARED_CACHE_MB = int(os.environ.get("BRICK_SHARED_CACHE_MB", 1024))
+# Seconds a process waits for the same query running in another process
+# before running it itself, without a BRICK_QUERY_TIMEOUT (which bounds the
+# wait otherwise).
+FLIGHT_WAIT = float(os.environ.get("BRICK_FLIGHT_WAIT", 300))
+
+# Number of built and compiled query shapes (see BrickSQLAlchemy._shaped).
+STATEMENT_CACHE_SIZE = int(os.environ.get("BRICK_STATEMENT_CACHE_SIZE", 500))
 
 
 
@@ -35,18 +102,355 @@ class BrickSQLAlchemy:
        data_df     = brick.get_data_query("catalog", "public", "mytable", ...)
     """
 
-    def __init__(self, connection_string):
+    def __init__(
+        self,
+        connection_string,
+        cache_ttl=CACHE_TTL,
+        cache_max_mb=CACHE_MAX_MB,
+        schema_cache_path=SCHEMA_CACHE_PATH,
+        rules=None,
+        arrow_fetch=ARROW_FETCH,
+        warm_sessions=POOL_WARM,
+        rollups=None,
+        replica_tables=None,
+        query_timeout=QUERY_TIMEOUT,
+        shared_dir=SHARED_DIR,
+        background=True,
+    ):
         # Create your engine with the provided connection string
         # E.g. "postgresql://user:pw@localhost:5432/mydb"
-        self.engine = create_engine(connection_string, echo=True)
+        self.engine = create_engine(connection_string, echo=SQL_ECHO, **self._pool_options(connection_string))
+        self._pool_timings = {
+            "checkouts": 0,
+            "checkout_wait_ms_total": 0.0,
+            "checkout_wait_ms_max": 0.0,
+            "sessions_opened": 0,
+            "session_open_ms_total": 0.0,
+            "session_open_ms_max": 0.0,
+        }
+        self._pool_timings_lock = threading.Lock()
+        event.listen(self.engine, "do_connect", self._on_session_opening)
+        event.listen(self.engine, "connect", self._on_session_opened)
+        # In-flight queries per request, so superseded ones can be cancelled.
+        self.queries = QueryTracker()
+        track_engine(self.engine, timeout=query_timeout)
+        # Statement counts and timings for /metrics, and the slow query log.
+        instrument_engine(self.engine)
+        add_collector(self._metric_gauges)
+        namespace = self.engine.url.render_as_string(hide_password=True)
+        self.cache = QueryCache(
+            ttl=cache_ttl,
+            max_bytes=cache_max_mb * 1024 * 1024,
+            shared_dir=os.path.join(shared_dir, "cache") if shared_dir else None,
+            shared_max_bytes=SHARED_CACHE_MB * 1024 * 1024,
+            namespace=namespace,
+        )
+        # Writes made through save_row_data, seen by every process, so rollups
+        # and the replica (kept by one of them) can tell their table changed.
+        self.writes = TableWrites(
+            shared_dir=os.path.join(shared_dir, "writes") if shared_dir else None,
+            namespace=namespace,
+        )
+        # Identical queries in flight at the same time run once (see _execute).
+        self.flights = SingleFlight(
+            shared_dir=os.path.join(shared_dir, "flights") if shared_dir else None,
+            namespace=namespace,
+            retry_on=(QueryCancelled,),
+            wait_timeout=query_timeout or FLIGHT_WAIT,
+        )
+        # Data-quality rules (see dq_rules.json), run by run_rule / check_all.
+        self.rules = rules if rules is not None else load_rules()
+        self.arrow_fetch = arrow_fetch
+
+        # Tables are reflected one at a time, the first time they are used.
+        # At startup we only list their names (or load a previous snapshot).
         self.metadata = MetaData()
-        self.metadata.reflect(bind=self.engine)
+        self.table_names = []
+        self.schema_cache_path = schema_cache_path
+        self._schema_lock = threading.Lock()
+
+        # Query shape -> (statement, compiled SQL), most recently used last.
+        self._shapes = OrderedDict()
+        self._shapes_lock = threading.Lock()
+        self._shape_stats = {"hits": 0, "misses": 0, "compile_ms_total": 0.0, "compile_ms_max": 0.0}
+        if self._load_schema_snapshot():
+            # Tables created or dropped since the snapshot show up once listed again.
+            threading.Thread(target=self._refresh_table_names_quietly, name="table-names", daemon=True).start()
+        else:
+            self.refresh_table_names()
+        if warm_sessions:
+            self.warm_pool(warm_sessions)
+
+        # Summary tables that answer aggregate queries (see rollups.py), and
+        # a local DuckDB/Parquet copy of hot tables (see replica.py). Without
+        # `background` this process only reads those another one maintains.
+        rollups = rollups if rollups is not None else load_rollups()
+        self.rollups = RollupManager(self, rollups, build=background) if rollups else None
+        replica_tables = replica_tables if replica_tables is not None else parse_replica_tables()
+        self.replica = Replica(self, replica_tables, sync=background) if replica_tables else None
+
+    @staticmethod
+    def _pool_options(connection_string):
+        """
+        create_engine pool arguments. Only QueuePool (the default for
+        Databricks and file databases) takes them; e.g. in-memory SQLite keeps
+        its own single-connection pool.
+        """
+        url = make_url(connection_string)
+        if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+            return {}
+        return {
+            "pool_size": POOL_SIZE,
+            "max_overflow": POOL_MAX_OVERFLOW,
+            "pool_timeout": POOL_TIMEOUT,
+            "pool_recycle": POOL_RECYCLE,
+            "pool_pre_ping": POOL_PRE_PING,
+            "pool_use_lifo": POOL_LIFO,
+        }
+
+    def _record_timing(self, name, elapsed_ms):
+        with self._pool_timings_lock:
+            timings = self._pool_timings
+            timings[f"{name}_ms_total"] += elapsed_ms
+            timings[f"{name}_ms_max"] = max(timings[f"{name}_ms_max"], elapsed_ms)
+
+    def _on_session_opening(self, dialect, conn_rec, cargs, cparams):
+        conn_rec.info["opening_at"] = time.perf_counter()
+
+    def _on_session_opened(self, dbapi_connection, conn_rec):
+        started = conn_rec.info.pop("opening_at", None)
+        if started is None:
+            return
+        with self._pool_timings_lock:
+            self._pool_timings["sessions_opened"] += 1
+        self._record_timing("session_open", (time.perf_counter() - started) * 1000)
+
+    @contextmanager
+    def _connect(self):
+        """
+        engine.connect() that records how long the checkout took, i.e. the
+        wait for a free pooled session (plus opening one, if needed).
+        """
+        start = time.perf_counter()
+        conn = self.engine.connect()
+        elapsed = time.perf_counter() - start
+        with self._pool_timings_lock:
+            self._pool_timings["checkouts"] += 1
+        self._record_timing("checkout_wait", elapsed * 1000)
+        observe("brick_query_checkout_seconds", elapsed, {"source": current_source()})
+        with conn:
+            yield conn
+
+    def warm_pool(self, sessions):
+        """
+        Open up to `sessions` pooled sessions concurrently and hand them back
+        to the pool, so the first queries find them ready.
+        """
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool):
+            sessions = min(sessions, pool.size())
+        start = time.perf_counter()
+        opened = threading.Barrier(sessions) if sessions > 1 else None
+
+        def open_session():
+            try:
+                with self._connect() as conn:
+                    conn.exec_driver_sql("SELECT 1")
+                    # Hold on until every session is open, or the pool would
+                    # just hand the same one out again.
+                    if opened is not None:
+                        opened.wait(timeout=POOL_TIMEOUT)
+            except threading.BrokenBarrierError:
+                pass
+            except Exception:
+                if opened is not None:
+                    opened.abort()
+                raise
+
+        with ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="warm-pool") as executor:
+            futures = [executor.submit(open_session) for _ in range(sessions)]
+        failed = [future.exception() for future in futures if future.exception() is not None]
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"Warmed {sessions - len(failed)} of {sessions} pooled session(s) in {elapsed_ms} ms")
+        for e in failed[:1]:
+            print(f"Warming a session failed: {e}")
+        return sessions - len(failed)
+
+    def pool_stats(self):
+        """
+        Checkout-wait and session-open timings plus the pool's current state.
+        """
+        with self._pool_timings_lock:
+            stats = dict(self._pool_timings)
+        pool = self.engine.pool
+        if isinstance(pool, QueuePool):
+            stats.update(size=pool.size(), checked_out=pool.checkedout(), idle=pool.checkedin(), overflow=pool.overflow())
+        return stats
+
+    def _metric_gauges(self):
+        labels = {"database": self.engine.url.get_backend_name()}
+        pool = self.pool_stats()
+        cache = self.cache.info()
+        gauges = [(f"brick_pool_{name}", labels, pool[name]) for name in ("checked_out", "idle", "overflow") if name in pool]
+        gauges += [(f"brick_cache_{name}", labels, value) for name, value in cache.items()]
+        gauges += [(f"brick_statement_cache_{name}", labels, value) for name, value in self.statement_cache_stats().items()]
+        return gauges
+
+    def _cache_key(self, stmt):
+        """
+        Cache key for a statement: the SQL compiled for this engine's dialect
+        plus its bound parameter values.
+        """
+        start = time.perf_counter()
+        compiled = stmt.compile(dialect=self.engine.dialect)
+        sql = str(compiled)
+        observe("brick_query_compile_seconds", time.perf_counter() - start, query_labels(sql))
+        return sql, repr(sorted(compiled.params.items()))
+
+    def _shaped(self, shape, build):
+        """
+        Return (statement, compiled SQL) for a query shape: a hashable key
+        for everything that changes the SQL text (table, columns, grouping,
+        aggregates, filter operators, sort) but not the values bound into it.
+        build() creates the statement on the first use of a shape; later calls
+        reuse it and its compiled SQL, so only the bound values change.
+        """
+        with self._shapes_lock:
+            entry = self._shapes.get(shape)
+            if entry is not None:
+                self._shapes.move_to_end(shape)
+                self._shape_stats["hits"] += 1
+                return entry
+        stmt = build()
+        start = time.perf_counter()
+        sql = str(stmt.compile(dialect=self.engine.dialect))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        observe("brick_query_compile_seconds", elapsed_ms / 1000, query_labels(sql))
+        with self._shapes_lock:
+            stats = self._shape_stats
+            stats["misses"] += 1
+            stats["compile_ms_total"] += elapsed_ms
+            stats["compile_ms_max"] = max(stats["compile_ms_max"], elapsed_ms)
+            self._shapes[shape] = (stmt, sql)
+            while len(self._shapes) > STATEMENT_CACHE_SIZE:
+                self._shapes.popitem(last=False)
+        return stmt, sql
+
+    def statement_cache_stats(self):
+        """
+        Hits/misses of the query shape cache and the time spent compiling.
+        """
+        with self._shapes_lock:
+            return dict(self._shape_stats, entries=len(self._shapes))
+
+    def _execute(self, stmt, table_name, fetch=None, params=None, sql=None):
+        """
+        Execute stmt with the bound values in params through the result cache,
+        coalescing identical queries that are in flight at the same time.
+        `fetch` turns the result into the value to return and cache; it
+        defaults to a DataFrame of all rows. table_name may also be a list of
+        every table the statement reads. Pass the compiled sql of a shaped
+        statement to avoid compiling it again for the cache key.
+        """
+        params = params or {}
+        if sql is None:
+            key = self._cache_key(stmt)
+        else:
+            key = sql, repr(sorted(params.items()))
+        value = self.cache.get(key)
+        if value is not MISS:
+            return value
+
+        def run():
+            # The previous flight of this key may have ended since cache.get.
+            value = self.cache.peek(key)
+            if value is not MISS:
+                return value
+            with self._connect() as conn:
+                result = conn.execute(stmt, params)
+                if fetch is None:
+                    return self._fetch_df(result)
+                return fetch(result)
+
+        def store(value):
+            tables = [table_name] if isinstance(table_name, str) else table_name
+            self.cache.put(key, value, tables=tables)
+
+        # Concurrent callers with the same key wait for the first one's result.
+        return self.flights.do(key, run, store)
+
+    def _arrow_cursor(self, result):
+        """
+        The DBAPI cursor behind result if it can return Arrow tables
+        (fetchall_arrow / fetchmany_arrow, as the Databricks connector does),
+        else None.
+        """
+        cursor = getattr(result, "cursor", None)
+        if self.arrow_fetch and hasattr(cursor, "fetchmany_arrow"):
+            return cursor
+        return None
+
+    @staticmethod
+    def _arrow_to_df(arrow_table, columns):
+        # split_blocks + self_destruct lets pyarrow hand column buffers to
+        # pandas without building a second full copy of the result.
+        df = arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+        df.columns = columns
+        return df
+
+    def _fetch_df(self, result):
+        """
+        All rows of result as a DataFrame: a columnar Arrow fetch when the
+        driver supports it, fetchall() into row tuples otherwise (e.g. SQLite).
+        """
+        columns = list(result.keys())
+        cursor = self._arrow_cursor(result)
+        start = time.perf_counter()
+        rows = cursor.fetchall_arrow() if cursor is not None else result.fetchall()
+        fetched = time.perf_counter()
+        df = self._arrow_to_df(rows, columns) if cursor is not None else pd.DataFrame(rows, columns=columns)
+        self._record_fetch(result, df, fetched - start, time.perf_counter() - fetched)
+        return df
+
+    def _record_fetch(self, result, df, fetch_seconds, convert_seconds):
+        labels = query_labels(result.context.statement)
+        observe("brick_query_fetch_seconds", fetch_seconds, labels)
+        observe("brick_query_convert_seconds", convert_seconds, labels)
+        inc("brick_query_rows_total", len(df), labels)
+        inc("brick_query_bytes_total", int(df.memory_usage(index=False).sum()), labels)
+
+    def _fetch_batches(self, result, batch_size):
+        """
+        Yield the rows of result as DataFrames of at most batch_size rows,
+        through fetchmany_arrow when available.
+        """
+        columns = list(result.keys())
+        cursor = self._arrow_cursor(result)
+        while True:
+            start = time.perf_counter()
+            if cursor is not None:
+                rows = cursor.fetchmany_arrow(batch_size)
+                if rows.num_rows == 0:
+                    break
+            else:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+            fetched = time.perf_counter()
+            df = self._arrow_to_df(rows, columns) if cursor is not None else pd.DataFrame(rows, columns=columns)
+            self._record_fetch(result, df, fetched - start, time.perf_counter() - fetched)
+            yield df
+
+    def cache_stats(self):
+        """
+        Hit/miss/eviction counters and size of the result cache.
+        """
+        return self.cache.info()
 
-    
 
     def test_connection(self):
         try:
-            with self.engine.connect() as conn:
+            with self._connect() as conn:
                 result = conn.execute("SELECT 1")
                 print("Connection OK, SELECT 1 =>", result.scalar())
         except Exception as e:
@@ -56,18 +460,107 @@ class BrickSQLAlchemy:
         """
         Return a list of table names in the database.
         """
-        return self.metadata.tables.keys()
+        return self.table_names
+
+    def refresh_table_names(self):
+        """
+        Re-list the table and view names through the inspector, without
+        reflecting them. (The local replica's tables are views.)
+        """
+        inspector = inspect(self.engine)
+        try:
+            view_names = inspector.get_view_names()
+        except NotImplementedError:
+            view_names = []
+        table_names = sorted({*inspector.get_table_names(), *view_names})
+        with self._schema_lock:
+            self.table_names = table_names
+            self._save_schema_snapshot()
+        return table_names
+
+    def _refresh_table_names_quietly(self):
+        try:
+            self.refresh_table_names()
+        except Exception as e:
+            print(f"Could not refresh the table names: {e}")
 
     def _internal_schema(self, table_name):
         """
-        Reflects the given table and returns an object with a .fields attribute,
-        each 'field' having a 'name' property.
-        For convenience, returns a simple namedtuple-like object.
+        Return the SQLAlchemy Table for table_name, reflecting it from the
+        database the first time it is asked for.
         """
-        # Reflect the table from the database
         table = self.metadata.tables.get(table_name)
+        if table is not None:
+            return table
+        with self._schema_lock:
+            table = self.metadata.tables.get(table_name)
+            if table is None:
+                print(f"Reflecting table {table_name}")
+                table = Table(table_name, self.metadata, autoload_with=self.engine)
+                self._save_schema_snapshot()
+        return table
+
+    def refresh_table(self, table_name):
+        """
+        Re-reflect a single table, e.g. after its DDL changed. Cached results
+        for the table are dropped as well.
+        """
+        with self._schema_lock:
+            table = self.metadata.tables.get(table_name)
+            if table is not None:
+                self.metadata.remove(table)
+            table = Table(table_name, self.metadata, autoload_with=self.engine)
+            if table_name not in self.table_names:
+                self.table_names = sorted([*self.table_names, table_name])
+            self._save_schema_snapshot()
+        self.cache.invalidate_table(table_name)
+        # Cached statements still point at the old Table.
+        with self._shapes_lock:
+            for shape in [shape for shape in self._shapes if shape[1] == table_name]:
+                del self._shapes[shape]
         return table
 
+    def _load_schema_snapshot(self):
+        """
+        Load table names and already reflected tables from schema_cache_path.
+        Returns False if there is no usable snapshot for this database. The
+        table names are listed again in the background afterwards.
+        """
+        if not self.schema_cache_path or not os.path.exists(self.schema_cache_path):
+            return False
+        try:
+            with open(self.schema_cache_path, "rb") as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring schema snapshot {self.schema_cache_path}: {e}")
+            return False
+        if snapshot.get("url") != self._snapshot_url():
+            return False
+        self.metadata = snapshot["metadata"]
+        self.table_names = snapshot["table_names"]
+        return True
+
+    def _save_schema_snapshot(self):
+        if not self.schema_cache_path:
+            return
+        snapshot = {
+            "url": self._snapshot_url(),
+            "table_names": self.table_names,
+            "metadata": self.metadata,
+        }
+        # Write then rename, so a concurrent reader never sees half a file.
+        tmp_path = f"{self.schema_cache_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f)
+            os.replace(tmp_path, self.schema_cache_path)
+        except Exception as e:
+            print(f"Could not write schema snapshot {self.schema_cache_path}: {e}")
+
+    def _snapshot_url(self):
+        # A snapshot only applies to the database (catalog/schema) it came from.
+        return self.engine.url.render_as_string(hide_password=True)
+
     def get_schema_for_table(self, table_name):
         """
         Reflects the given table and returns an object with a .fields attribute,
@@ -87,33 +580,68 @@ class BrickSQLAlchemy:
         MockSchema = type("MockSchema", (), {"fields": fields})
         return MockSchema()
 
-    def get_data_query(
+    @staticmethod
+    def _query_shape(
+        table_name,
+        sort_column=None,
+        sort_order=None,
+        group_by=None,
+        aggregate_columns=None,
+        filter_model=None,
+        sample=None,
+    ):
+        """
+        Hashable description of the SELECT _build_select makes for these
+        arguments, leaving out the filter values.
+        """
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        return (
+            table_name,
+            sort_column,
+            sort_column and (sort_order or "asc").lower(),
+            tuple(group_by or ()),
+            tuple((agg["column"], agg["agg"].upper()) for agg in aggregate_columns or ()),
+            filter_shape(filter_model),
+            sample,
+        )
+
+    @staticmethod
+    def _filter_params(filter_model):
+        """
+        Bound values for the filters of _build_select, named filter_0,
+        filter_1, ... in column name order (see grid_filters.py).
+        """
+        return filter_params(filter_model)
+
+    def _build_select(
         self,
         table_name,
-        offset=0,
-        limit=10,
         sort_column=None,
         sort_order=None,
         group_by=None,
         aggregate_columns=None,
         filter_model=None,
+        sample=None,
     ):
         """
-        Run a SQL query against the given table, with optional:
-          - offset/limit
-          - sorting (sort_column and sort_order)
-          - GROUP BY (group_by)
-          - aggregates (aggregate_columns)
-        
-        Returns a pandas DataFrame.
-        
-        For example, aggregate_columns could be a list of dicts like:
-           [{"column": "colB", "agg": "SUM"}, {"column": "colA", "agg": "COUNT"}]
-        and group_by could be a list of columns, or a single column name.
+        Build (but don't execute) the SELECT behind get_data_query, without
+        offset/limit. Shared by get_data_query and count_rows so the row count
+        always matches the rows the grid pages through.
+
+        Filter values are bind parameters (see _filter_params), so the
+        statement only depends on _query_shape and can be reused.
+
+        With sample (a percentage) only a sample of the rows is read, SUM and
+        COUNT are scaled up to the whole table, approximate aggregates are
+        used where the warehouse has them, and helper columns for the error
+        bounds are added (see sampling.add_error_bounds).
         """
         # Reflect the table
         table = self._internal_schema(table_name)
-        print(f"Bricks Input {sort_column}, {sort_order}, {group_by}, {aggregate_columns}, {filter_model}" )
+        dialect_name = self.engine.dialect.name
+        if sample:
+            table = sampled(table, sample, dialect_name)
 
         # If you need group_by or aggregates, build them:
         if group_by:
@@ -133,17 +661,32 @@ class BrickSQLAlchemy:
                 col_name = agg["column"]
                 agg_func = agg["agg"].upper()
                 col_obj = table.c[col_name]
-                if agg_func == "SUM":
-                    agg_exprs.append(func.sum(col_obj).label(f"{agg_func}_{col_name}"))
+                label = f"{agg_func}_{col_name}"
+                approx = approximate_aggregate(agg_func, col_obj, dialect_name) if sample else None
+                if approx is not None:
+                    expr = approx
+                elif agg_func == "SUM":
+                    expr = func.sum(col_obj)
                 elif agg_func == "AVG":
-                    agg_exprs.append(func.avg(col_obj).label(f"{agg_func}_{col_name}"))
+                    expr = func.avg(col_obj)
                 elif agg_func == "COUNT":
-                    agg_exprs.append(func.count(col_obj).label(f"{agg_func}_{col_name}"))
+                    expr = func.count(col_obj)
                 elif agg_func == "MAX":
-                    agg_exprs.append(func.max(col_obj).label(f"{agg_func}_{col_name}"))
+                    expr = func.max(col_obj)
                 elif agg_func == "MIN":
-                    agg_exprs.append(func.min(col_obj).label(f"{agg_func}_{col_name}"))
-                # ... add more as needed
+                    expr = func.min(col_obj)
+                elif agg_func == "COUNT_DISTINCT":
+                    expr = func.count(col_obj.distinct())
+                elif agg_func == "MEDIAN":
+                    expr = median(col_obj, dialect_name)
+                else:
+                    # ... add more as needed
+                    continue
+                if sample and agg_func in ("SUM", "COUNT"):
+                    expr = expr * (100.0 / sample)
+                agg_exprs.append(expr.label(label))
+                if sample and agg_func in ERROR_BOUNDED:
+                    agg_exprs.extend(error_helpers(label, col_obj))
         else:
             # If no aggregate columns are specified, then just select all
             agg_exprs = [table.c[c.name] for c in table.columns]
@@ -154,154 +697,583 @@ class BrickSQLAlchemy:
         else:
             stmt = select(*agg_exprs)
 
-        # Apply filters (if any)
+        stmt = self._apply_filters(stmt, table, table_name, filter_model)
+        return self._apply_sort(stmt, table, sort_column, sort_order)
+
+    def _apply_filters(self, stmt, table, table_name, filter_model):
+        """
+        Add the AgGrid filter model to stmt as a WHERE on table's columns,
+        with the values bound as filter_0, filter_1, ... (see _filter_params).
+        Raises ValueError for a filter that can't be translated.
+        """
         if filter_model:
             print(f"Bricks filter {filter_model}")
-            filter_conditions = []
-            for column_name, condition in filter_model.items():
-                if column_name not in table.c:
-                    raise ValueError(f"Column '{column_name}' does not exist in table '{table_name}'")
-
-                column = table.c[column_name]
-                filter_value = condition.get("filter")
-                filter_type = condition.get("filterType")
-                filter_mode = condition.get("type", "contains")  # Default to "contains"
-
-                if filter_type == "text":
-                    if filter_mode == "contains":
-                        filter_conditions.append(column.ilike(f"%{filter_value}%"))
-                    elif filter_mode == "equals":
-                        filter_conditions.append(column == filter_value)
-                    elif filter_mode == "startsWith":
-                        filter_conditions.append(column.ilike(f"{filter_value}%"))
-                    elif filter_mode == "endsWith":
-                        filter_conditions.append(column.ilike(f"%{filter_value}"))
-                elif filter_type == "number":
-                    if filter_mode == "equals":
-                        filter_conditions.append(column == filter_value)
-                    elif filter_mode == "greaterThan":
-                        filter_conditions.append(column > filter_value)
-                    elif filter_mode == "lessThan":
-                        filter_conditions.append(column < filter_value)
-
-            # Add the filters to the statement
-            if filter_conditions:
-                stmt = stmt.where(and_(*filter_conditions))
-
-        # Sorting
-        if sort_column and hasattr(table.c, sort_column):
-            sort_col = table.c[sort_column]
-            if sort_order and sort_order.lower() == "desc":
-                stmt = stmt.order_by(desc(sort_col))
+            condition = filter_clause(table, filter_model, table_name)
+            if condition is not None:
+                stmt = stmt.where(condition)
+        return stmt
+
+    @staticmethod
+    def _apply_sort(stmt, table, sort_column, sort_order):
+        # Sorting. Aggregate labels (e.g. "SUM_debit") are valid sort keys too.
+        if sort_column:
+            if sort_column in table.c:
+                sort_col = table.c[sort_column]
+            elif sort_column in stmt.selected_columns:
+                sort_col = stmt.selected_columns[sort_column]
             else:
-                stmt = stmt.order_by(asc(sort_col))
+                sort_col = None
+            if sort_col is not None:
+                if sort_order and sort_order.lower() == "desc":
+                    stmt = stmt.order_by(desc(sort_col))
+                else:
+                    stmt = stmt.order_by(asc(sort_col))
 
-        # Offset/Limit
-        stmt = stmt.offset(offset).limit(limit)
+        return stmt
 
-        print(f"Bricks stmt {str(stmt)}")
-        # Execute
-        with self.engine.connect() as conn:
-            result = conn.execute(stmt)
-            df = pd.DataFrame(result.fetchall(), columns=result.keys())
+    def get_data_query(
+        self,
+        table_name,
+        offset=0,
+        limit=10,
+        sort_column=None,
+        sort_order=None,
+        group_by=None,
+        aggregate_columns=None,
+        filter_model=None,
+        sample=None,
+    ):
+        """
+        Run a SQL query against the given table, with optional:
+          - offset/limit
+          - sorting (sort_column and sort_order)
+          - GROUP BY (group_by)
+          - aggregates (aggregate_columns)
+          - AgGrid filter model (filter_model)
+          - sampling (sample, a percentage of rows; aggregates then come with
+            a <label>_error column holding their 95% error bound, if any)
+        
+        Returns a pandas DataFrame.
+        
+        For example, aggregate_columns could be a list of dicts like:
+           [{"column": "colB", "agg": "SUM"}, {"column": "colA", "agg": "COUNT"}]
+        and group_by could be a list of columns, or a single column name.
+        """
+        print(f"Bricks Input {sort_column}, {sort_order}, {group_by}, {aggregate_columns}, {filter_model}" )
+        rollup = self._route_rollup(table_name, group_by, aggregate_columns, filter_model)
+        if rollup is not None:
+            stmt = self._rollup_select(rollup, group_by, aggregate_columns, filter_model, sort_column, sort_order)
+            return self._execute_rollup(
+                rollup, stmt.offset(offset).limit(limit), self._filter_params(filter_model), self._fetch_df
+            )
+        local = self._local(table_name)
+        if local is not None:
+            return local.get_data_query(
+                table_name, offset, limit, sort_column, sort_order, group_by, aggregate_columns, filter_model, sample
+            )
 
+        query = dict(
+            sort_column=sort_column,
+            sort_order=sort_order,
+            group_by=group_by,
+            aggregate_columns=aggregate_columns,
+            filter_model=filter_model,
+            sample=sample,
+        )
+        # Offset/Limit are bound too, but rendered inline at execution time
+        # since not every warehouse takes parameters there.
+        stmt, sql = self._shaped(
+            ("page", *self._query_shape(table_name, **query)),
+            lambda: self._build_select(table_name, **query)
+            .offset(bindparam("page_offset", type_=Integer, literal_execute=True))
+            .limit(bindparam("page_limit", type_=Integer, literal_execute=True)),
+        )
+        params = dict(self._filter_params(filter_model), page_offset=offset, page_limit=limit)
+
+        # Execute
+        df = self._execute(stmt, table_name, params=params, sql=sql)
+        if sample and aggregate_columns:
+            labels = [
+                (f"{agg['agg'].upper()}_{agg['column']}", agg["agg"].upper())
+                for agg in aggregate_columns
+                if agg["agg"].upper() in ERROR_BOUNDED
+            ]
+            df = add_error_bounds(df, labels, sample)
         return df
 
+    def get_page(
+        self,
+        table_name,
+        offset=0,
+        limit=100,
+        sort_column=None,
+        sort_order=None,
+        filter_model=None,
+        sample=None,
+        cursor=None,
+        key_columns=None,
+    ):
+        """
+        One page of the table's rows, like get_data_query without grouping,
+        returned as (DataFrame, cursor of the next page or None).
+
+        Rows are ordered by sort_column (NULLs last) and then by columns that
+        are unique together: key_columns, else the table's primary key, else
+        KEYSET_COLUMNS (see keyset.py), so every row has a fixed place. With
+        the cursor returned for the previous page, the page starts right
+        after that page's last row (keyset pagination): page 10,000 costs the
+        same as page 1. Without a cursor (or with one made for another sort)
+        it falls back to offset. Tables without a unique key are always paged
+        with offset, as seeking past a duplicated key would skip rows.
+        """
+        local = self._local(table_name)
+        if local is not None:
+            return local.get_page(
+                table_name, offset, limit, sort_column, sort_order, filter_model, sample, cursor, key_columns
+            )
+        table = self._internal_schema(table_name)
+        key_columns = keyset_columns(table, key_columns)
+        if key_columns is None or (sort_column and sort_column not in table.c):
+            df = self.get_data_query(
+                table_name, offset, limit, sort_column, sort_order, filter_model=filter_model, sample=sample
+            )
+            return df, None
+
+        descending = bool(sort_column) and (sort_order or "asc").lower() == "desc"
+        ordering = (sort_column, descending, key_columns)
+        position = decode_cursor(cursor, ordering) if cursor else None
+        kind = seek_kind(position, sort_column)
+        stmt, sql = self._shaped(
+            (
+                "keyset",
+                *self._query_shape(table_name, sort_column, sort_order, filter_model=filter_model, sample=sample),
+                tuple(key_columns),
+                kind,
+            ),
+            lambda: keyset_select(
+                self._build_select(table_name, filter_model=filter_model, sample=sample),
+                key_columns,
+                sort_column,
+                descending,
+                kind,
+            )
+            .offset(bindparam("page_offset", type_=Integer, literal_execute=True))
+            .limit(bindparam("page_limit", type_=Integer, literal_execute=True)),
+        )
+        params = dict(
+            self._filter_params(filter_model),
+            **seek_params(kind, position),
+            page_offset=0 if position else offset,
+            page_limit=limit,
+        )
+        df = self._execute(stmt, table_name, params=params, sql=sql)
+        if len(df) < limit:
+            return df, None
+        last = df.iloc[-1]
+        return df, encode_cursor(ordering, last[sort_column] if sort_column else None, last[key_columns].tolist())
+
+    def _local(self, *table_names):
+        """
+        The replica's BrickSQLAlchemy if it has fresh copies of all
+        table_names, else None.
+        """
+        if self.replica is not None and self.replica.serves(*table_names):
+            return self.replica.local
+        return None
+
+    def _route_rollup(self, table_name, group_by, aggregate_columns, filter_model):
+        """
+        The rollup that can answer this aggregate query, if any (see rollups.py).
+        """
+        if self.rollups is None or not group_by or not aggregate_columns:
+            return None
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        return self.rollups.route(table_name, group_by, aggregate_columns, list(filter_model or {}))
+
+    def _rollup_select(self, rollup, group_by, aggregate_columns, filter_model, sort_column=None, sort_order=None):
+        """
+        The aggregate SELECT of _build_select, computed from a rollup instead
+        of the base table.
+        """
+        if isinstance(group_by, str):
+            group_by = [group_by]
+        table = rollup.store_table
+        group_by_cols = [table.c[col] for col in group_by]
+        agg_exprs = [rollup.aggregate(agg["agg"].upper(), agg["column"]) for agg in aggregate_columns]
+        stmt = select(*group_by_cols, *agg_exprs).group_by(*group_by_cols)
+        stmt = self._apply_filters(stmt, table, rollup.store_table_name, filter_model)
+        return self._apply_sort(stmt, table, sort_column, sort_order)
+
+    def _execute_rollup(self, rollup, stmt, params, fetch):
+        # The rollup store is local and small, so results aren't cached.
+        print(f"Bricks answering from rollup {rollup.name}")
+        with self.rollups.engine.connect() as conn:
+            return fetch(conn.execute(stmt, params))
+
+    def _export_statement(self, table_name, sort_column, sort_order, group_by, aggregate_columns, filter_model):
+        query = dict(
+            sort_column=sort_column,
+            sort_order=sort_order,
+            group_by=group_by,
+            aggregate_columns=aggregate_columns,
+            filter_model=filter_model,
+        )
+        stmt, _ = self._shaped(
+            ("export", *self._query_shape(table_name, **query)),
+            lambda: self._build_select(table_name, **query),
+        )
+        return stmt
+
+    def export_columns(
+        self,
+        table_name,
+        sort_column=None,
+        sort_order=None,
+        group_by=None,
+        aggregate_columns=None,
+        filter_model=None,
+    ):
+        """
+        (name, SQLAlchemy type) of each column export_batches yields for
+        these arguments, e.g. to fix a Parquet schema before any row is read.
+        """
+        local = self._local(table_name)
+        if local is not None:
+            return local.export_columns(table_name, sort_column, sort_order, group_by, aggregate_columns, filter_model)
+        stmt = self._export_statement(table_name, sort_column, sort_order, group_by, aggregate_columns, filter_model)
+        return [(column.name, column.type) for column in stmt.selected_columns]
+
+    def export_batches(
+        self,
+        table_name,
+        batch_size=50000,
+        sort_column=None,
+        sort_order=None,
+        group_by=None,
+        aggregate_columns=None,
+        filter_model=None,
+    ):
+        """
+        Yield the full result of the statement get_data_query would build for
+        these arguments (no offset/limit) as DataFrames of at most batch_size
+        rows, so an export only ever holds one batch in memory. Always yields
+        at least one (possibly empty) frame with the result's columns.
+        Results are streamed straight from the warehouse, never cached.
+        """
+        local = self._local(table_name)
+        if local is not None:
+            yield from local.export_batches(
+                table_name, batch_size, sort_column, sort_order, group_by, aggregate_columns, filter_model
+            )
+            return
+        stmt = self._export_statement(table_name, sort_column, sort_order, group_by, aggregate_columns, filter_model)
+        print(f"Bricks export {table_name} in batches of {batch_size}")
+        with self._connect() as conn:
+            # Server-side cursors where the driver has them, so rows aren't
+            # buffered client-side; Arrow drivers fetch in chunks anyway.
+            conn = conn.execution_options(stream_results=self.engine.dialect.supports_server_side_cursors)
+            result = conn.execute(stmt, self._filter_params(filter_model))
+            empty = True
+            for batch in self._fetch_batches(result, batch_size):
+                empty = False
+                yield batch
+            if empty:
+                yield pd.DataFrame(columns=list(result.keys()))
+
+    def count_rows(self, table_name, group_by=None, aggregate_columns=None, filter_model=None, sample=None):
+        """
+        Return the number of rows get_data_query would page through for the
+        same arguments (ignoring offset/limit). In aggregate mode this is the
+        number of groups. Used by the grid's infinite row model as its total.
+        With sample it counts the rows (or groups) of the sample.
+        """
+        rollup = self._route_rollup(table_name, group_by, aggregate_columns, filter_model)
+        if rollup is not None:
+            stmt = self._rollup_select(rollup, group_by, aggregate_columns, filter_model)
+            count_stmt = select(func.count()).select_from(stmt.subquery())
+            return self._execute_rollup(
+                rollup, count_stmt, self._filter_params(filter_model), lambda result: result.scalar() or 0
+            )
+        local = self._local(table_name)
+        if local is not None:
+            return local.count_rows(table_name, group_by, aggregate_columns, filter_model, sample)
+
+        query = dict(group_by=group_by, aggregate_columns=aggregate_columns, filter_model=filter_model, sample=sample)
+        count_stmt, sql = self._shaped(
+            ("count", *self._query_shape(table_name, **query)),
+            lambda: select(func.count()).select_from(self._build_select(table_name, **query).subquery()),
+        )
+        return self._execute(
+            count_stmt,
+            table_name,
+            fetch=lambda result: result.scalar() or 0,
+            params=self._filter_params(filter_model),
+            sql=sql,
+        )
+
+    def run_rule(self, table_name, rule_name, limit=100, sample=None):
+        """
+        Run one data-quality rule from self.rules against table_name and
+        return up to `limit` violating rows as a DataFrame. With sample only
+        that percentage of the table's rows is checked.
+        """
+        rule = self.rules.get(rule_name)
+        local = self._local(table_name, *rule.tables())
+        if local is not None:
+            return local.run_rule(table_name, rule_name, limit, sample)
+        stmt, sql = self._shaped(
+            ("rule", table_name, rule_name, limit, sample),
+            lambda: rule.check_select(self._checked_table(table_name, sample), self.engine.dialect.name).limit(limit),
+        )
+        return self._execute(stmt, [table_name, *rule.tables()], sql=sql)
+
     def check_duplicates(self, table_name):
         """
         1) Find duplicate transaction_ids.
         Return rows where transaction_id appears more than once.
         """
         print(f"Checking duplicates in {table_name}")
-        duplicates_sql = text(f"""
-            SELECT
-                transaction_id,
-                COUNT(*) AS duplicate_count
-            FROM {table_name}
-            GROUP BY transaction_id
-            HAVING COUNT(*) > 1
-            limit 100
-        """)
-        with self.engine.connect() as conn:
-            rows = conn.execute(duplicates_sql)
-            df = pd.DataFrame(rows.fetchall(), columns=rows.keys())
-        
-        return df
+        return self.run_rule(table_name, "check_duplicates")
 
     def check_negative_debits_credits(self, table_name):
         """
         2) Find rows where debit or credit is negative.
         """
         print(f"Checking negative debits/credits in {table_name}")
-        negative_sql = text(f"""
-            SELECT *
-            FROM {table_name}
-            WHERE debit = 0
-               OR credit = 0
-            limit 100
-        """)
-        with self.engine.connect() as conn:
-            rows = conn.execute(negative_sql)
-            df = pd.DataFrame(rows.fetchall(), columns=rows.keys())
-        
-        return df
+        return self.run_rule(table_name, "check_negative_debits_credits")
 
     def check_region_country_mismatch(self, table_name):
         """
-        3) Validate region/country pairs. 
-           We'll do a simple inline check:
+        3) Validate region/country pairs against the allowed mapping of the
+           check_region_country_mismatch rule (see dq_rules.json), e.g.
                - 'EU'  -> {Germany, France, Spain}
                - 'APAC'-> {India, China, Japan}
-               - 'AMER'-> {USA, Canada, Mexico}
-               - 'MEA' -> {South Africa, Egypt, UAE}
-           
-           Returns any rows that violate these mappings.
-           
-           (You can store valid mappings in a reference table
-            and do a JOIN instead of a big WHERE.)
+
+           Returns any rows that violate these mappings. The mapping is
+           joined as a small reference relation, not expanded into NOT IN lists.
         """
         print(f"Checking region/country mismatch in {table_name}")
-        mismatch_sql = text(f"""
-            SELECT *
-            FROM {table_name}
-            WHERE (region = 'EU'   AND country NOT IN ('Germany','France','Spain'))
-               OR (region = 'APAC' AND country NOT IN ('India','China','Japan'))
-               OR (region = 'AMER' AND country NOT IN ('USA','Canada','Mexico'))
-               OR (region = 'MEA'  AND country NOT IN ('South Africa','Egypt','UAE'))
-            limit 100
-        """)
-        with self.engine.connect() as conn:
-            rows = conn.execute(mismatch_sql)
-            df = pd.DataFrame(rows.fetchall(), columns=rows.keys())
-        return df
+        return self.run_rule(table_name, "check_region_country_mismatch")
+
+    def _checked_table(self, table_name, sample=None):
+        table = self._internal_schema(table_name)
+        return sampled(table, sample, self.engine.dialect.name) if sample else table
+
+    def check_all(self, table_name, checks=None, limit=100, batch_size=10000, sample=None):
+        """
+        Run several rules in a single scan of the table instead of one scan
+        per rule. Every row is tagged with a flag column per rule (e.g.
+        duplicates through COUNT(*) OVER (PARTITION BY transaction_id)) and
+        the flagged rows are split per rule afterwards.
+
+        Returns {rule_name: DataFrame}, each frame shaped like run_rule's
+        result (at most `limit` rows). Rows are streamed in batches and
+        reading stops once every rule has its rows; on warehouses that
+        compute the whole result first (CAPPED_CHECK_DIALECTS) the query
+        itself returns at most `limit` violations per rule. With sample only
+        that percentage of the table's rows is checked.
+        """
+        rules = [self.rules.get(name) for name in (checks or self.rules.names())]
+        local = self._local(table_name, *[ref for rule in rules for ref in rule.tables()])
+        if local is not None:
+            return local.check_all(table_name, checks, limit, batch_size, sample)
+        print(f"Checking {[rule.name for rule in rules]} in one scan of {table_name}")
+        capped = self.engine.dialect.name in CAPPED_CHECK_DIALECTS
+        stmt, sql = self._shaped(
+            ("check_all", table_name, tuple(rule.name for rule in rules), sample),
+            lambda: flagged_select(
+                rules,
+                self._checked_table(table_name, sample),
+                self.engine.dialect.name,
+                limit=bindparam("check_limit", type_=Integer) if capped else None,
+            ),
+        )
+
+        def split_checks(result):
+            columns = list(result.keys())
+            data_columns = [col for col in columns if not col.startswith("_dq_")]
+            found = {rule.name: [] for rule in rules}
+            counts = {rule.name: 0 for rule in rules}
+            seen = {rule.name: set() for rule in rules if rule.distinct_on}
+            for batch in self._fetch_batches(result, batch_size):
+                for i, rule in enumerate(rules):
+                    part = rule.violations(batch, f"_dq_{i}", data_columns)
+                    if rule.distinct_on:
+                        # The same key shows up once per duplicated row, possibly across batches.
+                        keys = list(part[rule.distinct_on].itertuples(index=False, name=None))
+                        part = part[[key not in seen[rule.name] for key in keys]]
+                        seen[rule.name].update(keys)
+                    found[rule.name].append(part)
+                    counts[rule.name] += len(part)
+                # Stop reading once every rule has enough rows.
+                if all(count >= limit for count in counts.values()):
+                    break
+            return {
+                rule.name: (
+                    pd.concat(found[rule.name], ignore_index=True).head(limit)
+                    if found[rule.name]
+                    else pd.DataFrame(columns=rule.output_columns(data_columns))
+                )
+                for rule in rules
+            }
+
+        tables = [table_name, *[ref for rule in rules for ref in rule.tables()]]
+        return self._execute(stmt, tables, params={"check_limit": limit} if capped else None, fetch=split_checks, sql=sql)
 
     def save_row_data(self, table_name, changes):
         """
         Save updated row data to the database using SQLAlchemy's engine.
         :param changes: List of dictionaries representing changes from AgGrid.
+
+        Edits are coalesced per row (the last edit of a cell wins). On
+        Databricks up to MERGE_BATCH_ROWS rows are written by a single MERGE,
+        whatever columns each of them changed, so a batch that size is
+        applied atomically; larger batches take one MERGE per chunk, each
+        committed on its own. Elsewhere rows that changed the same set of
+        columns share one executemany UPDATE, all inside a single
+        transaction.
+
+        Returns a dict with rows_applied, rows_failed, cells, elapsed_ms and
+        error (None on success) that the UI can show. rows_applied is what
+        the warehouse reports it updated (a transaction_id repeated in the
+        table counts once per copy, up to the number of edited rows); edited
+        rows it didn't match, e.g. deleted ones, are counted in rows_failed.
+        When a MERGE fails, rows_applied counts the rows of the MERGEs
+        committed before it.
         """
+        start = time.perf_counter()
+        rows = {}
+        cells = 0
+        for change in changes:
+            # Assuming 'transaction_id' is the unique identifier
+            transaction_id = change["data"]["transaction_id"]
+            rows.setdefault(transaction_id, {})[change["colId"]] = change["value"]
+            cells += 1
+
+        save_result = {"rows_applied": 0, "rows_failed": 0, "cells": cells, "elapsed_ms": 0, "error": None}
+        applied = 0
         try:
-            for change in changes:
-                row_data = change["data"]
-                col_id = change["colId"]
-                new_value = change["value"]
+            table = self._internal_schema(table_name)
+            for col_id in sorted({col_id for values in rows.values() for col_id in values}):
+                if col_id not in table.c:
+                    raise ValueError(f"Column '{col_id}' does not exist in table '{table_name}'")
+
+            if self.engine.dialect.name == "databricks":
+                # (execute arguments, edited transaction_ids, committed once
+                # it ran): Delta commits every statement by itself.
+                items = list(rows.items())
+                chunks = [items[i : i + MERGE_BATCH_ROWS] for i in range(0, len(items), MERGE_BATCH_ROWS)]
+                statements = [
+                    ((self._merge_statement(table, chunk),), [key for key, _ in chunk], True) for chunk in chunks
+                ]
+            else:
+                # Rows that changed the same columns share one statement, and
+                # nothing is committed before the transaction ends.
+                batches = {}
+                for transaction_id, values in rows.items():
+                    batches.setdefault(tuple(sorted(values)), []).append((transaction_id, values))
+                statements = [
+                    (self._update_many_statement(table, columns, batch), [key for key, _ in batch], False)
+                    for columns, batch in batches.items()
+                ]
+
+            matched = 0
+            with self._connect() as conn, conn.begin():
+                for args, keys, commits in statements:
+                    updated = self._updated_rows(conn, conn.execute(*args), table, keys)
+                    matched += updated
+                    if commits:
+                        applied += updated
+            save_result["rows_applied"] = matched
+            save_result["rows_failed"] = len(rows) - matched
+            print(
+                f"Saved {cells} cell(s) in {matched} of {len(rows)} row(s) of {table_name} "
+                f"with {len(statements)} statement(s)"
+            )
+        except Exception as e:
+            save_result["rows_applied"] = applied
+            save_result["rows_failed"] = len(rows) - applied
+            save_result["error"] = str(e)
+            print(f"Error saving data: {e}")
+        finally:
+            # Even a partial write makes cached reads of this table stale.
+            self.cache.invalidate_table(table_name)
+            self.writes.record(table_name)
+            if self.rollups is not None:
+                self.rollups.check_writes()
+            if self.replica is not None:
+                self.replica.check_writes()
+        save_result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return save_result
 
-                # Assuming 'transaction_id' is the unique identifier
-                transaction_id = row_data["transaction_id"]
+    def _updated_rows(self, conn, result, table, keys):
+        """
+        How many of the rows edited under transaction_ids `keys` the UPDATE
+        or MERGE that just ran matched: the num_updated_rows Databricks
+        returns for a MERGE, else the cursor's rowcount. Drivers that report
+        neither (DuckDB counts only the last row of an executemany) get a
+        count of the keys found in the table.
+        """
+        updated = None
+        if result.returns_rows:
+            row = result.mappings().first()
+            if row is not None and "num_updated_rows" in row:
+                updated = int(row["num_updated_rows"])
+        elif self.engine.dialect.supports_sane_multi_rowcount and result.rowcount >= 0:
+            updated = result.rowcount
+        if updated is None:
+            key = table.c.transaction_id
+            updated = conn.scalar(select(func.count(key.distinct())).where(key.in_(keys)))
+        return min(updated, len(keys))
 
-                # Get the table object
-                table = self.metadata.tables[table_name]
+    def _update_many_statement(self, table, columns, batch):
+        """
+        UPDATE ... WHERE transaction_id = ? plus one parameter set per row,
+        for conn.execute(stmt, params) to run as an executemany.
+        """
+        stmt = table.update().where(
+            table.c.transaction_id == bindparam("key", type_=table.c.transaction_id.type)
+        ).values({col_id: bindparam(f"v{i}", type_=table.c[col_id].type) for i, col_id in enumerate(columns)})
+        params = [
+            {"key": transaction_id, **{f"v{i}": values[col_id] for i, col_id in enumerate(columns)}}
+            for transaction_id, values in batch
+        ]
+        return stmt, params
 
-                # Build the update query
-                query = table.update().where(
-                    table.c.transaction_id == transaction_id
-                ).values({col_id: new_value})
+    def _merge_statement(self, table, batch):
+        """
+        MERGE INTO table USING (VALUES ...) ON transaction_id, updating the
+        changed columns of every row in batch in a single round trip. Rows
+        may change different columns: each column comes with a flag telling
+        whether the row sets it, and keeps its value where it doesn't.
+        """
+        preparer = self.engine.dialect.identifier_preparer
+        columns = sorted({col_id for _, values in batch for col_id in values})
+        key_type = table.c.transaction_id.type.compile(dialect=self.engine.dialect)
+        col_types = [table.c[col_id].type.compile(dialect=self.engine.dialect) for col_id in columns]
 
-                # Execute the query
-                with self.engine.connect() as conn:
-                    conn.execute(query)
-                
-                print(f"Updated transaction_id={transaction_id}: Set {col_id}={new_value}")
+        params = {}
+        value_rows = []
+        for row_num, (transaction_id, values) in enumerate(batch):
+            params[f"k{row_num}"] = transaction_id
+            row_sql = [f"CAST(:k{row_num} AS {key_type})"]
+            for i, col_id in enumerate(columns):
+                if col_id in values:
+                    params[f"v{row_num}_{i}"] = values[col_id]
+                    row_sql.extend([f"CAST(:v{row_num}_{i} AS {col_types[i]})", "TRUE"])
+                else:
+                    row_sql.extend([f"CAST(NULL AS {col_types[i]})", "FALSE"])
+            value_rows.append(f"({', '.join(row_sql)})")
 
-        except Exception as e:
-            print(f"Error saving data: {e}")
\ No newline at end of file
+        source_cols = ", ".join(["transaction_id", *[f"c{i}, u{i}" for i in range(len(columns))]])
+        assignments = ", ".join(
+            f"t.{preparer.quote(col_id)} = CASE WHEN s.u{i} THEN s.c{i} ELSE t.{preparer.quote(col_id)} END"
+            for i, col_id in enumerate(columns)
+        )
+        return text(f"""
+            MERGE INTO {preparer.format_table(table)} AS t
+            USING (VALUES {', '.join(value_rows)}) AS s({source_cols})
+            ON t.transaction_id = s.transaction_id
+            WHEN MATCHED THEN UPDATE SET {assignments}
+        """).bindparams(**params)
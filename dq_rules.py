@@ -0,0 +1,354 @@
+# dq_rules.py
+import json
+import os
+
+from sqlalchemy import String, and_, case, column, func, literal, or_, select, text, union_all, values
+from sqlalchemy import table as table_clause
+
+# Rules file loaded by BrickSQLAlchemy. JSON, or YAML if PyYAML is installed.
+RULES_PATH = os.environ.get(
+    "DQ_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dq_rules.json")
+)
+
+# Dialects that can select from an inline (VALUES ...) AS name (cols) relation.
+VALUES_DIALECTS = ("databricks", "duckdb", "postgresql")
+
+# Dialects whose results are computed in full before the first row can be
+# fetched, so check_all caps the violations per rule in SQL (see
+# flagged_select). Elsewhere rows stream and reading stops early, which is
+# cheaper than numbering every violation first.
+CAPPED_CHECK_DIALECTS = ("databricks",)
+
+RULE_KINDS = {}
+
+
+def rule_kind(kind):
+    """
+    Class decorator registering a Rule subclass under a rule kind, so rules
+    files can use it as {"kind": kind, ...}.
+    """
+
+    def register(cls):
+        cls.kind = kind
+        RULE_KINDS[kind] = cls
+        return cls
+
+    return register
+
+
+class Rule:
+    """
+    A data-quality rule compiled to SQLAlchemy expressions against a
+    reflected table.
+
+    Every rule can build a standalone query returning the rows that violate
+    it (check_select), and a per-row flag column plus joins so that several
+    rules can be evaluated in a single scan (flag).
+    """
+
+    kind = None
+    # Columns that identify one result row, when a violation spans several
+    # table rows (e.g. duplicates). None means one result row per table row.
+    distinct_on = None
+
+    def __init__(self, name, label=None, empty_message=None, **options):
+        self.name = name
+        self.label = label or name
+        self.empty_message = empty_message or "All good! No violations found."
+        self.options = options
+
+    def check_select(self, table, dialect_name):
+        """
+        SELECT returning the rows that violate the rule, without a limit.
+        """
+        flag, joins = self.flag(table, dialect_name)
+        stmt = select(*table.c).select_from(_join_all(table, joins)).where(self.violated(flag))
+        return _with_broadcast_hint(stmt, joins, dialect_name)
+
+    def flag(self, table, dialect_name):
+        """
+        Return (expression, joins): an expression evaluated per row of table,
+        and the (relation, onclause) pairs it needs LEFT JOINed to table.
+        """
+        raise NotImplementedError
+
+    def violated(self, flag):
+        """
+        Condition on the flag column that marks a violating row.
+        """
+        return flag == 1
+
+    def tables(self):
+        """
+        Tables the rule reads besides the checked table, so cached results
+        can be invalidated when they change.
+        """
+        return []
+
+    def output_columns(self, data_columns):
+        return list(data_columns)
+
+    def violations(self, batch, flag_name, data_columns):
+        """
+        Pick the rows of a flagged batch (a DataFrame) that violate the rule,
+        shaped like the result of check_select.
+        """
+        return batch[batch[flag_name] == 1][data_columns]
+
+
+@rule_kind("uniqueness")
+class UniquenessRule(Rule):
+    """
+    The given columns must be unique. Reports each duplicated key with its
+    duplicate_count.
+    """
+
+    def __init__(self, name, columns, **kwargs):
+        super().__init__(name, **kwargs)
+        self.columns = [columns] if isinstance(columns, str) else list(columns)
+        self.distinct_on = self.columns
+
+    def check_select(self, table, dialect_name):
+        keys = [table.c[col] for col in self.columns]
+        return (
+            select(*keys, func.count().label("duplicate_count"))
+            .group_by(*keys)
+            .having(func.count() > 1)
+        )
+
+    def flag(self, table, dialect_name):
+        return func.count().over(partition_by=[table.c[col] for col in self.columns]), []
+
+    def violated(self, flag):
+        return flag > 1
+
+    def output_columns(self, data_columns):
+        return [*self.columns, "duplicate_count"]
+
+    def violations(self, batch, flag_name, data_columns):
+        found = batch[batch[flag_name] > 1][[*self.columns, flag_name]]
+        return found.rename(columns={flag_name: "duplicate_count"}).drop_duplicates(self.columns)
+
+
+@rule_kind("range")
+class RangeRule(Rule):
+    """
+    column must lie within [min, max] (either bound optional). NULLs pass.
+    """
+
+    def __init__(self, name, column, min=None, max=None, **kwargs):
+        super().__init__(name, **kwargs)
+        self.column = column
+        self.min = min
+        self.max = max
+
+    def flag(self, table, dialect_name):
+        col = table.c[self.column]
+        outside = []
+        if self.min is not None:
+            outside.append(col < self.min)
+        if self.max is not None:
+            outside.append(col > self.max)
+        if not outside:
+            raise ValueError(f"Range rule {self.name} needs a min or a max")
+        return case((or_(*outside), 1), else_=0), []
+
+
+@rule_kind("allowed_pairs")
+class AllowedPairsRule(Rule):
+    """
+    For rows whose key_column has an entry in the mapping, value_column must
+    be one of the allowed values; keys missing from the mapping are not
+    checked. The mapping is either inline ({"EU": ["Germany", ...]}) or a
+    reference table with the key/value columns named in reference_columns.
+
+    The mapping is joined as a small relation (broadcast on Databricks)
+    instead of being expanded into NOT IN lists.
+    """
+
+    def __init__(
+        self,
+        name,
+        key_column,
+        value_column,
+        mapping=None,
+        reference_table=None,
+        reference_columns=None,
+        **kwargs,
+    ):
+        super().__init__(name, **kwargs)
+        if (mapping is None) == (reference_table is None):
+            raise ValueError(f"Rule {name} needs exactly one of mapping or reference_table")
+        self.key_column = key_column
+        self.value_column = value_column
+        self.mapping = mapping
+        self.reference_table = reference_table
+        self.reference_columns = reference_columns or [key_column, value_column]
+
+    def tables(self):
+        return [self.reference_table] if self.reference_table else []
+
+    def reference(self, dialect_name):
+        """
+        The allowed pairs as a relation with ref_key and ref_value columns.
+        """
+        if self.reference_table:
+            ref_key, ref_value = self.reference_columns
+            ref = table_clause(self.reference_table, column(ref_key), column(ref_value))
+            return (
+                select(ref.c[ref_key].label("ref_key"), ref.c[ref_value].label("ref_value"))
+                .distinct()
+                .subquery(f"{self.name}_ref")
+            )
+        pairs = sorted({(key, value) for key, allowed in self.mapping.items() for value in allowed})
+        if dialect_name in VALUES_DIALECTS:
+            return values(
+                column("ref_key", String),
+                column("ref_value", String),
+                name=f"{self.name}_ref",
+                literal_binds=True,
+            ).data(pairs)
+        # e.g. SQLite, which can't name the columns of a VALUES relation
+        return union_all(
+            *[select(literal(key).label("ref_key"), literal(value).label("ref_value")) for key, value in pairs]
+        ).subquery(f"{self.name}_ref")
+
+    def flag(self, table, dialect_name):
+        pairs = self.reference(dialect_name)
+        keys = select(pairs.c.ref_key).distinct().subquery(f"{self.name}_keys")
+        key = table.c[self.key_column]
+        value = table.c[self.value_column]
+        joins = [
+            (keys, key == keys.c.ref_key),
+            (pairs, and_(key == pairs.c.ref_key, value == pairs.c.ref_value)),
+        ]
+        mismatch = and_(keys.c.ref_key.isnot(None), value.isnot(None), pairs.c.ref_key.is_(None))
+        return case((mismatch, 1), else_=0), joins
+
+
+@rule_kind("custom_sql")
+class CustomSqlRule(Rule):
+    """
+    Rows matching an arbitrary SQL predicate over the table's columns violate
+    the rule, e.g. "debit = 0 OR credit = 0".
+    """
+
+    def __init__(self, name, predicate, **kwargs):
+        super().__init__(name, **kwargs)
+        self.predicate = predicate
+
+    def flag(self, table, dialect_name):
+        return case((text(f"({self.predicate})"), 1), else_=0), []
+
+
+class RuleRegistry:
+    """
+    Ordered collection of rules, looked up by name.
+    """
+
+    def __init__(self, rules=()):
+        self._rules = {}
+        for rule in rules:
+            self.register(rule)
+
+    def register(self, rule):
+        self._rules[rule.name] = rule
+        return rule
+
+    def get(self, name):
+        if name not in self._rules:
+            raise KeyError(f"Unknown data-quality rule '{name}'")
+        return self._rules[name]
+
+    def names(self):
+        return list(self._rules)
+
+    def __iter__(self):
+        return iter(self._rules.values())
+
+    def __len__(self):
+        return len(self._rules)
+
+
+def rule_from_dict(spec):
+    """
+    Build a rule from a rules-file entry like
+    {"name": "...", "kind": "uniqueness", "columns": ["transaction_id"]}.
+    """
+    spec = dict(spec)
+    kind = spec.pop("kind")
+    if kind not in RULE_KINDS:
+        raise ValueError(f"Unknown rule kind '{kind}', expected one of {sorted(RULE_KINDS)}")
+    return RULE_KINDS[kind](**spec)
+
+
+def load_rules(path=RULES_PATH):
+    """
+    Load a RuleRegistry from a JSON (or YAML) list of rule specs.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+
+            specs = yaml.safe_load(f)
+        else:
+            specs = json.load(f)
+    return RuleRegistry(rule_from_dict(spec) for spec in specs)
+
+
+def flagged_select(rules, table, dialect_name, limit=None):
+    """
+    One SELECT over table tagging every row with a flag column per rule
+    (_dq_0, _dq_1, ...), keeping only rows that violate at least one rule.
+
+    With a limit (a number or bind parameter) the warehouse keeps at most
+    that many violations per rule: rows are numbered per rule with
+    ROW_NUMBER() OVER (PARTITION BY <violated>), and rules reporting one row
+    per key (distinct_on) keep one row for each of their first `limit` keys.
+    """
+    flags = []
+    joins = []
+    for i, rule in enumerate(rules):
+        flag, rule_joins = rule.flag(table, dialect_name)
+        flags.append(flag.label(f"_dq_{i}"))
+        joins.extend(rule_joins)
+    inner = select(*table.c, *flags).select_from(_join_all(table, joins))
+    inner = _with_broadcast_hint(inner, joins, dialect_name).subquery("flagged")
+    flagged = select(inner).where(or_(*[rule.violated(inner.c[f"_dq_{i}"]) for i, rule in enumerate(rules)]))
+    if limit is None:
+        return flagged
+
+    # Numbered over the violating rows only, not the whole table.
+    flagged = flagged.subquery("violations")
+    ranks = []
+    for i, rule in enumerate(rules):
+        hit = case((rule.violated(flagged.c[f"_dq_{i}"]), 1), else_=0)
+        if rule.distinct_on:
+            keys = [flagged.c[col] for col in rule.distinct_on]
+            ranks.append(func.row_number().over(partition_by=[hit, *keys]).label(f"_dq_first_{i}"))
+            ranks.append(func.dense_rank().over(partition_by=hit, order_by=keys).label(f"_dq_rank_{i}"))
+        else:
+            ranks.append(func.row_number().over(partition_by=hit).label(f"_dq_rank_{i}"))
+    ranked = select(flagged, *ranks).subquery("ranked")
+    kept = []
+    for i, rule in enumerate(rules):
+        conditions = [rule.violated(ranked.c[f"_dq_{i}"]), ranked.c[f"_dq_rank_{i}"] <= limit]
+        if rule.distinct_on:
+            conditions.append(ranked.c[f"_dq_first_{i}"] == 1)
+        kept.append(and_(*conditions))
+    return select(*[ranked.c[col.name] for col in inner.c]).where(or_(*kept))
+
+
+def _join_all(table, joins):
+    from_clause = table
+    for relation, onclause in joins:
+        from_clause = from_clause.outerjoin(relation, onclause)
+    return from_clause
+
+
+def _with_broadcast_hint(stmt, joins, dialect_name):
+    # Reference relations are tiny: ask Databricks to broadcast them.
+    if joins and dialect_name == "databricks":
+        names = ", ".join(relation.name for relation, _ in joins)
+        stmt = stmt.prefix_with(f"/*+ BROADCAST({names}) */")
+    return stmt
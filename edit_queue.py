@@ -0,0 +1,196 @@
+# edit_queue.py
+import atexit
+import contextlib
+import threading
+import time
+
+
+class EditQueue:
+    """
+    Write-behind buffer for grid edits.
+
+    submit() only buffers the edits and returns. A background thread flushes a
+    table's buffer through brick.save_row_data once `max_batch` edits are
+    waiting or the oldest one has waited `flush_interval` seconds, so a burst
+    of edits becomes a single batched write.
+
+    The outcome of every flush is kept per session and table until
+    drain_results() collects it, so the UI can report saved edits and give
+    back failed ones to the session that made them, along with the number of
+    the session's edits still waiting (see waiting()). Both are written to
+    `results`, a dict-like object keyed by (session_id, table_name); with a
+    diskcache.Cache shared by the workers, any worker can drain them, not
+    only the one whose queue flushed the edits. Entries nobody touched for
+    `result_ttl` seconds (a tab closed before its results were drained) are
+    dropped.
+    """
+
+    def __init__(self, brick, max_batch=200, flush_interval=2.0, results=None, result_ttl=600):
+        self.brick = brick
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.results = results if results is not None else {}
+        self.result_ttl = result_ttl
+        self._pending = {}  # table_name -> list of (session_id, AgGrid change)
+        self._oldest = {}  # table_name -> monotonic time of the oldest pending edit
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+
+    def start(self):
+        """
+        Start the background flush thread (idempotent).
+        """
+        with self._cond:
+            if self._thread is not None:
+                return self
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="edit-queue", daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """
+        Stop the flush thread and write whatever is still buffered.
+        """
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+    def submit(self, table_name, changes, session_id=None):
+        """
+        Buffer AgGrid cellValueChanged changes that session_id made to
+        table_name. Returns the number of edits now waiting for that table.
+        """
+        with self._results_transaction():
+            entry = self._entry(session_id, table_name)
+            entry["waiting"] += len(changes)
+            self.results[(session_id, table_name)] = entry
+            pending = self._pending.setdefault(table_name, [])
+            if not pending:
+                self._oldest[table_name] = time.monotonic()
+                self._cond.notify_all()
+            pending.extend((session_id, change) for change in changes)
+            if len(pending) >= self.max_batch:
+                self._cond.notify_all()
+            return len(pending)
+
+    def pending_count(self, table_name):
+        with self._cond:
+            return len(self._pending.get(table_name, []))
+
+    def flush(self, table_name=None):
+        """
+        Write the buffered edits of one table (or all tables) right away.
+        """
+        with self._cond:
+            names = [table_name] if table_name else list(self._pending)
+            batches = [(name, self._take(name)) for name in names]
+        for name, changes in batches:
+            self._save(name, changes)
+
+    def drain_results(self, table_name, session_id=None):
+        """
+        Return and forget the flushes of session_id's edits to table_name
+        since the last call, as a list of (save_result, changes) tuples in
+        flush order. save_result is that of the whole flush, changes only
+        the session's own.
+        """
+        with self._results_transaction():
+            entry = self.results.get((session_id, table_name))
+            if entry is None:
+                return []
+            if entry["waiting"]:
+                self.results[(session_id, table_name)] = dict(entry, flushes=[], at=time.time())
+            else:
+                self.results.pop((session_id, table_name), None)
+            return entry["flushes"]
+
+    def waiting(self, table_name, session_id=None):
+        """
+        Number of session_id's edits to table_name not saved yet, by any
+        process sharing `results`.
+        """
+        entry = self.results.get((session_id, table_name))
+        return entry["waiting"] if entry else 0
+
+    def _entry(self, session_id, table_name):
+        # Caller holds the results transaction. A fresh copy, to store back.
+        entry = self.results.get((session_id, table_name))
+        if entry is None:
+            return {"waiting": 0, "flushes": [], "at": time.time()}
+        return dict(entry, at=time.time())
+
+    def _expire(self):
+        # Caller holds the results transaction.
+        cutoff = time.time() - self.result_ttl
+        for key in list(self.results):
+            entry = self.results.get(key)
+            if entry is not None and entry["at"] < cutoff:
+                self.results.pop(key, None)
+
+    def _results_transaction(self):
+        # Makes a read-modify-write of results atomic, across processes too
+        # for a disk cache.
+        transact = getattr(self.results, "transact", None)
+        stack = contextlib.ExitStack()
+        stack.enter_context(self._cond)
+        if transact is not None:
+            stack.enter_context(transact())
+        return stack
+
+    def _take(self, table_name):
+        # Caller holds the lock.
+        self._oldest.pop(table_name, None)
+        return self._pending.pop(table_name, [])
+
+    def _save(self, table_name, changes):
+        if not changes:
+            return
+        edits = [change for _, change in changes]
+        try:
+            save_result = self.brick.save_row_data(table_name, edits)
+        except Exception as e:
+            save_result = {"rows_applied": 0, "rows_failed": len(edits), "cells": len(edits), "elapsed_ms": 0, "error": str(e)}
+        by_session = {}
+        for session_id, change in changes:
+            by_session.setdefault(session_id, []).append(change)
+        with self._results_transaction():
+            self._expire()
+            for session_id, session_changes in by_session.items():
+                entry = self._entry(session_id, table_name)
+                entry["waiting"] = max(0, entry["waiting"] - len(session_changes))
+                entry["flushes"] = [*entry["flushes"], (save_result, session_changes)]
+                self.results[(session_id, table_name)] = entry
+
+    def _due_tables(self):
+        # Caller holds the lock. Returns (due table names, seconds until the next one is due).
+        now = time.monotonic()
+        due = []
+        wait = self.flush_interval
+        for name, pending in self._pending.items():
+            age = now - self._oldest.get(name, now)
+            if len(pending) >= self.max_batch or age >= self.flush_interval:
+                due.append(name)
+            else:
+                wait = min(wait, self.flush_interval - age)
+        return due, wait
+
+    def _run(self):
+        while True:
+            with self._cond:
+                due, wait = self._due_tables()
+                while not due and not self._stopping:
+                    self._cond.wait(timeout=wait)
+                    due, wait = self._due_tables()
+                if self._stopping:
+                    return
+                batches = [(name, self._take(name)) for name in due]
+            # Write outside the lock so submit() never waits on the warehouse.
+            for name, changes in batches:
+                self._save(name, changes)
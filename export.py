@@ -0,0 +1,110 @@
+# export.py
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import types
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that keeps what was written until drained, while
+    tell() keeps counting from the start of the file as Parquet expects.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def csv_chunks(batches):
+    """
+    Turn an iterable of DataFrames into CSV text chunks, header first.
+    """
+    header = True
+    for batch in batches:
+        yield batch.to_csv(index=False, header=header)
+        header = False
+
+
+def arrow_type(sql_type):
+    """
+    Arrow type for the values of a SQLAlchemy column type, or None if it
+    can't be told (e.g. the NullType of an untyped expression).
+    """
+    if isinstance(sql_type, types.Boolean):
+        return pa.bool_()
+    if isinstance(sql_type, types.Integer):
+        return pa.int64()
+    if isinstance(sql_type, types.Float):
+        return pa.float64()
+    if isinstance(sql_type, types.Numeric):
+        if sql_type.asdecimal and sql_type.precision:
+            return pa.decimal128(sql_type.precision, sql_type.scale or 0)
+        return pa.float64()
+    if isinstance(sql_type, types.DateTime):
+        return pa.timestamp("us", tz="UTC" if sql_type.timezone else None)
+    if isinstance(sql_type, types.Date):
+        return pa.date32()
+    if isinstance(sql_type, types.String):
+        return pa.string()
+    if isinstance(sql_type, types.LargeBinary):
+        return pa.binary()
+    return None
+
+
+def parquet_schema(columns, batch):
+    """
+    Schema of a Parquet export from the result's (name, SQLAlchemy type)
+    columns. Columns of unknown type take the type Arrow infers from the
+    first batch, or string if they are all NULL there, so a column that
+    only has values in a later batch still fits the file.
+    """
+    inferred = pa.Table.from_pandas(batch, preserve_index=False).schema
+    fields = []
+    for name, sql_type in columns:
+        arrow = arrow_type(sql_type)
+        if arrow is None:
+            arrow = inferred.field(name).type
+            if pa.types.is_null(arrow):
+                arrow = pa.string()
+        fields.append(pa.field(name, arrow))
+    return pa.schema(fields)
+
+
+def parquet_chunks(batches, columns=None):
+    """
+    Turn an iterable of DataFrames into the bytes of a single Parquet file,
+    one row group per batch, yielding the bytes as each batch is written.
+    The schema comes from columns, the result's (name, SQLAlchemy type)
+    pairs (see parquet_schema), else from the first batch; every batch is
+    cast to it.
+    """
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        arrow_batch = pa.Table.from_pandas(batch, preserve_index=False)
+        if writer is None:
+            schema = parquet_schema(columns, batch) if columns else arrow_batch.schema.remove_metadata()
+            writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(arrow_batch.cast(writer.schema))
+        yield sink.drain()
+    if writer is not None:
+        writer.close()
+        yield sink.drain()
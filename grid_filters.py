@@ -0,0 +1,198 @@
+# grid_filters.py
+import datetime
+
+from sqlalchemy import and_, bindparam, false, not_, or_, true
+
+# Escape character of LIKE patterns, so % and _ typed in a filter match
+# literally. Not a backslash, which some warehouses also treat as an escape
+# in string literals.
+LIKE_ESCAPE = "!"
+
+
+def _like(template):
+    def to_params(condition):
+        value = str(_required(condition, "filter"))
+        for special in (LIKE_ESCAPE, "%", "_"):
+            value = value.replace(special, LIKE_ESCAPE + special)
+        return [template.format(value)]
+
+    return to_params
+
+
+def _required(condition, key):
+    value = condition.get(key)
+    if value is None:
+        raise ValueError(f"{condition.get('filterType')} filter '{condition.get('type')}' needs a {key}")
+    return value
+
+
+def _value(condition):
+    return [_required(condition, "filter")]
+
+
+def _range(condition):
+    return [_required(condition, "filter"), _required(condition, "filterTo")]
+
+
+def _no_value(condition):
+    return []
+
+
+def _day(condition, key="dateFrom", days=0):
+    # AgGrid sends dates as "YYYY-MM-DD HH:MM:SS" and compares whole days.
+    value = str(_required(condition, key))
+    return datetime.date.fromisoformat(value[:10]) + datetime.timedelta(days=days)
+
+
+def _days(*bounds):
+    # Bound values of a date filter: (key, days to add) per value.
+    return lambda condition: [_day(condition, key, days) for key, days in bounds]
+
+
+# AgGrid (filterType, type) -> (condition on the column and the bound values,
+# condition -> values to bind). Dates are bound as day boundaries (the day
+# after the date for "greater than"), so the comparisons also work on
+# TIMESTAMP columns and let the warehouse skip files by their min/max.
+# Ranges exclude their ends, as in AgGrid. Anything else is rejected.
+FILTER_OPERATORS = {
+    ("text", "equals"): (lambda col, value: col == value, _value),
+    ("text", "notEqual"): (lambda col, value: col != value, _value),
+    ("text", "contains"): (lambda col, value: col.ilike(value, escape=LIKE_ESCAPE), _like("%{}%")),
+    ("text", "notContains"): (lambda col, value: not_(col.ilike(value, escape=LIKE_ESCAPE)), _like("%{}%")),
+    ("text", "startsWith"): (lambda col, value: col.ilike(value, escape=LIKE_ESCAPE), _like("{}%")),
+    ("text", "endsWith"): (lambda col, value: col.ilike(value, escape=LIKE_ESCAPE), _like("%{}")),
+    ("text", "blank"): (lambda col: or_(col.is_(None), col == ""), _no_value),
+    ("text", "notBlank"): (lambda col: and_(col.is_not(None), col != ""), _no_value),
+    ("number", "equals"): (lambda col, value: col == value, _value),
+    ("number", "notEqual"): (lambda col, value: col != value, _value),
+    ("number", "greaterThan"): (lambda col, value: col > value, _value),
+    ("number", "greaterThanOrEqual"): (lambda col, value: col >= value, _value),
+    ("number", "lessThan"): (lambda col, value: col < value, _value),
+    ("number", "lessThanOrEqual"): (lambda col, value: col <= value, _value),
+    ("number", "inRange"): (lambda col, low, high: and_(col > low, col < high), _range),
+    ("number", "blank"): (lambda col: col.is_(None), _no_value),
+    ("number", "notBlank"): (lambda col: col.is_not(None), _no_value),
+    ("date", "equals"): (lambda col, start, end: and_(col >= start, col < end), _days(("dateFrom", 0), ("dateFrom", 1))),
+    ("date", "notEqual"): (lambda col, start, end: or_(col < start, col >= end), _days(("dateFrom", 0), ("dateFrom", 1))),
+    ("date", "greaterThan"): (lambda col, value: col >= value, _days(("dateFrom", 1))),
+    ("date", "greaterThanOrEqual"): (lambda col, value: col >= value, _days(("dateFrom", 0))),
+    ("date", "lessThan"): (lambda col, value: col < value, _days(("dateFrom", 0))),
+    ("date", "lessThanOrEqual"): (lambda col, value: col < value, _days(("dateFrom", 1))),
+    ("date", "inRange"): (lambda col, start, end: and_(col >= start, col < end), _days(("dateFrom", 1), ("dateTo", 0))),
+    ("date", "blank"): (lambda col: col.is_(None), _no_value),
+    ("date", "notBlank"): (lambda col: col.is_not(None), _no_value),
+}
+
+
+def _translate(condition, name):
+    """
+    (shape, params, build) for one column's filter: shape describes the
+    SQL without the values, params are the values bound as name (and
+    name_to, name_0, name_1, ... for ranges and combined conditions) and
+    build(column) makes the condition.
+    """
+    filter_type = condition.get("filterType")
+
+    if "conditions" in condition or "condition1" in condition:
+        # Two or more conditions joined by AND / OR. Older AgGrid versions
+        # send condition1 and condition2 instead of a conditions list.
+        conditions = condition.get("conditions") or [
+            condition[key] for key in ("condition1", "condition2") if condition.get(key)
+        ]
+        operator = (condition.get("operator") or "AND").upper()
+        if operator not in ("AND", "OR"):
+            raise ValueError(f"Unsupported filter operator '{operator}'")
+        parts = [
+            _translate(dict(part, filterType=part.get("filterType", filter_type)), f"{name}_{j}")
+            for j, part in enumerate(conditions)
+        ]
+        combine = and_ if operator == "AND" else or_
+        return _combined(operator, parts, combine)
+
+    if filter_type == "multi":
+        # One model per filter of a multi filter, all of which must match.
+        parts = [
+            _translate(model, f"{name}_{j}") for j, model in enumerate(condition.get("filterModels") or []) if model
+        ]
+        return _combined("AND", parts, and_)
+
+    if filter_type == "set":
+        values = condition.get("values") or []
+        present = [value for value in values if value is not None]
+        blanks = len(present) < len(values)
+
+        def build(column):
+            matches = []
+            if present:
+                matches.append(column.in_(bindparam(name, expanding=True)))
+            if blanks:
+                matches.append(column.is_(None))
+            return or_(*matches) if matches else false()
+
+        return ("set", bool(present), blanks), ({name: present} if present else {}), build
+
+    filter_mode = condition.get("type", "contains")  # Default to "contains"
+    operator = FILTER_OPERATORS.get((filter_type, filter_mode))
+    if operator is None:
+        raise ValueError(f"Unsupported filter: {filter_type} '{filter_mode}'")
+    make_condition, to_params = operator
+    params = dict(zip([name, f"{name}_to"], to_params(condition)))
+    return (
+        (filter_type, filter_mode),
+        params,
+        lambda column: make_condition(column, *(bindparam(param) for param in params)),
+    )
+
+
+def _combined(operator, parts, combine):
+    params = {}
+    for _, part_params, _ in parts:
+        params.update(part_params)
+    return (
+        (operator, tuple(shape for shape, _, _ in parts)),
+        params,
+        lambda column: combine(*(build(column) for _, _, build in parts)) if parts else true(),
+    )
+
+
+def _translate_model(filter_model):
+    # Columns in name order, with their values bound as filter_0, filter_1, ...
+    return [
+        (column_name, *_translate(condition, f"filter_{i}"))
+        for i, (column_name, condition) in enumerate(sorted((filter_model or {}).items()))
+    ]
+
+
+def filter_shape(filter_model):
+    """
+    Hashable description of the WHERE clause for an AgGrid filter model,
+    leaving out the values. Raises ValueError for filters it can't translate.
+    """
+    return tuple((column_name, shape) for column_name, shape, _, _ in _translate_model(filter_model))
+
+
+def filter_params(filter_model):
+    """
+    Bound values of the WHERE clause for an AgGrid filter model.
+    """
+    params = {}
+    for _, _, column_params, _ in _translate_model(filter_model):
+        params.update(column_params)
+    return params
+
+
+def filter_clause(table, filter_model, table_name=None):
+    """
+    The AgGrid filter model as a condition on table's columns (None without
+    filters), with the values as bind parameters (see filter_params).
+    Combined conditions, sets (an IN list, expanded at execution) and
+    blank / not blank are all translated, so the warehouse does the
+    filtering; a filter that can't be translated raises ValueError instead
+    of being ignored.
+    """
+    conditions = []
+    for column_name, _, _, build in _translate_model(filter_model):
+        if column_name not in table.c:
+            raise ValueError(f"Column '{column_name}' does not exist in table '{table_name or table.name}'")
+        conditions.append(build(table.c[column_name]))
+    return and_(*conditions) if conditions else None
@@ -0,0 +1,83 @@
+# grid_payload.py
+import os
+
+import pandas as pd
+
+# "columnar" sends grid rows as one list of values per column, decoded into
+# row objects in the browser (assets/grid_payload.js); "records" sends one
+# JSON object per row, repeating every column name on every row.
+GRID_PAYLOAD = os.environ.get("GRID_PAYLOAD", "columnar")
+
+# Text columns with at most this fraction of distinct values are sent as a
+# dictionary of the values plus one small integer code per row.
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def _column_values(series):
+    """
+    A column as a JSON-able list, with None for missing values.
+    """
+    if series.dtype.kind in "iubfO" and not series.hasnans:
+        return series.tolist()
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def encode_columns(df):
+    """
+    Encode df for the grid as
+    {"length": rows, "columns": [{"name": ..., "values": [...]}, ...]}.
+    Repetitive text columns become {"name": ..., "codes": [...], "dictionary": [...]}
+    instead, with code -1 for missing values. Much smaller and quicker to
+    build than df.to_dict("records") for anything but a handful of rows.
+    """
+    columns = []
+    for name in df.columns:
+        series = df[name]
+        if series.dtype == object and len(series) > 1:
+            # Missing values get code -1 and aren't in uniques.
+            codes, uniques = pd.factorize(series)
+            if len(uniques) <= len(series) * DICTIONARY_MAX_RATIO:
+                columns.append(
+                    {"name": str(name), "codes": codes.tolist(), "dictionary": uniques.tolist()}
+                )
+                continue
+        columns.append({"name": str(name), "values": _column_values(series)})
+    return {"length": len(df), "columns": columns}
+
+
+def with_row_ids(df, key):
+    """
+    df with a unique _row_id column: the values of its key column(s) as
+    text, e.g. the group-by columns of a grouped view, or the row number if
+    they are missing. Rows repeating a key get "#1", "#2", ... appended in
+    the order they come. Rows keep their id across reloads, so the grid can
+    update them in place.
+    """
+    keys = [key] if isinstance(key, str) else list(key or [])
+    if not keys or any(name not in df.columns for name in keys):
+        return df.assign(_row_id=[str(i) for i in range(len(df))])
+    ids = df[keys[0]].astype(str)
+    for name in keys[1:]:
+        ids = ids + "\x1f" + df[name].astype(str)
+    repeat = ids.groupby(ids).cumcount()
+    return df.assign(_row_id=ids.where(repeat == 0, ids + "#" + repeat.astype(str)))
+
+
+def row_delta(old, new):
+    """
+    Turn the rows of old into those of new, both with a _row_id column (see
+    with_row_ids) and the same columns: returns (rows to add, rows to update,
+    ids to remove). None if the ids aren't unique, so rows can't be matched.
+    """
+    if not old["_row_id"].is_unique or not new["_row_id"].is_unique:
+        return None
+    old = old.set_index("_row_id", drop=False)
+    new = new.set_index("_row_id", drop=False)
+    common = new.index.intersection(old.index)
+    before, after = old.loc[common, new.columns], new.loc[common]
+    changed = ~((before == after) | (before.isna() & after.isna())).all(axis=1)
+    return (
+        new.loc[~new.index.isin(old.index)].reset_index(drop=True),
+        after.loc[changed].reset_index(drop=True),
+        old.index[~old.index.isin(new.index)].tolist(),
+    )
@@ -0,0 +1,38 @@
+# gunicorn.conf.py
+import multiprocessing
+import os
+
+# Shared by the workers: coalesced queries, cached results, check results
+# and the lock electing the worker that maintains rollups and the replica.
+# Set before the app is imported, which reads it.
+os.environ.setdefault("BRICK_SHARED_DIR", "/tmp/brick-shared")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Callbacks mostly wait on the warehouse, so each worker also serves
+# several requests at once on threads.
+workers = int(os.environ.get("WEB_WORKERS", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+# Import the app (Dash layout functions, callbacks) once in the master;
+# workers share that memory and create their own warehouse state.
+preload_app = True
+
+# Long warehouse queries and streamed exports.
+timeout = int(os.environ.get("WEB_TIMEOUT", 300))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+
+
+def post_fork(server, worker):
+    # Set the worker up before it takes requests. If the warehouse can't be
+    # reached yet, the first request tries again.
+    from app import init_worker
+
+    try:
+        init_worker()
+    except Exception as e:
+        server.log.warning(f"Worker {worker.pid} not initialised yet: {e}")
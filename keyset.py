@@ -0,0 +1,145 @@
+# keyset.py
+import base64
+import datetime
+import decimal
+import json
+import os
+
+import pandas as pd
+from sqlalchemy import and_, asc, bindparam, desc, or_
+
+# Columns (comma separated) whose values together are unique in every row,
+# used to break ties in the sort order of keyset pagination so every row has
+# a fixed place. A table's primary key takes precedence; tables with neither
+# are paged with OFFSET, as a non-unique key would skip rows at page breaks.
+KEYSET_COLUMNS = [name.strip() for name in os.environ.get("BRICK_KEYSET_COLUMNS", "").split(",") if name.strip()]
+
+
+def keyset_columns(table, columns=None):
+    """
+    The unique columns table is paged by: columns if given, else its primary
+    key, else KEYSET_COLUMNS. None if they're missing from the table.
+    """
+    if columns is None:
+        columns = [column.name for column in table.primary_key.columns] or KEYSET_COLUMNS
+    if not columns or any(name not in table.c for name in columns):
+        return None
+    return list(columns)
+
+
+def to_json(value):
+    """
+    value as JSON, keeping dates and decimals as such (see from_json), so
+    they are bound with their type again.
+    """
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if isinstance(value, pd.Timestamp):
+        value = value.to_pydatetime()
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"decimal": str(value)}
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def from_json(value):
+    if isinstance(value, dict):
+        if "datetime" in value:
+            return datetime.datetime.fromisoformat(value["datetime"])
+        if "date" in value:
+            return datetime.date.fromisoformat(value["date"])
+        if "decimal" in value:
+            return decimal.Decimal(value["decimal"])
+    return value
+
+
+def encode_cursor(ordering, sort_value, key_values):
+    """
+    Opaque token for the position after a row: its sort and key values,
+    plus the ordering (sort column, direction and key columns) they belong to.
+    """
+    payload = json.dumps([list(ordering), to_json(sort_value), [to_json(value) for value in key_values]])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(token, ordering):
+    """
+    (sort value, key values) of a cursor from encode_cursor, or None if it is
+    invalid or was made for another ordering.
+    """
+    try:
+        token_ordering, sort_value, key_values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError, AttributeError):
+        return None
+    ordering = json.loads(json.dumps(list(ordering)))
+    if token_ordering != ordering or not isinstance(key_values, list) or len(key_values) != len(ordering[2]):
+        return None
+    return from_json(sort_value), [from_json(value) for value in key_values]
+
+
+def seek_kind(position, sort_column=None):
+    """
+    Which seek condition a position needs: None for the first page, "key"
+    without a sort column, "null" after a row whose sort value is NULL,
+    "value" otherwise. Part of the statement's shape.
+    """
+    if position is None:
+        return None
+    if not sort_column:
+        return "key"
+    return "null" if position[0] is None else "value"
+
+
+def _beyond_keys(keys):
+    # (k0, k1, ...) > (:seek_key_0, :seek_key_1, ...), spelled out since not
+    # every warehouse compares row values.
+    alternatives = []
+    for i, key in enumerate(keys):
+        equal = [earlier == bindparam(f"seek_key_{j}") for j, earlier in enumerate(keys[:i])]
+        alternatives.append(and_(*equal, key > bindparam(f"seek_key_{i}")))
+    return or_(*alternatives)
+
+
+def keyset_select(stmt, key_columns, sort_column=None, descending=False, kind=None):
+    """
+    Order stmt by sort_column (NULLs last) then the unique key_columns and,
+    for a kind from seek_kind, only keep the rows after the position bound
+    as seek_value / seek_key_0, seek_key_1, ... The warehouse then reads
+    from that position on instead of computing and discarding every row
+    before it as OFFSET does.
+    """
+    columns = stmt.selected_columns
+    keys = [columns[name] for name in key_columns]
+    beyond_keys = _beyond_keys(keys)
+    key_order = [asc(key) for key in keys]
+
+    if not sort_column:
+        if kind:
+            stmt = stmt.where(beyond_keys)
+        return stmt.order_by(*key_order)
+
+    column = columns[sort_column]
+    if kind == "null":
+        # Only NULLs are left, in key order.
+        stmt = stmt.where(and_(column.is_(None), beyond_keys))
+    elif kind == "value":
+        after_value = bindparam("seek_value")
+        beyond_value = column < after_value if descending else column > after_value
+        stmt = stmt.where(or_(beyond_value, and_(column == after_value, beyond_keys), column.is_(None)))
+    order = desc(column) if descending else asc(column)
+    return stmt.order_by(order.nulls_last(), *key_order)
+
+
+def seek_params(kind, position):
+    if kind is None:
+        return {}
+    sort_value, key_values = position
+    params = {f"seek_key_{i}": value for i, value in enumerate(key_values)}
+    if kind == "value":
+        params["seek_value"] = sort_value
+    return params
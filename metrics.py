@@ -0,0 +1,292 @@
+# metrics.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Statements running longer than this (milliseconds) are logged.
+SLOW_QUERY_MS = float(os.environ.get("BRICK_SLOW_QUERY_MS", 1000))
+
+# Seconds between snapshots written for the other worker processes (see start).
+METRICS_FLUSH = float(os.environ.get("BRICK_METRICS_FLUSH", 15))
+
+# Histogram buckets for durations in seconds, and for sizes in bytes.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# name -> (type, help) of every metric, in the order they are exported.
+METRICS = {
+    "brick_queries_total": ("counter", "Statements sent to the database"),
+    "brick_query_errors_total": ("counter", "Statements that failed, including cancelled ones"),
+    "brick_query_compile_seconds": ("histogram", "Time compiling statements to SQL"),
+    "brick_query_checkout_seconds": ("histogram", "Time waiting for a pooled session (opening one included)"),
+    "brick_query_execute_seconds": ("histogram", "Time executing statements, until the first rows can be fetched"),
+    "brick_query_fetch_seconds": ("histogram", "Time fetching result rows from the database"),
+    "brick_query_convert_seconds": ("histogram", "Time turning fetched rows into DataFrames"),
+    "brick_query_rows_total": ("counter", "Result rows fetched"),
+    "brick_query_bytes_total": ("counter", "Bytes of result rows fetched (in memory)"),
+    "http_request_seconds": ("histogram", "Time serving HTTP requests, per route"),
+    "dash_callback_seconds": ("histogram", "Time serving Dash callbacks, per callback output"),
+    "dash_callback_payload_bytes": ("histogram", "Size of Dash callback responses, per callback output"),
+}
+
+# Where the statements of this thread come from, e.g. a callback or a check.
+_current = threading.local()
+
+_lock = threading.Lock()
+_counters = {}  # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [count per bucket..., sum, count]
+_collectors = []  # functions returning [(name, labels dict, value)] gauges
+
+
+def _labels(labels):
+    return tuple(sorted((labels or {}).items()))
+
+
+def inc(name, value=1, labels=None):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, labels=None):
+    buckets = BYTES_BUCKETS if name.endswith("_bytes") else SECONDS_BUCKETS
+    key = (name, _labels(labels))
+    with _lock:
+        counts = _histograms.get(key)
+        if counts is None:
+            counts = _histograms[key] = [0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+
+def add_collector(collect):
+    """
+    Register a function returning [(name, labels, value)] gauges, read at
+    every export, e.g. the state of a connection pool.
+    """
+    _collectors.append(collect)
+
+
+def current_source():
+    return getattr(_current, "source", None) or "background"
+
+
+@contextmanager
+def source(name):
+    """
+    Label the statements run by this thread inside the block with name.
+    """
+    previous = getattr(_current, "source", None)
+    _current.source = name
+    try:
+        yield
+    finally:
+        _current.source = previous
+
+
+def set_source(name):
+    _current.source = name
+
+
+# Literal strings and numbers, and values SQLAlchemy renders at execution.
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|__\[POSTCOMPILE_\w+\]")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Short hash of a statement with its literals blanked out, so executions
+    of the same query with other values (or pages) share it.
+    """
+    normalized = _SPACES.sub(" ", _LITERALS.sub("?", sql)).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def query_labels(sql):
+    return {"source": current_source(), "fingerprint": fingerprint(sql)}
+
+
+def instrument_engine(engine):
+    """
+    Count and time every statement engine executes and log the slow ones.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("query_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        labels = query_labels(statement)
+        inc("brick_queries_total", labels=labels)
+        observe("brick_query_execute_seconds", elapsed, labels)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            print(
+                "Slow query "
+                + json.dumps(
+                    dict(labels, elapsed_ms=round(elapsed * 1000, 1), database=engine.url.get_backend_name(), sql=statement[:1000])
+                )
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        statement = context.statement or ""
+        if context.connection is not None:
+            context.connection.info.pop("query_started", None)
+        labels = dict(query_labels(statement), error=type(context.original_exception).__name__)
+        inc("brick_query_errors_total", labels=labels)
+
+
+def snapshot():
+    """
+    This process's metrics, gauges included, as a JSON-able dict.
+    """
+    gauges = []
+    for collect in _collectors:
+        try:
+            gauges += [[name, _labels(labels), value] for name, labels, value in collect()]
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    with _lock:
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, labels, counts] for (name, labels), counts in _histograms.items()],
+            "gauges": gauges,
+        }
+
+
+def _merge(snapshots):
+    counters, histograms, gauges = {}, {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, counts in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(counts))
+            for i, count in enumerate(counts):
+                total[i] += count
+        for name, labels, value in snap["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0) + value
+    return counters, histograms, gauges
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def render(snapshots):
+    """
+    Metrics of one or more processes (summed) in the Prometheus text format.
+    """
+    counters, histograms, gauges = _merge(snapshots)
+    lines = []
+    names = list(METRICS) + sorted({name for name, _ in gauges} - set(METRICS))
+    for name in names:
+        kind, help_text = METRICS.get(name, ("gauge", ""))
+        if kind == "counter":
+            series = sorted((labels, value) for (n, labels), value in counters.items() if n == name)
+        elif kind == "histogram":
+            series = sorted((labels, counts) for (n, labels), counts in histograms.items() if n == name)
+        else:
+            series = sorted((labels, value) for (n, labels), value in gauges.items() if n == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in series:
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            buckets = BYTES_BUCKETS if name.endswith("_bytes") else SECONDS_BUCKETS
+            for bound, count in zip(buckets, value):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+class Exporter:
+    """
+    With several worker processes (gunicorn) a scrape only reaches one of
+    them, so each writes a snapshot of its metrics to shared_dir every
+    `interval` seconds, and export() adds up those of all live workers.
+    Without a shared_dir, export() returns this process's metrics only.
+    """
+
+    def __init__(self, shared_dir=None, interval=METRICS_FLUSH):
+        self.directory = os.path.join(shared_dir, "metrics") if shared_dir else None
+        self.interval = interval
+        self._thread = None
+        self._wake = threading.Event()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def start(self):
+        """
+        Start writing snapshots in the background (idempotent).
+        """
+        if self._thread is not None or not self.directory:
+            return self
+        self._thread = threading.Thread(target=self._run, name="metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            self._write()
+            self._wake.wait(self.interval)
+
+    def _write(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot(), f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Writing metrics snapshot failed: {e}")
+
+    def export(self):
+        """
+        Metrics of every live worker in the Prometheus text format.
+        """
+        snapshots = [snapshot()]
+        if self.directory:
+            for name in os.listdir(self.directory):
+                pid = name.partition(".")[0]
+                if not name.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    os.kill(int(pid), 0)
+                except ProcessLookupError:
+                    os.remove(path)
+                    continue
+                except PermissionError:
+                    pass
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    pass
+        return render(snapshots)
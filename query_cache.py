@@ -0,0 +1,401 @@
+# query_cache.py
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process coalescing
+    fcntl = None
+
+try:
+    import diskcache
+except ImportError:  # no shared result cache
+    diskcache = None
+
+
+# Returned by QueryCache.get when there is no usable entry, since None or 0
+# are perfectly good cached results.
+MISS = object()
+
+
+def estimate_size(value):
+    """
+    Approximate in-memory size of a cached result in bytes.
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """
+    Thread-safe result cache for warehouse queries.
+
+    Entries expire `ttl` seconds after they were stored. Once the cached
+    results take more than `max_bytes`, the least recently used entries are
+    evicted. Each entry is tagged with the tables it reads so that a write to
+    a table can drop every result derived from it.
+
+    Cached values are shared between callers and must not be mutated.
+
+    With a shared_dir (and diskcache installed) results are also kept in a
+    disk cache there, shared by every process of the host: a miss in memory
+    is looked up on disk before going to the warehouse. Invalidating a table
+    bumps its generation on disk, which makes the results read from it stale
+    in every process, in memory too.
+    """
+
+    def __init__(self, ttl=300, max_bytes=256 * 1024 * 1024, shared_dir=None, shared_max_bytes=None, namespace=""):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.namespace = namespace
+        # key -> (expires_at, size, tables, generations, value), oldest first
+        self._entries = OrderedDict()
+        self._keys_by_table = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "shared_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+        self._shared = None
+        if shared_dir and self.enabled:
+            if diskcache is None:
+                print("diskcache is not installed, results are only cached in memory")
+            else:
+                self._shared = diskcache.Cache(shared_dir, size_limit=shared_max_bytes or 4 * max_bytes)
+
+    def _generations(self, tables):
+        # Invalidation counters of tables, shared by every process.
+        if self._shared is None:
+            return ()
+        return tuple(self._shared.get(("generation", self.namespace, table_name), 0) for table_name in tables)
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, key):
+        """
+        Return the cached value for key, or MISS.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                self.stats["expirations"] += 1
+                entry = None
+        if entry is not None and entry[3] == self._generations(entry[2]):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+            return entry[4]
+        if entry is not None:
+            # A table it reads was written to by another process.
+            with self._lock:
+                self._remove(key)
+                self.stats["invalidations"] += 1
+
+        if self._shared is not None:
+            stored = self._shared.get((self.namespace, key))
+            if stored is not None:
+                tables, generations, value = stored
+                if generations == self._generations(tables):
+                    self._put_local(key, value, tables, generations)
+                    with self._lock:
+                        self.stats["shared_hits"] += 1
+                    return value
+        with self._lock:
+            self.stats["misses"] += 1
+        return MISS
+
+    def peek(self, key):
+        """
+        Like get, without counting a hit or miss or refreshing the entry.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic() or entry[3] != self._generations(entry[2]):
+            return MISS
+        return entry[4]
+
+    def put(self, key, value, tables=()):
+        """
+        Store value under key, tagged with the table names it was read from.
+        Values larger than the whole cache are not stored.
+        """
+        if not self.enabled:
+            return
+        tables = tuple(tables)
+        generations = self._generations(tables)
+        self._put_local(key, value, tables, generations)
+        if self._shared is not None:
+            try:
+                self._shared.set((self.namespace, key), (tables, generations, value), expire=self.ttl)
+            except Exception as e:
+                print(f"Not sharing a cached result: {e}")
+
+    def _put_local(self, key, value, tables, generations):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, tables, generations, value)
+            self._bytes += size
+            for table_name in tables:
+                self._keys_by_table.setdefault(table_name, set()).add(key)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def invalidate_table(self, table_name):
+        """
+        Drop every entry that reads from table_name, in every process
+        sharing the disk cache. Returns the number dropped from memory here.
+        """
+        if self._shared is not None:
+            self._shared.incr(("generation", self.namespace, table_name))
+        with self._lock:
+            keys = self._keys_by_table.pop(table_name, set())
+            for key in keys:
+                self._remove(key)
+            self.stats["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self._bytes = 0
+
+    def info(self):
+        """
+        Hit/miss/eviction counters plus the current size of the cache.
+        """
+        with self._lock:
+            info = dict(self.stats, entries=len(self._entries), bytes=self._bytes)
+        if self._shared is not None:
+            info.update(shared_entries=len(self._shared), shared_bytes=self._shared.volume())
+        return info
+
+    def _remove(self, key):
+        # Caller holds the lock.
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        for table_name in entry[2]:
+            keys = self._keys_by_table.get(table_name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table_name]
+
+
+class TableWrites:
+    """
+    Counts the writes made to each table through the app. With a shared_dir
+    (and diskcache installed) the counters are shared by every process of
+    the host, so state derived from a table in one process, like rollups or
+    the local replica, can tell it was written to in another.
+    """
+
+    def __init__(self, shared_dir=None, namespace=""):
+        self.namespace = namespace
+        self._counts = {}
+        self._lock = threading.Lock()
+        self._shared = None
+        if shared_dir:
+            if diskcache is None:
+                print("diskcache is not installed, writes are only seen by the process making them")
+            else:
+                self._shared = diskcache.Cache(shared_dir)
+
+    @property
+    def shared(self):
+        """
+        Whether the counts are seen by the other processes too.
+        """
+        return self._shared is not None
+
+    def record(self, table_name):
+        """
+        Count a write to table_name.
+        """
+        if self._shared is not None:
+            self._shared.incr((self.namespace, table_name))
+            return
+        with self._lock:
+            self._counts[table_name] = self._counts.get(table_name, 0) + 1
+
+    def count(self, table_name):
+        """
+        Number of writes to table_name recorded so far.
+        """
+        if self._shared is not None:
+            return self._shared.get((self.namespace, table_name), 0)
+        with self._lock:
+            return self._counts.get(table_name, 0)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, callers arriving while it runs wait for it and share its
+    result (or its exception), so a burst of identical queries reaches the
+    warehouse once.
+
+    With a shared_dir, the same happens across processes (e.g. gunicorn
+    workers on one host): the process running a key holds an exclusive
+    fcntl lock on a file for it and leaves the pickled result next to it;
+    the others wait for the lock and read that result. Results are only
+    read by callers that were already waiting, and removed after
+    `result_ttl` seconds. A process waits at most `wait_timeout` seconds for
+    another one's query (e.g. stuck, or on a hung session), then runs it
+    itself.
+
+    Followers that get one of the `retry_on` exceptions from the leader (e.g.
+    its request was cancelled) run the function themselves.
+    """
+
+    def __init__(self, shared_dir=None, namespace="", retry_on=(), result_ttl=60, wait_timeout=300):
+        self.shared_dir = shared_dir if fcntl is not None else None
+        self.namespace = namespace
+        self.retry_on = tuple(retry_on)
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+        self.stats = {"leaders": 0, "followers": 0, "shared": 0, "wait_timeouts": 0}
+        if self.shared_dir:
+            os.makedirs(self.shared_dir, exist_ok=True)
+
+    def do(self, key, fn, store=None):
+        """
+        Return fn(), or the result of the call to fn already running for key.
+        The caller that got the result for everyone (from fn or from another
+        process) also passes it to store, e.g. to cache it.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["followers"] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                if isinstance(flight.error, self.retry_on):
+                    return fn()
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = self._run_shared(key, fn) if self.shared_dir else fn()
+            if store is not None:
+                store(flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def _run_shared(self, key, fn):
+        digest = hashlib.sha1(repr((self.namespace, key)).encode()).hexdigest()
+        lock_path = os.path.join(self.shared_dir, f"{digest}.lock")
+        result_path = os.path.join(self.shared_dir, f"{digest}.pkl")
+        waiting_since = time.time()
+        with open(lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Another process runs this key: wait for it, then take its result.
+                if not self._wait_for_lock(lock_file):
+                    print(f"Gave up waiting {self.wait_timeout}s for another process to run {digest}, running it here")
+                    with self._lock:
+                        self.stats["wait_timeouts"] += 1
+                    return fn()
+                try:
+                    if os.path.getmtime(result_path) >= waiting_since:
+                        with open(result_path, "rb") as f:
+                            value = pickle.load(f)
+                        with self._lock:
+                            self.stats["shared"] += 1
+                        return value
+                except (OSError, EOFError, pickle.UnpicklingError):
+                    pass
+            # The lock is held until the result is written.
+            value = fn()
+            tmp_path = f"{result_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, result_path)
+            except Exception as e:
+                print(f"Not sharing result {digest}: {e}")
+        self._sweep()
+        return value
+
+    def _wait_for_lock(self, lock_file):
+        # Poll for the lock until wait_timeout; True once it is held.
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.01
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except BlockingIOError:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, 0.25)
+
+    def _sweep(self):
+        # Drop files nobody can be waiting on any more, about once per result_ttl.
+        now = time.time()
+        if now - self._swept_at < self.result_ttl:
+            return
+        self._swept_at = now
+        for name in os.listdir(self.shared_dir):
+            path = os.path.join(self.shared_dir, name)
+            try:
+                # An old lock file is only removed under a rare race, at worst
+                # costing one duplicate query.
+                if name.endswith((".pkl", ".lock")) and now - os.path.getmtime(path) > self.result_ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._flights))
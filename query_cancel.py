@@ -0,0 +1,182 @@
+# query_cancel.py
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+# Seconds a statement may run, fetching its rows included, before it is
+# cancelled. 0 means no timeout.
+QUERY_TIMEOUT = float(os.environ.get("BRICK_QUERY_TIMEOUT", 0))
+
+# The request (see QueryTracker.request) the queries of this thread belong to.
+_current = threading.local()
+
+
+class QueryCancelled(Exception):
+    """
+    Raised by a query cancelled because a newer request superseded it, or
+    by QueryTracker.cancel.
+    """
+
+
+class QueryTimeout(Exception):
+    """
+    Raised by a query cancelled for running longer than its timeout.
+    """
+
+
+def _cancel_cursor(cursor, dbapi_connection):
+    # Databricks cursors have cancel(); sqlite3 and DuckDB connections
+    # interrupt whatever statement they are running.
+    try:
+        if hasattr(cursor, "cancel"):
+            cursor.cancel()
+        elif hasattr(dbapi_connection, "interrupt"):
+            dbapi_connection.interrupt()
+    except Exception as e:
+        print(f"Cancelling a query failed: {e}")
+
+
+class _Request:
+    def __init__(self, slot, key):
+        self.slot = slot
+        self.key = key
+        self.cancelled = False
+        self._cursors = {}  # DBAPI connection -> cursor running on it
+        self._lock = threading.Lock()
+
+    def attach(self, dbapi_connection, cursor):
+        with self._lock:
+            self._cursors[dbapi_connection] = cursor
+            cancelled = self.cancelled
+        # Cancelled between the check in before_cursor_execute and now.
+        if cancelled:
+            _cancel_cursor(cursor, dbapi_connection)
+
+    def detach(self, dbapi_connection):
+        with self._lock:
+            self._cursors.pop(dbapi_connection, None)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            cursors = list(self._cursors.items())
+        for dbapi_connection, cursor in cursors:
+            _cancel_cursor(cursor, dbapi_connection)
+
+
+class QueryTracker:
+    """
+    The in-flight requests of each slot (e.g. one user session's grid), so a
+    newer request can cancel the statements of the ones it supersedes
+    instead of leaving them running on the warehouse.
+
+    Statements are tied to the request active in the thread that runs them
+    by the engine events track_engine installs.
+    """
+
+    def __init__(self):
+        self._slots = {}  # slot -> [_Request]
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def request(self, slot, key=None):
+        """
+        Run the queries of the block as a request of slot. Requests of the
+        same slot with a different key are cancelled first; their queries
+        raise QueryCancelled. Requests with the same key, e.g. two blocks of
+        the same grid query, run side by side.
+        """
+        request = _Request(slot, key)
+        with self._lock:
+            running = self._slots.setdefault(slot, [])
+            superseded = [other for other in running if other.key != key]
+            running[:] = [other for other in running if other.key == key] + [request]
+        for other in superseded:
+            other.cancel()
+        if superseded:
+            print(f"Cancelled {len(superseded)} superseded request(s) of {slot}")
+
+        previous = getattr(_current, "request", None)
+        _current.request = request
+        try:
+            yield request
+        finally:
+            _current.request = previous
+            with self._lock:
+                running = self._slots.get(slot, [])
+                if request in running:
+                    running.remove(request)
+                if not running:
+                    self._slots.pop(slot, None)
+
+    def cancel(self, slot):
+        """
+        Cancel every in-flight request of slot. Returns how many there were.
+        """
+        with self._lock:
+            running = self._slots.pop(slot, [])
+        for request in running:
+            request.cancel()
+        return len(running)
+
+    def stats(self):
+        with self._lock:
+            return {"slots": len(self._slots), "requests": sum(len(running) for running in self._slots.values())}
+
+
+def track_engine(engine, timeout=QUERY_TIMEOUT):
+    """
+    Install the events that tie engine's statements to the current request
+    (see QueryTracker.request), cancel them after `timeout` seconds, and
+    turn the errors of cancelled statements into QueryCancelled / QueryTimeout.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        info = conn.info
+        dbapi_connection = conn.connection.dbapi_connection
+        timer = info.pop("query_timer", None)
+        if timer is not None:
+            timer.cancel()
+        info.pop("query_timed_out", None)
+
+        request = getattr(_current, "request", None)
+        if request is not None:
+            if request.cancelled:
+                raise QueryCancelled(f"Request of {request.slot} was cancelled")
+            info["query_request"] = request
+            request.attach(dbapi_connection, cursor)
+
+        if timeout:
+
+            def expire():
+                info["query_timed_out"] = True
+                _cancel_cursor(cursor, dbapi_connection)
+
+            timer = threading.Timer(timeout, expire)
+            timer.daemon = True
+            info["query_timer"] = timer
+            timer.start()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        # Returning an exception makes SQLAlchemy raise it instead.
+        info = context.connection.info if context.connection is not None else {}
+        if info.pop("query_timed_out", False):
+            return QueryTimeout(f"Query cancelled after {timeout:g} s")
+        request = getattr(_current, "request", None)
+        if request is not None and request.cancelled:
+            return QueryCancelled(f"Request of {request.slot} was cancelled")
+        return None
+
+    @event.listens_for(engine, "checkin")
+    def checkin(dbapi_connection, connection_record):
+        # The statement is over once its session goes back to the pool.
+        timer = connection_record.info.pop("query_timer", None)
+        if timer is not None:
+            timer.cancel()
+        request = connection_record.info.pop("query_request", None)
+        if request is not None:
+            request.detach(dbapi_connection)
@@ -0,0 +1,388 @@
+# replica.py
+import atexit
+import json
+import os
+import threading
+import time
+import zlib
+
+import pandas as pd
+from sqlalchemy import func, select
+
+from export import parquet_chunks
+from keyset import from_json, to_json
+
+# Hot tables copied to the local replica, as a comma-separated list of
+# table[:modified_column[:key_column]]. Empty disables the replica.
+REPLICA_TABLES = os.environ.get("BRICK_REPLICA_TABLES", "")
+
+# Directory holding one Parquet file per table plus the DuckDB database
+# (replica.duckdb) with a view over each of them.
+REPLICA_DIR = os.environ.get("BRICK_REPLICA_DIR", "replica")
+
+# Seconds between syncs, and how old a table's copy may get before queries
+# go back to the warehouse.
+REPLICA_SYNC = float(os.environ.get("BRICK_REPLICA_SYNC", 300))
+REPLICA_MAX_STALENESS = float(os.environ.get("BRICK_REPLICA_MAX_STALENESS", 900))
+
+# Seconds between reloads of the replica's state by processes that only
+# read the copies another one syncs.
+STATE_RELOAD = 5
+
+# Rows fetched per batch while copying a table.
+SYNC_BATCH_ROWS = 50000
+
+
+class ReplicaTable:
+    """
+    A table copied to the replica. With a modified_column (e.g. updated_at)
+    syncs only fetch the rows whose key has a row modified since the last
+    sync and replace every local row with those keys; without one every sync
+    copies the whole table.
+    """
+
+    def __init__(self, name, modified_column=None, key_column="transaction_id"):
+        self.name = name
+        self.modified_column = modified_column
+        self.key_column = key_column
+
+
+def parse_replica_tables(spec=REPLICA_TABLES):
+    """
+    ReplicaTables from "table[:modified_column[:key_column]],...".
+    """
+    tables = []
+    for entry in spec.split(","):
+        parts = [part.strip() for part in entry.split(":")]
+        if parts[0]:
+            tables.append(ReplicaTable(*[part or None for part in parts]))
+    return tables
+
+
+def _sql_string(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class Replica:
+    """
+    Local copy of a few hot tables, kept as Parquet files and queried through
+    DuckDB by a second BrickSQLAlchemy (`local`), so it has the same
+    get_data_query / check API as the warehouse.
+
+    A background thread (start) syncs every `sync_interval` seconds. A table
+    is only served locally while its last sync is less than `max_staleness`
+    seconds old and it wasn't written to since (see invalidate), by this
+    process or another one sharing brick.writes (see check_writes).
+
+    Without `sync` this process only reads the copies another process syncs
+    to the same directory, through views in an in-memory DuckDB database: a
+    table is served while the brick.writes count of its table is the one its
+    copy was made at. That needs writes counted in a shared directory.
+    """
+
+    def __init__(
+        self,
+        brick,
+        tables,
+        directory=REPLICA_DIR,
+        sync_interval=REPLICA_SYNC,
+        max_staleness=REPLICA_MAX_STALENESS,
+        sync=True,
+    ):
+        self.brick = brick
+        self.tables = {table.name: table for table in tables}
+        self.directory = os.path.abspath(directory)
+        self.sync_interval = sync_interval
+        self.max_staleness = max_staleness
+        self.sync_tables = sync
+        if not sync and not brick.writes.shared:
+            print("The replica is synced by another process and can't be shared with this one, not using it")
+            self.tables = {}
+        os.makedirs(self.directory, exist_ok=True)
+        if sync:
+            self.database_url = f"duckdb:///{os.path.join(self.directory, 'replica.duckdb')}"
+        else:
+            # The database file is the syncing process's; DuckDB lets only one
+            # process open it. A named in-memory database is shared by the
+            # connections of this process.
+            self.database_url = f"duckdb:///:memory:replica_{zlib.crc32(self.directory.encode())}"
+        # Same class as the warehouse brick, without a replica or rollups of its own.
+        self.local = type(brick)(
+            self.database_url,
+            schema_cache_path=None,
+            rules=brick.rules,
+            warm_sessions=0,
+            rollups=[],
+            replica_tables=[],
+        )
+        self._state_path = os.path.join(self.directory, "state.json")
+        # name -> {"synced_at", "watermark", "version", "writes"}
+        self._state = self._load_state()
+        # For readers: state.json's and each Parquet file's mtime when last loaded.
+        self._loaded = {}
+        self._loaded_at = None
+        self._dirty = set()
+        # table_name -> brick.writes count the last sync has seen
+        self._write_counts = {}
+        self._sync_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        if not sync:
+            self._reload_state()
+
+    def _load_state(self):
+        if not os.path.exists(self._state_path):
+            return {}
+        try:
+            with open(self._state_path) as f:
+                state = json.load(f)
+        except Exception as e:
+            print(f"Ignoring replica state {self._state_path}: {e}")
+            return {}
+        return {
+            name: dict(entry, watermark=from_json(entry.get("watermark")))
+            for name, entry in state.items()
+            if os.path.exists(self._parquet_path(name))
+        }
+
+    def _reload_state(self):
+        # Pick up the syncing process's state, and point the views at the
+        # Parquet files it has replaced since the last reload.
+        self._loaded_at = time.monotonic()
+        mtime = self._mtime(self._state_path)
+        if mtime == self._loaded.get(None):
+            return
+        self._loaded[None] = mtime
+        self._state = {name: entry for name, entry in self._load_state().items() if name in self.tables}
+        for name in self._state:
+            path = self._parquet_path(name)
+            mtime = self._mtime(path)
+            if mtime != self._loaded.get(name):
+                self._loaded[name] = mtime
+                try:
+                    self._create_view(name, path)
+                except Exception as e:
+                    print(f"Reading the replica of {name} failed: {e}")
+                    self._state.pop(name)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def _save_state(self):
+        tmp_path = f"{self._state_path}.{os.getpid()}.tmp"
+        # Watermarks are dates more often than not; keep their type.
+        state = {name: dict(entry, watermark=to_json(entry.get("watermark"))) for name, entry in self._state.items()}
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self._state_path)
+
+    def _parquet_path(self, table_name):
+        return os.path.join(self.directory, f"{table_name}.parquet")
+
+    def start(self):
+        """
+        Start the background sync thread (idempotent). Does nothing without
+        `sync`.
+        """
+        if self._thread is not None or not self.tables or not self.sync_tables:
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="replica-sync", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._stopping = True
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while not self._stopping:
+            self.sync()
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+
+    def is_fresh(self, table_name):
+        entry = self._state.get(table_name)
+        return (
+            entry is not None
+            and table_name not in self._dirty
+            and (self.sync_tables or entry.get("writes") == self.brick.writes.count(table_name))
+            and time.time() - entry["synced_at"] <= self.max_staleness
+        )
+
+    def serves(self, *table_names):
+        """
+        Whether every one of table_names can be read from the replica now.
+        """
+        self.check_writes()
+        return all(name in self.tables and self.is_fresh(name) for name in table_names)
+
+    def invalidate(self, table_name):
+        """
+        Stop serving table_name locally until its next (full) sync, e.g.
+        after rows of it were written through the warehouse.
+        """
+        if table_name in self.tables and self.sync_tables:
+            self._dirty.add(table_name)
+            self._wake.set()
+
+    def check_writes(self):
+        """
+        Invalidate the tables written to since the last call, by this
+        process or another one. Without `sync`, reload the copies the
+        syncing process has made since.
+        """
+        if not self.sync_tables:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at >= STATE_RELOAD:
+                self._reload_state()
+            return
+        for table_name in self.tables:
+            count = self.brick.writes.count(table_name)
+            if self._write_counts.setdefault(table_name, count) != count:
+                self._write_counts[table_name] = count
+                self.invalidate(table_name)
+
+    def sync(self, table_name=None):
+        """
+        Sync one table (or all of them) from the warehouse. Returns the
+        number of tables synced.
+        """
+        self.check_writes()
+        names = [table_name] if table_name else list(self.tables)
+        synced = 0
+        with self._sync_lock:
+            for name in names:
+                try:
+                    self._sync_one(self.tables[name])
+                    synced += 1
+                except Exception as e:
+                    print(f"Syncing replica of {name} failed: {e}")
+        return synced
+
+    def _sync_one(self, spec):
+        start = time.perf_counter()
+        entry = self._state.get(spec.name)
+        # An edit made through the grid doesn't touch the modified column,
+        # so it needs a full copy.
+        dirty = spec.name in self._dirty
+        full = entry is None or dirty or not spec.modified_column
+        self._dirty.discard(spec.name)
+        synced_at = time.time()
+        # Counted before reading, so the copy has seen at least these writes.
+        writes = self.brick.writes.count(spec.name)
+
+        version = self._delta_version(spec.name)
+        if entry is not None and not dirty and version is not None and version == entry.get("version"):
+            entry.update(synced_at=synced_at, writes=writes)
+            self._save_state()
+            return
+
+        table = self.brick._internal_schema(spec.name)
+        watermark = None
+        if spec.modified_column:
+            with self.brick._connect() as conn:
+                watermark = conn.execute(select(func.max(table.c[spec.modified_column]))).scalar()
+
+        path = self._parquet_path(spec.name)
+        if full:
+            rows = self._write_parquet(select(table), path)
+            self._create_view(spec.name, path)
+        else:
+            modified = table.c[spec.modified_column] > entry["watermark"]
+            key = table.c[spec.key_column]
+            stmt = select(table).where(key.in_(select(key).where(modified)))
+            delta_path = f"{path}.delta"
+            rows = self._write_parquet(stmt, delta_path)
+            if rows:
+                self._merge_delta(spec, path, delta_path)
+            os.remove(delta_path)
+
+        if spec.name in self._dirty:
+            return
+        self._state[spec.name] = {"synced_at": synced_at, "watermark": watermark, "version": version, "writes": writes}
+        self._save_state()
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"{'Copied' if full else 'Synced'} {rows} row(s) of {spec.name} to the replica in {elapsed_ms} ms")
+
+    def _delta_version(self, table_name):
+        # Latest Delta table version, so unchanged tables are skipped. None
+        # when it can't be told (not Databricks, or not a Delta table).
+        if self.brick.engine.dialect.name != "databricks":
+            return None
+        preparer = self.brick.engine.dialect.identifier_preparer
+        try:
+            with self.brick._connect() as conn:
+                row = conn.exec_driver_sql(f"DESCRIBE HISTORY {preparer.quote(table_name)} LIMIT 1").first()
+            return row.version if row is not None else None
+        except Exception:
+            return None
+
+    def _write_parquet(self, stmt, path):
+        """
+        Stream the rows of stmt from the warehouse into a Parquet file at
+        path (written to a temporary file, then renamed). Returns the row count.
+        """
+        rows = 0
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self.brick._connect() as conn, open(tmp_path, "wb") as f:
+            conn = conn.execution_options(stream_results=self.brick.engine.dialect.supports_server_side_cursors)
+            result = conn.execute(stmt)
+
+            def batches():
+                nonlocal rows
+                empty = True
+                for batch in self.brick._fetch_batches(result, SYNC_BATCH_ROWS):
+                    empty = False
+                    rows += len(batch)
+                    yield batch
+                if empty:
+                    yield pd.DataFrame(columns=list(result.keys()))
+
+            for chunk in parquet_chunks(batches()):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+        return rows
+
+    def _merge_delta(self, spec, path, delta_path):
+        # Replace every local row whose key has changed by the fetched rows.
+        preparer = self.local.engine.dialect.identifier_preparer
+        key = preparer.quote(spec.key_column)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with self.local._connect() as conn:
+            conn.exec_driver_sql(
+                f"COPY (SELECT * FROM read_parquet({_sql_string(path)}) "
+                f"ANTI JOIN read_parquet({_sql_string(delta_path)}) AS delta USING ({key}) "
+                f"UNION ALL BY NAME SELECT * FROM read_parquet({_sql_string(delta_path)})) "
+                f"TO {_sql_string(tmp_path)} (FORMAT parquet)"
+            )
+            conn.commit()
+        os.replace(tmp_path, path)
+        self._create_view(spec.name, path)
+
+    def _create_view(self, table_name, path):
+        preparer = self.local.engine.dialect.identifier_preparer
+        with self.local._connect() as conn:
+            conn.exec_driver_sql(
+                f"CREATE OR REPLACE VIEW {preparer.quote(table_name)} AS SELECT * FROM read_parquet({_sql_string(path)})"
+            )
+            conn.commit()
+        # The view may have new columns, and cached results are stale.
+        self.local.refresh_table(table_name)
+
+    def stats(self):
+        """
+        Last sync time and freshness of every replicated table.
+        """
+        return {
+            name: dict(self._state.get(name) or {}, fresh=self.is_fresh(name), dirty=name in self._dirty)
+            for name in self.tables
+        }
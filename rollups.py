@@ -0,0 +1,462 @@
+# rollups.py
+import atexit
+import json
+import os
+import pickle
+import threading
+import time
+
+import pandas as pd
+from sqlalchemy import (
+    Column,
+    Float,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    column,
+    create_engine,
+    func,
+    inspect,
+    select,
+)
+from sqlalchemy import table as table_clause
+
+# Rollup definitions. Without this file there are no rollups and every
+# aggregate query goes to the warehouse.
+ROLLUPS_PATH = os.environ.get(
+    "BRICK_ROLLUPS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rollups.json")
+)
+
+# Where rollups are kept: any SQLAlchemy URL, e.g. a local SQLite or DuckDB file.
+ROLLUP_STORE = os.environ.get("BRICK_ROLLUP_STORE", "sqlite:///rollups.db")
+
+# Seconds between incremental refreshes.
+ROLLUP_REFRESH = float(os.environ.get("BRICK_ROLLUP_REFRESH", 300))
+
+# Seconds without edits to a table before its rollups are rebuilt, so a burst
+# of edits costs one rebuild (a GROUP BY over the whole table) instead of one
+# per saved batch. Tables edited all the time are rebuilt every
+# BRICK_ROLLUP_REFRESH seconds at most.
+ROLLUP_REBUILD_DELAY = float(os.environ.get("BRICK_ROLLUP_REBUILD_DELAY", 60))
+
+# Seconds between reloads of the store's state by processes that only read
+# the rollups another one builds.
+STATE_RELOAD = 5
+
+# Per-measure partial aggregates kept in a rollup, and how they combine
+# when rows of the rollup are grouped further.
+PARTIALS = {"sum": "sum", "count": "sum", "min": "min", "max": "max"}
+
+
+class Rollup:
+    """
+    GROUP BY `dimensions` of `table`, keeping the row count and the sum,
+    non-null count, min and max of every measure column per group.
+
+    Any aggregate query grouping by a subset of the dimensions, filtering
+    only on dimensions and aggregating measures with SUM, AVG, COUNT, MIN or
+    MAX can be answered by grouping the rollup further.
+
+    New rows are folded in incrementally: only rows whose `watermark` column
+    is past the largest value seen so far are read. That assumes rows are
+    appended, not updated in place; anything else needs a full rebuild.
+    """
+
+    def __init__(self, name, table, dimensions, measures, watermark):
+        if not dimensions:
+            raise ValueError(f"Rollup {name} needs at least one dimension")
+        self.name = name
+        self.table_name = table
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.watermark = watermark
+        self.store_table_name = f"rollup_{name}"
+        # The stored rollup as a lightweight table clause to query against.
+        self.store_table = table_clause(
+            self.store_table_name,
+            *[column(name) for name in [*self.dimensions, "_rows", *self.partial_columns(), "_watermark"]],
+        )
+
+    def spec(self):
+        return {
+            "name": self.name,
+            "table": self.table_name,
+            "dimensions": self.dimensions,
+            "measures": self.measures,
+            "watermark": self.watermark,
+        }
+
+    def partial_columns(self):
+        return [f"{partial}_{measure}" for measure in self.measures for partial in PARTIALS]
+
+    def can_answer(self, group_by, aggregate_columns, filter_columns=()):
+        dims = set(self.dimensions)
+        return (
+            set(group_by) <= dims
+            and set(filter_columns) <= dims
+            and all(agg["column"] in self.measures for agg in aggregate_columns)
+            and all(agg["agg"].upper() in ("SUM", "AVG", "COUNT", "MIN", "MAX") for agg in aggregate_columns)
+        )
+
+    def delta_select(self, table, watermark=None):
+        """
+        Partial aggregates of the base table rows past `watermark` (all rows
+        if None), one row per group, in the rollup's column layout.
+        """
+        dims = [table.c[name] for name in self.dimensions]
+        partials = []
+        for measure in self.measures:
+            col = table.c[measure]
+            partials += [
+                func.sum(col).label(f"sum_{measure}"),
+                func.count(col).label(f"count_{measure}"),
+                func.min(col).label(f"min_{measure}"),
+                func.max(col).label(f"max_{measure}"),
+            ]
+        stmt = select(
+            *dims,
+            func.count().label("_rows"),
+            *partials,
+            func.max(table.c[self.watermark]).label("_watermark"),
+        ).group_by(*dims)
+        if watermark is not None:
+            stmt = stmt.where(table.c[self.watermark] > bindparam("watermark", watermark))
+        return stmt
+
+    def merge(self, stored, delta):
+        """
+        Fold a delta (from delta_select) into the stored rollup rows.
+        """
+        if stored is None or stored.empty:
+            return delta
+        combined = pd.concat([stored, delta], ignore_index=True)
+        grouped = combined.groupby(self.dimensions, dropna=False, sort=False)
+        parts = [grouped[["_rows"]].sum()]
+        for partial, combine in PARTIALS.items():
+            cols = [f"{partial}_{measure}" for measure in self.measures]
+            # min_count keeps an all-NULL sum NULL, as in SQL.
+            parts.append(grouped[cols].sum(min_count=1) if combine == "sum" else getattr(grouped[cols], combine)())
+        parts.append(grouped[["_watermark"]].max())
+        return pd.concat(parts, axis=1).reset_index()[list(delta.columns)]
+
+    def aggregate(self, agg_func, measure):
+        """
+        The aggregate agg_func(measure) of the base table, computed from the
+        rollup's partials and labelled like BrickSQLAlchemy's aggregates.
+        """
+        c = self.store_table.c
+        label = f"{agg_func}_{measure}"
+        if agg_func == "SUM":
+            return func.sum(c[f"sum_{measure}"]).label(label)
+        if agg_func == "COUNT":
+            return func.sum(c[f"count_{measure}"]).label(label)
+        if agg_func == "MIN":
+            return func.min(c[f"min_{measure}"]).label(label)
+        if agg_func == "MAX":
+            return func.max(c[f"max_{measure}"]).label(label)
+        if agg_func == "AVG":
+            return (func.sum(c[f"sum_{measure}"]) * 1.0 / func.nullif(func.sum(c[f"count_{measure}"]), 0)).label(label)
+        raise ValueError(f"Rollup {self.name} can't compute {agg_func}")
+
+
+class RollupManager:
+    """
+    Keeps the rollups of a BrickSQLAlchemy up to date in a local store and
+    picks the one that can answer an aggregate query.
+
+    A rollup is only used once it has been built, and not after a write to
+    its table (see invalidate) until it has been rebuilt. Writes made by any
+    process sharing brick.writes count (see check_writes). A background
+    thread (start) refreshes every `refresh_interval` seconds, and rebuilds
+    the rollups of an edited table once it had no edits for `rebuild_delay`
+    seconds.
+
+    Without `build` this process only reads the rollups another process
+    builds in the same store: a rollup is used while the brick.writes count
+    of its table is the one it was built at. That needs writes counted in a
+    shared directory, and a store several processes can open (not DuckDB).
+    """
+
+    def __init__(
+        self,
+        brick,
+        rollups,
+        store_url=ROLLUP_STORE,
+        refresh_interval=ROLLUP_REFRESH,
+        rebuild_delay=ROLLUP_REBUILD_DELAY,
+        build=True,
+    ):
+        self.brick = brick
+        self.rollups = {rollup.name: rollup for rollup in rollups}
+        self.engine = create_engine(store_url)
+        self.refresh_interval = refresh_interval
+        self.rebuild_delay = rebuild_delay
+        self.build = build
+        # name -> {"watermark", "rows", "refreshed_at", "writes"} for rollups ready to use
+        self._ready = {}
+        self._loaded_at = None
+        self.reading = build or (brick.writes.shared and self.engine.dialect.name != "duckdb")
+        if not self.reading:
+            print("Rollups are built by another process and can't be shared with this one, not using them")
+            self.rollups = {}
+        self._state_table = Table(
+            "_rollup_state",
+            MetaData(),
+            Column("name", String, primary_key=True),
+            Column("spec", String),
+            Column("watermark", LargeBinary),
+            Column("writes", Integer),
+            Column("rows", Integer),
+            Column("refreshed_at", Float),
+        )
+        if self.rollups and self.build:
+            self._create_state_table()
+        # name -> (time of the first, time of the last) write seen since the
+        # rollup was last built, for rollups waiting for a rebuild
+        self._needs_rebuild = {}
+        # table_name -> brick.writes count the ready rollups have seen
+        self._write_counts = {}
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        if self.rollups:
+            self._load_state()
+
+    def _create_state_table(self):
+        # A store written before the table had all its columns is rebuilt.
+        if inspect(self.engine).has_table(self._state_table.name):
+            columns = {col["name"] for col in inspect(self.engine).get_columns(self._state_table.name)}
+            if not set(self._state_table.c.keys()) <= columns:
+                self._state_table.drop(self.engine)
+        self._state_table.create(self.engine, checkfirst=True)
+
+    def _load_state(self):
+        # Rollups built by a previous run, or by the building process, are
+        # usable if their definition is unchanged.
+        self._loaded_at = time.monotonic()
+        try:
+            with self.engine.connect() as conn:
+                saved = {row.name: row for row in conn.execute(select(self._state_table))}
+        except Exception as e:
+            # E.g. the building process hasn't created the store yet.
+            print(f"Reading the rollup state failed: {e}")
+            saved = {}
+        ready = {}
+        for name, rollup in self.rollups.items():
+            row = saved.get(name)
+            if row is None or json.loads(row.spec) != rollup.spec():
+                continue
+            ready[name] = {
+                "watermark": pickle.loads(row.watermark),
+                "rows": row.rows,
+                "refreshed_at": row.refreshed_at,
+                "writes": row.writes,
+            }
+        self._ready = ready
+
+    def start(self):
+        """
+        Start the background refresh thread (idempotent). Does nothing
+        without `build`.
+        """
+        if self._thread is not None or not self.rollups or not self.build:
+            return self
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="rollups", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        self._stopping = True
+        self._wake.set()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        next_refresh = 0
+        while not self._stopping:
+            self.check_writes()
+            due = self._due_rebuilds()
+            if time.monotonic() >= next_refresh:
+                # Rollups still being edited wait for their rebuild.
+                names = [name for name in self.rollups if name not in self._needs_rebuild or name in due]
+                next_refresh = time.monotonic() + self.refresh_interval
+            else:
+                names = due
+            if names:
+                self.refresh(names=names)
+            wait = next_refresh - time.monotonic()
+            for first, last in list(self._needs_rebuild.values()):
+                wait = min(wait, self._rebuild_at(first, last) - time.monotonic())
+            self._wake.wait(max(wait, 0.1))
+            self._wake.clear()
+
+    def _rebuild_at(self, first, last):
+        # When a rollup invalidated by writes at first..last gets rebuilt.
+        return min(last + self.rebuild_delay, first + self.refresh_interval)
+
+    def _due_rebuilds(self):
+        now = time.monotonic()
+        return [name for name, (first, last) in list(self._needs_rebuild.items()) if self._rebuild_at(first, last) <= now]
+
+    def invalidate(self, table_name):
+        """
+        Stop using the rollups of table_name until they are rebuilt, e.g.
+        after rows of it were edited in place, and schedule the rebuild.
+        """
+        names = [name for name, rollup in self.rollups.items() if rollup.table_name == table_name]
+        now = time.monotonic()
+        for name in names:
+            self._ready.pop(name, None)
+            if self.build:
+                first, _ = self._needs_rebuild.get(name, (now, now))
+                self._needs_rebuild[name] = (first, now)
+        if names and self.build:
+            self._wake.set()
+
+    def check_writes(self):
+        """
+        Invalidate the rollups of tables written to since the last call, by
+        this process or another one. Without `build`, reload the rollups the
+        building process has rebuilt since.
+        """
+        if not self.build:
+            if self._loaded_at is not None and time.monotonic() - self._loaded_at >= STATE_RELOAD:
+                self._load_state()
+            return
+        for table_name in {rollup.table_name for rollup in self.rollups.values()}:
+            count = self.brick.writes.count(table_name)
+            if self._write_counts.setdefault(table_name, count) != count:
+                self._write_counts[table_name] = count
+                self.invalidate(table_name)
+
+    def refresh(self, name=None, full=False, names=None):
+        """
+        Bring one rollup (or those in names, or all of them) up to date.
+        Returns the number of rollups refreshed.
+        """
+        self.check_writes()
+        if names is None:
+            names = [name] if name else list(self.rollups)
+        refreshed = 0
+        with self._refresh_lock:
+            for rollup_name in names:
+                try:
+                    self._refresh_one(self.rollups[rollup_name], full=full)
+                    refreshed += 1
+                except Exception as e:
+                    print(f"Refreshing rollup {rollup_name} failed: {e}")
+        return refreshed
+
+    def _refresh_one(self, rollup, full=False):
+        start = time.perf_counter()
+        rebuild = full or rollup.name in self._needs_rebuild or rollup.name not in self._ready
+        # Clear the flag before reading, so an edit during the refresh triggers another.
+        self._needs_rebuild.pop(rollup.name, None)
+        watermark = None if rebuild else self._ready[rollup.name]["watermark"]
+        # Counted before reading, so the rollup has seen at least these writes.
+        writes = self.brick.writes.count(rollup.table_name)
+
+        table = self.brick._internal_schema(rollup.table_name)
+        stmt = rollup.delta_select(table, watermark)
+        with self.brick._connect() as conn:
+            delta = self.brick._fetch_df(conn.execute(stmt))
+
+        if delta.empty and not rebuild:
+            state = self._ready.get(rollup.name)
+            if state is not None:
+                state["refreshed_at"] = time.time()
+                with self.engine.begin() as conn:
+                    conn.execute(
+                        self._state_table.update()
+                        .where(self._state_table.c.name == rollup.name)
+                        .values(refreshed_at=state["refreshed_at"])
+                    )
+            return
+        stored = None
+        if not rebuild:
+            with self.engine.connect() as conn:
+                stored = pd.read_sql(select(rollup.store_table), conn)
+        rows = rollup.merge(stored, delta)
+        if not rows.empty:
+            watermark = _python_value(rows["_watermark"].max())
+        state = {"watermark": watermark, "rows": len(rows), "refreshed_at": time.time(), "writes": writes}
+        with self.engine.begin() as conn:
+            rows.to_sql(rollup.store_table_name, conn, if_exists="replace", index=False)
+            conn.execute(self._state_table.delete().where(self._state_table.c.name == rollup.name))
+            conn.execute(
+                self._state_table.insert().values(
+                    dict(state, name=rollup.name, spec=json.dumps(rollup.spec()), watermark=pickle.dumps(watermark))
+                )
+            )
+        if rollup.name in self._needs_rebuild:
+            return
+        self._ready[rollup.name] = state
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(
+            f"{'Rebuilt' if rebuild else 'Refreshed'} rollup {rollup.name} with {len(delta)} group(s) "
+            f"of new rows, {len(rows)} group(s) in total, in {elapsed_ms} ms"
+        )
+
+    def route(self, table_name, group_by, aggregate_columns, filter_columns=()):
+        """
+        The smallest ready rollup of table_name that can answer an aggregate
+        query, or None.
+        """
+        if not group_by or not aggregate_columns:
+            return None
+        self.check_writes()
+        candidates = [
+            (self._ready[name]["rows"], name)
+            for name, rollup in self.rollups.items()
+            if rollup.table_name == table_name
+            and self._usable(name)
+            and rollup.can_answer(group_by, aggregate_columns, filter_columns)
+        ]
+        if not candidates:
+            return None
+        return self.rollups[min(candidates)[1]]
+
+    def _usable(self, name):
+        state = self._ready.get(name)
+        if state is None:
+            return False
+        return self.build or state["writes"] == self.brick.writes.count(self.rollups[name].table_name)
+
+    def stats(self):
+        """
+        Ready rollups with their size and last refresh time.
+        """
+        return {
+            name: dict(self._ready.get(name, {"rows": None, "refreshed_at": None}), ready=self._usable(name))
+            for name in self.rollups
+        }
+
+
+def _python_value(value):
+    # numpy/pandas scalars -> plain Python values the drivers can bind.
+    if pd.isna(value):
+        return None
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime()
+    if hasattr(value, "item"):
+        return value.item()
+    return value
+
+
+def load_rollups(path=ROLLUPS_PATH):
+    """
+    Rollup definitions from a JSON list like
+    [{"name": ..., "table": ..., "dimensions": [...], "measures": [...], "watermark": ...}],
+    or none if the file doesn't exist.
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [Rollup(**spec) for spec in json.load(f)]
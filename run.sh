@@ -13,6 +13,12 @@ source venv/bin/activate
 # echo "Installing requirements..."
 pip install -r requirements.txt
 
-# Run the FastAPI application
-echo "Starting FastAPI application..."
-python3 app.py
\ No newline at end of file
+# Run the application: gunicorn with several workers, or Flask's
+# development server with DEV_SERVER=1
+if [ "${DEV_SERVER:-0}" = "1" ]; then
+    echo "Starting development server..."
+    python3 app.py
+else
+    echo "Starting gunicorn..."
+    exec gunicorn -c gunicorn.conf.py wsgi:application
+fi
\ No newline at end of file
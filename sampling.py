@@ -0,0 +1,122 @@
+# sampling.py
+import math
+import os
+
+from sqlalchemy import func, literal_column, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.selectable import TableSample
+
+# Percentage of rows read in sampled mode.
+SAMPLE_PERCENT = float(os.environ.get("BRICK_SAMPLE_PERCENT", 1))
+
+# Seed of the sample, so every block of a sampled grid comes from the same rows.
+SAMPLE_SEED = 42
+
+# Dialects with a TABLESAMPLE clause. Others filter on a pseudo-random value.
+TABLESAMPLE_DIALECTS = ("databricks", "duckdb", "postgresql")
+
+# Rendered inline: some warehouses only take a constant percentile.
+MEDIAN_FRACTION = literal_column("0.5")
+
+# z for the 95% error bounds reported with sampled aggregates.
+Z_95 = 1.96
+
+
+@compiles(TableSample, "databricks")
+def _databricks_tablesample(element, compiler, **kw):
+    # Spark SQL puts the sample between the table and its alias.
+    kw["asfrom"] = True
+    return "%s TABLESAMPLE (%s PERCENT) REPEATABLE (%s) AS %s" % (
+        compiler.process(element.element, **kw),
+        compiler.process(element.sampling.clauses.clauses[0], **kw),
+        compiler.process(element.seed, **kw),
+        compiler.preparer.format_alias(element, element.name),
+    )
+
+
+@compiles(TableSample, "duckdb")
+def _duckdb_tablesample(element, compiler, **kw):
+    # A bare number would be a row count in DuckDB.
+    kw["asfrom"] = True
+    return "%s TABLESAMPLE bernoulli(%s PERCENT) REPEATABLE (%s)" % (
+        compiler.visit_alias(element, **kw),
+        compiler.process(element.sampling.clauses.clauses[0], **kw),
+        compiler.process(element.seed, **kw),
+    )
+
+
+def sampled(table, percent, dialect_name):
+    """
+    A FROM clause reading about `percent`% of the rows of table, with the
+    same columns (use it in place of table).
+    """
+    name = f"{table.name}_sample"
+    if dialect_name in TABLESAMPLE_DIALECTS:
+        return table.tablesample(
+            func.bernoulli(literal_column(repr(float(percent)))),
+            name=name,
+            seed=literal_column(str(SAMPLE_SEED)),
+        )
+    if dialect_name == "sqlite":
+        # Deterministic, so paging through the sample is stable.
+        pseudo_random = (literal_column("rowid") * 2654435761 + SAMPLE_SEED) % 1000000
+    else:
+        pseudo_random = func.abs(func.random()) % 1000000
+    return select(table).where(pseudo_random < int(percent * 10000)).subquery(name)
+
+
+def approximate_aggregate(agg_func, col, dialect_name):
+    """
+    Cheaper approximate version of agg_func for sampled mode, or None if
+    the dialect has none.
+    """
+    if agg_func == "COUNT_DISTINCT" and dialect_name in ("databricks", "duckdb"):
+        return func.approx_count_distinct(col)
+    if agg_func == "MEDIAN" and dialect_name == "databricks":
+        return func.approx_percentile(col, MEDIAN_FRACTION)
+    if agg_func == "MEDIAN" and dialect_name == "duckdb":
+        return func.approx_quantile(col, MEDIAN_FRACTION)
+    return None
+
+
+def median(col, dialect_name):
+    if dialect_name == "databricks":
+        return func.percentile(col, MEDIAN_FRACTION)
+    if dialect_name == "duckdb":
+        return func.median(col)
+    if dialect_name == "postgresql":
+        return func.percentile_cont(MEDIAN_FRACTION).within_group(col)
+    raise ValueError(f"MEDIAN is not supported on {dialect_name}")
+
+
+# Aggregates estimated from a sample get a 95% error bound, computed from
+# these per-group helper columns.
+ERROR_BOUNDED = ("SUM", "COUNT", "AVG")
+
+
+def error_helpers(label, col):
+    return [func.count(col).label(f"__n_{label}"), func.sum(col * col).label(f"__s2_{label}")]
+
+
+def add_error_bounds(df, labels, percent):
+    """
+    Replace the helper columns of a sampled result by a `<label>_error`
+    column per aggregate: the half-width of its 95% confidence interval,
+    assuming each row was sampled independently with probability percent/100.
+    """
+    p = percent / 100.0
+    df = df.copy()
+    for label, agg_func in labels:
+        n = df.pop(f"__n_{label}").astype(float)
+        s2 = df.pop(f"__s2_{label}").astype(float)
+        if agg_func == "SUM":
+            error = Z_95 * ((1 - p) * s2).pow(0.5) / p
+        elif agg_func == "COUNT":
+            error = Z_95 * ((1 - p) * n).pow(0.5) / p
+        else:
+            mean = df[label].astype(float)
+            variance = ((s2 - n * mean * mean) / (n - 1)).clip(lower=0)
+            error = Z_95 * (variance / n).pow(0.5)
+            error[n < 2] = math.nan
+        df[f"{label}_error"] = error
+    return df
@@ -0,0 +1,228 @@
+# table_stats.py
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from sqlalchemy import func, select, text
+
+from sampling import approximate_aggregate, sampled
+
+# Seconds table statistics are reused before being recomputed in the background.
+STATS_TTL = float(os.environ.get("BRICK_STATS_TTL", 600))
+
+# Tables up to this many rows are scanned in full; bigger ones are sampled
+# down to about this many rows.
+STATS_SCAN_ROWS = int(os.environ.get("BRICK_STATS_SCAN_ROWS", 1000000))
+
+
+class TableStats:
+    """
+    Cached row counts and per-column statistics (estimated distinct values
+    and null fraction) for the tables of a BrickSQLAlchemy.
+
+    Column statistics come from the table statistics Databricks keeps after
+    ANALYZE TABLE ... COMPUTE STATISTICS FOR ALL COLUMNS when they are there,
+    and otherwise from one scan of the table, or of a sample of it for big
+    tables. The row count is always an exact COUNT(*), which Delta answers
+    from its transaction log, and is served as soon as it is known, before
+    the column statistics. Until then estimated_row_count gives the number
+    of rows the database's own metadata has for the table, if any.
+
+    Statistics are computed lazily on a background thread the first time a
+    table is asked for, and recomputed in the background once older than
+    `ttl` seconds, or once the table was written to through brick (by any
+    process sharing brick.writes), while the old values keep being served.
+    """
+
+    def __init__(self, brick, ttl=STATS_TTL, scan_rows=STATS_SCAN_ROWS, max_workers=2):
+        self.brick = brick
+        self.ttl = ttl
+        self.scan_rows = scan_rows
+        self._stats = {}  # table_name -> stats dict
+        self._row_counts = {}  # table_name -> (exact row count, brick.writes count), before the stats are done
+        self._estimates = {}  # table_name -> (estimated row count or None, time.time())
+        self._futures = {}  # table_name -> Future of the running computation
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stats")
+        self._lock = threading.Lock()
+
+    def get(self, table_name, timeout=None):
+        """
+        Return the statistics of table_name:
+            {"row_count": int, "columns": {name: {"distinct": int, "null_fraction": float}},
+             "source": "metadata" or "scan" or "sample", "computed_at": epoch seconds}
+        Stale statistics are returned right away (and refreshed in the
+        background). Without any, wait up to `timeout` seconds (None waits
+        for as long as it takes) and return None if they aren't ready.
+        """
+        stats = self._stats.get(table_name)
+        if stats is not None and stats["writes"] != self.brick.writes.count(table_name):
+            self.invalidate(table_name)
+        with self._lock:
+            stats = self._stats.get(table_name)
+            if stats is None or time.time() - stats["computed_at"] > self.ttl:
+                future = self._futures.get(table_name)
+                if future is None or future.done():
+                    future = self._executor.submit(self._refresh, table_name)
+                    self._futures[table_name] = future
+            else:
+                future = None
+        if stats is not None or future is None:
+            return stats
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            return None
+        except Exception as e:
+            print(f"Statistics for {table_name} failed: {e}")
+            return None
+
+    def row_count(self, table_name, timeout=0):
+        """
+        Cached number of rows in table_name, or None if not known yet.
+        """
+        stats = self.get(table_name, timeout=timeout)
+        if stats:
+            return stats["row_count"]
+        count = self._row_counts.get(table_name)
+        if count is not None and count[1] == self.brick.writes.count(table_name):
+            return count[0]
+        return None
+
+    def estimated_row_count(self, table_name):
+        """
+        Number of rows in table_name from the database's metadata (e.g. the
+        statistics of the last ANALYZE TABLE), without counting them, or
+        None if it has none. Also starts computing the exact statistics.
+        """
+        count = self.row_count(table_name)
+        if count is not None:
+            return count
+        with self._lock:
+            estimate = self._estimates.get(table_name)
+        if estimate is None or time.time() - estimate[1] > self.ttl:
+            estimate = (self._metadata_row_count(table_name), time.time())
+            with self._lock:
+                self._estimates[table_name] = estimate
+        return estimate[0]
+
+    def _metadata_row_count(self, table_name):
+        dialect_name = self.brick.engine.dialect.name
+        preparer = self.brick.engine.dialect.identifier_preparer
+        try:
+            with self.brick._connect() as conn:
+                if dialect_name == "databricks":
+                    # "Statistics: 123 bytes, 45 rows" once ANALYZE TABLE has run.
+                    rows = conn.exec_driver_sql(f"DESCRIBE TABLE EXTENDED {preparer.quote(table_name)}").fetchall()
+                    info = {row[0]: row[1] for row in rows}
+                    match = re.search(r"(\d+) rows", info.get("Statistics") or "")
+                    return int(match.group(1)) if match else None
+                if dialect_name == "duckdb":
+                    return conn.execute(
+                        text("SELECT estimated_size FROM duckdb_tables() WHERE table_name = :name"), {"name": table_name}
+                    ).scalar()
+                if dialect_name == "postgresql":
+                    # -1 for a table never analyzed.
+                    count = conn.execute(
+                        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)"), {"name": table_name}
+                    ).scalar()
+                    return int(count) if count is not None and count >= 0 else None
+        except Exception as e:
+            print(f"No row count estimate for {table_name}: {e}")
+        return None
+
+    def invalidate(self, table_name):
+        """
+        Recompute the statistics of table_name on the next get, e.g. after
+        rows of it were edited. The old ones are served until then.
+        """
+        with self._lock:
+            stats = self._stats.get(table_name)
+            if stats is not None:
+                self._stats[table_name] = dict(stats, computed_at=0)
+            self._estimates.pop(table_name, None)
+
+    def _refresh(self, table_name):
+        start = time.perf_counter()
+        # Counted first, so a write during the computation makes it stale.
+        writes = self.brick.writes.count(table_name)
+        stats = self._compute(table_name, writes)
+        stats["computed_at"] = time.time()
+        stats["writes"] = writes
+        with self._lock:
+            self._stats[table_name] = stats
+            self._row_counts.pop(table_name, None)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"Statistics for {table_name} ({stats['row_count']} rows) from {stats['source']} in {elapsed_ms} ms")
+        return stats
+
+    def _compute(self, table_name, writes):
+        table = self.brick._internal_schema(table_name)
+        with self.brick._connect() as conn:
+            row_count = conn.execute(select(func.count()).select_from(table)).scalar() or 0
+        # Served by row_count while the column statistics are computed.
+        with self._lock:
+            self._row_counts[table_name] = (row_count, writes)
+        columns = self._metadata_columns(table, row_count)
+        if columns is not None:
+            return {"row_count": row_count, "columns": columns, "source": "metadata"}
+        return dict(self._scan_columns(table, row_count), row_count=row_count)
+
+    def _metadata_columns(self, table, row_count):
+        # Column statistics from DESCRIBE EXTENDED <table> <column>, only if
+        # every column has them.
+        if self.brick.engine.dialect.name != "databricks" or not row_count:
+            return None
+        preparer = self.brick.engine.dialect.identifier_preparer
+        columns = {}
+        try:
+            with self.brick._connect() as conn:
+                for col in table.columns:
+                    rows = conn.exec_driver_sql(
+                        f"DESCRIBE EXTENDED {preparer.format_table(table)} {preparer.quote(col.name)}"
+                    ).fetchall()
+                    info = {row[0]: row[1] for row in rows}
+                    distinct, nulls = info.get("distinct_count"), info.get("num_nulls")
+                    if not distinct or not nulls or not re.fullmatch(r"\d+", distinct + nulls):
+                        return None
+                    columns[col.name] = {"distinct": int(distinct), "null_fraction": int(nulls) / row_count}
+        except Exception as e:
+            print(f"No column statistics for {table.name}: {e}")
+            return None
+        return columns
+
+    def _scan_columns(self, table, row_count):
+        """
+        Distinct and non-null counts of every column in one scan of the table,
+        or of a sample of about scan_rows rows. Distinct counts seen in a
+        sample are scaled up the more the column looks unique in it: rough,
+        but enough to tell a category from an id.
+        """
+        dialect_name = self.brick.engine.dialect.name
+        percent = 100.0 if row_count <= self.scan_rows else max(100.0 * self.scan_rows / row_count, 0.01)
+        source = table if percent >= 100 else sampled(table, percent, dialect_name)
+        exprs = [func.count().label("_rows")]
+        for i, col in enumerate(table.columns):
+            c = source.c[col.name]
+            distinct = approximate_aggregate("COUNT_DISTINCT", c, dialect_name)
+            if distinct is None:
+                distinct = func.count(c.distinct())
+            exprs += [distinct.label(f"d{i}"), func.count(c).label(f"n{i}")]
+        with self.brick._connect() as conn:
+            row = conn.execute(select(*exprs).select_from(source)).mappings().one()
+
+        scanned = row["_rows"] or 0
+        columns = {}
+        for i, col in enumerate(table.columns):
+            distinct, non_null = row[f"d{i}"] or 0, row[f"n{i}"] or 0
+            if percent < 100 and non_null:
+                uniqueness = distinct / non_null
+                distinct = distinct + distinct * uniqueness * (100.0 / percent - 1)
+                distinct = min(distinct, row_count)
+            columns[col.name] = {
+                "distinct": int(round(distinct)),
+                "null_fraction": 1 - non_null / scanned if scanned else 0.0,
+            }
+        return {"columns": columns, "source": "scan" if percent >= 100 else "sample"}
@@ -0,0 +1,87 @@
+# tests/test_check_runner.py
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from check_runner import RUN, CheckRunner
+from query_cancel import QueryTracker
+
+
+class Rules:
+    def names(self):
+        return ["unique", "range"]
+
+
+class Brick:
+    """
+    Runs every rule once `release` is set, counting the runs.
+    """
+
+    def __init__(self):
+        self.rules = Rules()
+        self.queries = QueryTracker()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def run_rule(self, table_name, check_name, sample=None):
+        self.runs += 1
+        self.release.wait(5)
+        return pd.DataFrame({"transaction_id": [1]})
+
+
+def wait_done(runner, table_name="t"):
+    deadline = time.monotonic() + 5
+    while runner.progress(table_name)[0] < 2:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_one_run_at_a_time_across_processes():
+    store = {}
+    first, second = Brick(), Brick()
+    runner, other = CheckRunner(first, store=store), CheckRunner(second, store=store)
+    assert runner.start("t")
+    # Another process sharing the store sees the run going and doesn't start its own.
+    assert not other.start("t")
+    first.release.set()
+    wait_done(other)
+    assert (first.runs, second.runs) == (2, 0)
+    assert other.status("t")["unique"]["records"] == [{"transaction_id": 1}]
+    # Once it's finished, selecting the table again runs the checks again.
+    second.release.set()
+    assert other.start("t")
+    wait_done(other)
+    assert second.runs == 2
+
+
+def test_cancelled_or_stale_runs_dont_block_a_new_one():
+    store = {}
+    runner = CheckRunner(Brick(), store=store)
+    runner.start("t")
+    runner.cancel("t")
+    other_brick = Brick()
+    other_brick.release.set()
+    assert CheckRunner(other_brick, store=store).start("t")
+    # A run whose process died while it was going.
+    store[("u", RUN)] = {"id": "gone", "cancelled": False, "started_at": time.time() - 10}
+    store[("u", "unique")] = {"status": "running"}
+    assert not CheckRunner(other_brick, store=store).start("u")
+    assert CheckRunner(other_brick, store=store, stale_after=5).start("u")
+    runner.brick.release.set()
+
+
+def test_claim_is_atomic_with_a_disk_store(tmp_path):
+    diskcache = pytest.importorskip("diskcache")
+    bricks = [Brick() for _ in range(4)]
+    runners = [CheckRunner(brick, store=diskcache.Cache(str(tmp_path))) for brick in bricks]
+    started = []
+    threads = [threading.Thread(target=lambda r=runner: started.append(r.start("t"))) for runner in runners]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert started.count(True) == 1
+    for brick in bricks:
+        brick.release.set()
@@ -0,0 +1,163 @@
+# tests/test_dq_rules.py
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, select
+
+import db_sql
+from db_sql import BrickSQLAlchemy
+from dq_rules import AllowedPairsRule, CustomSqlRule, RangeRule, RuleRegistry, UniquenessRule, flagged_select
+
+MAPPING = {"EU": ["France", "Spain"], "APAC": ["India", "Japan"]}
+
+# (row_id, transaction_id, region, country, debit)
+ROWS = [
+    (1, 1, "EU", "France", 10.0),
+    (2, 2, "EU", "Japan", 0.0),  # pair, custom
+    (3, 2, "EU", "Spain", 10.0),  # duplicate 2
+    (4, 3, "APAC", "India", -5.0),  # range
+    (5, 4, "APAC", "France", 10.0),  # pair
+    (6, 5, "AMER", "Nowhere", 10.0),  # region without a mapping: fine
+    (7, 6, "EU", None, 10.0),  # no country: fine
+    (8, 7, "APAC", "Spain", 500.0),  # pair, range
+    (9, 7, "APAC", "Japan", None),  # duplicate 7, no debit: fine for range and custom
+    (10, 8, "EU", "Germany", 0.0),  # pair, custom
+    (11, 8, "EU", "France", 10.0),  # duplicate 8
+    (12, 8, "EU", "France", 10.0),  # duplicate 8
+    (13, None, "EU", "Spain", 10.0),
+    (14, None, "EU", "Spain", 10.0),  # duplicate NULL
+]
+
+RULES = [
+    UniquenessRule("unique", ["transaction_id"]),
+    RangeRule("range", "debit", min=0, max=100),
+    AllowedPairsRule("pairs", "region", "country", mapping=MAPPING),
+    AllowedPairsRule("pairs_ref", "region", "country", reference_table="allowed", reference_columns=["reg", "ctry"]),
+    CustomSqlRule("custom", "debit = 0"),
+]
+
+# Rows (by row_id) violating each rule; keys for uniqueness.
+VIOLATIONS = {
+    "unique": {2: 2, 7: 2, 8: 3, None: 2},
+    "range": {4, 8},
+    "pairs": {2, 5, 8, 10},
+    "pairs_ref": {2, 5, 8, 10},
+    "custom": {2, 10},
+}
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def db(request, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb_engine")
+    engine = create_engine(f"{request.param}:///{tmp_path / 'rules.db'}")
+    metadata = MetaData()
+    table = Table(
+        "transactions",
+        metadata,
+        Column("row_id", Integer),
+        Column("transaction_id", Integer),
+        Column("region", String),
+        Column("country", String),
+        Column("debit", Float),
+    )
+    allowed = Table("allowed", metadata, Column("reg", String), Column("ctry", String))
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [dict(zip(table.c.keys(), row)) for row in ROWS])
+        conn.execute(allowed.insert(), [{"reg": k, "ctry": v} for k, values in MAPPING.items() for v in values])
+    yield engine, table
+    engine.dispose()
+
+
+@pytest.mark.parametrize("rule", RULES, ids=lambda rule: rule.name)
+def test_check_select(db, rule):
+    engine, table = db
+    with engine.connect() as conn:
+        rows = conn.execute(rule.check_select(table, engine.dialect.name)).mappings().all()
+    if rule.distinct_on:
+        # NULL keys are grouped together, as in the combined check.
+        assert {row["transaction_id"]: row["duplicate_count"] for row in rows} == VIOLATIONS[rule.name]
+    else:
+        assert {row["row_id"] for row in rows} == VIOLATIONS[rule.name]
+
+
+def flags(engine, table, limit=None):
+    """
+    {rule name: row_ids flagged} from one flagged_select over every rule.
+    """
+    stmt = flagged_select(RULES, table, engine.dialect.name, limit=limit)
+    with engine.connect() as conn:
+        rows = conn.execute(stmt).mappings().all()
+    return {
+        rule.name: [row["row_id"] for row in rows if rule.violated(row[f"_dq_{i}"])] for i, rule in enumerate(RULES)
+    }
+
+
+def test_flagged_select_flags_every_rule_in_one_scan(db):
+    engine, table = db
+    flagged = flags(engine, table)
+    for rule in RULES:
+        if rule.distinct_on:
+            # Every row of a repeated key, NULL included (a window partitions NULLs together).
+            keys = [row[1] for row in ROWS if row[0] in flagged[rule.name]]
+            assert {key: keys.count(key) for key in keys} == VIOLATIONS[rule.name]
+        else:
+            assert set(flagged[rule.name]) == VIOLATIONS[rule.name]
+    # Rows violating nothing aren't returned.
+    assert 1 not in sum(flagged.values(), [])
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_violations_capped_per_rule(db, limit):
+    engine, table = db
+    flagged = flags(engine, table, limit=limit)
+    kept = set()
+    for rule in RULES:
+        # Every rule still gets `limit` violations (one row per key for
+        # uniqueness), though a row kept for one rule shows its flags for all.
+        if rule.distinct_on:
+            keys = {row[1] for row in ROWS if row[0] in flagged[rule.name]}
+            assert len(keys) >= min(limit, len(VIOLATIONS[rule.name]))
+        else:
+            assert set(flagged[rule.name]) <= VIOLATIONS[rule.name]
+            assert len(flagged[rule.name]) >= min(limit, len(VIOLATIONS[rule.name]))
+        kept.update(flagged[rule.name])
+    # And no rule keeps more than `limit` rows.
+    assert len(kept) <= sum(min(limit, len(VIOLATIONS[rule.name])) for rule in RULES)
+    if limit == 1:
+        assert len(kept) < len(set(sum(flags(engine, table).values(), [])))
+
+
+def test_cap_numbers_violating_rows_only(db):
+    engine, table = db
+    stmt = flagged_select(RULES, table, engine.dialect.name, limit=100)
+    sql = str(stmt.compile(dialect=engine.dialect))
+    assert sql.count("row_number() OVER") == len(RULES)
+    # The numbering runs over the violations subquery, not the table.
+    assert "FROM (SELECT flagged." in " ".join(sql.split())
+
+
+def check_all(engine, limit):
+    brick = BrickSQLAlchemy(
+        engine.url.render_as_string(hide_password=False),
+        cache_ttl=0,
+        schema_cache_path=None,
+        rules=RuleRegistry(RULES),
+        rollups=[],
+        replica_tables=[],
+        shared_dir=None,
+    )
+    try:
+        return brick.check_all("transactions", limit=limit)
+    finally:
+        brick.engine.dispose()
+
+
+def test_check_all_gets_the_same_counts_capped(db, monkeypatch):
+    engine, table = db
+    streamed = check_all(engine, limit=2)
+    monkeypatch.setattr(db_sql, "CAPPED_CHECK_DIALECTS", (engine.dialect.name,))
+    capped = check_all(engine, limit=2)
+    for rule in RULES:
+        assert len(capped[rule.name]) == len(streamed[rule.name]) == 2
+        if not rule.distinct_on:
+            assert set(capped[rule.name]["row_id"]) <= VIOLATIONS[rule.name]
@@ -0,0 +1,123 @@
+# tests/test_edit_queue.py
+import threading
+import time
+
+import pytest
+
+from edit_queue import EditQueue
+
+
+class Brick:
+    """
+    Records the batches save_row_data is called with.
+    """
+
+    def __init__(self, error=None):
+        self.saved = []
+        self.error = error
+        self.saved_event = threading.Event()
+
+    def save_row_data(self, table_name, changes):
+        self.saved.append((table_name, list(changes)))
+        self.saved_event.set()
+        if self.error:
+            raise RuntimeError(self.error)
+        return {"rows_applied": len(changes), "rows_failed": 0, "cells": len(changes), "elapsed_ms": 1, "error": None}
+
+
+def edit(transaction_id, value=0):
+    return {"data": {"transaction_id": transaction_id}, "colId": "debit", "value": value}
+
+
+@pytest.fixture
+def brick():
+    return Brick()
+
+
+def test_flushes_when_the_batch_is_full(brick):
+    queue = EditQueue(brick, max_batch=3, flush_interval=60).start()
+    try:
+        queue.submit("t", [edit(1), edit(2)], "s")
+        assert not brick.saved_event.wait(0.2)
+        queue.submit("t", [edit(3)], "s")
+        assert brick.saved_event.wait(5)
+        assert [len(changes) for _, changes in brick.saved] == [3]
+    finally:
+        queue.stop()
+
+
+def test_flushes_after_the_interval(brick):
+    queue = EditQueue(brick, max_batch=100, flush_interval=0.3).start()
+    try:
+        submitted = time.monotonic()
+        queue.submit("t", [edit(1)], "s")
+        assert brick.saved_event.wait(5)
+        assert time.monotonic() - submitted >= 0.25
+        assert brick.saved == [("t", [edit(1)])]
+        assert queue.pending_count("t") == 0
+    finally:
+        queue.stop()
+
+
+def test_stop_saves_what_is_left(brick):
+    queue = EditQueue(brick, max_batch=100, flush_interval=60).start()
+    queue.submit("t", [edit(1)], "s")
+    queue.stop()
+    assert brick.saved == [("t", [edit(1)])]
+
+
+def test_results_per_session(brick):
+    queue = EditQueue(brick)
+    queue.submit("t", [edit(1), edit(2)], "a")
+    queue.submit("t", [edit(3)], "b")
+    queue.submit("u", [edit(4)], "a")
+    assert (queue.waiting("t", "a"), queue.waiting("t", "b"), queue.waiting("u", "a")) == (2, 1, 1)
+    queue.flush("t")
+    # One write for both sessions, each told about its own edits.
+    assert len(brick.saved) == 1
+    [(result_a, changes_a)] = queue.drain_results("t", "a")
+    [(result_b, changes_b)] = queue.drain_results("t", "b")
+    assert result_a["rows_applied"] == result_b["rows_applied"] == 3
+    assert (changes_a, changes_b) == ([edit(1), edit(2)], [edit(3)])
+    assert queue.drain_results("t", "a") == []
+    assert queue.waiting("t", "a") == 0
+    # Edits to u haven't been saved yet.
+    assert queue.drain_results("u", "a") == []
+    assert queue.waiting("u", "a") == 1
+    queue.flush()
+    assert len(queue.drain_results("u", "a")) == 1
+    assert queue.results == {}
+
+
+def test_failed_flush_is_reported(brick):
+    brick.error = "warehouse down"
+    queue = EditQueue(brick)
+    queue.submit("t", [edit(1)], "s")
+    queue.flush()
+    [(result, changes)] = queue.drain_results("t", "s")
+    assert result["error"] == "warehouse down"
+    assert (result["rows_failed"], changes) == (1, [edit(1)])
+
+
+def test_results_nobody_drains_expire(brick):
+    queue = EditQueue(brick, result_ttl=0.1)
+    queue.submit("t", [edit(1)], "closed tab")
+    queue.flush()
+    time.sleep(0.2)
+    queue.submit("t", [edit(2)], "s")
+    queue.flush()
+    assert ("closed tab", "t") not in queue.results
+    assert len(queue.drain_results("t", "s")) == 1
+
+
+def test_results_shared_between_processes(brick, tmp_path):
+    diskcache = pytest.importorskip("diskcache")
+    submitting = EditQueue(brick, results=diskcache.Cache(str(tmp_path)))
+    polled = EditQueue(Brick(), results=diskcache.Cache(str(tmp_path)))
+    submitting.submit("t", [edit(1)], "s")
+    assert polled.waiting("t", "s") == 1
+    submitting.flush()
+    assert polled.waiting("t", "s") == 0
+    [(result, changes)] = polled.drain_results("t", "s")
+    assert changes == [edit(1)]
+    assert submitting.drain_results("t", "s") == []
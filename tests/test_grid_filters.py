@@ -0,0 +1,229 @@
+# tests/test_grid_filters.py
+import datetime
+
+import pytest
+from sqlalchemy import Column, Date, DateTime, Float, Integer, MetaData, String, Table, create_engine, select
+
+from grid_filters import FILTER_OPERATORS, filter_clause, filter_params, filter_shape
+
+ROWS = [
+    # id, name, amount, booked, day
+    (1, "apple", 10.0, datetime.datetime(2024, 1, 1, 0, 0), datetime.date(2024, 1, 1)),
+    (2, "Banana", 20.0, datetime.datetime(2024, 1, 1, 23, 59, 59), datetime.date(2024, 1, 1)),
+    (3, "50%_off!", 30.0, datetime.datetime(2024, 1, 2, 0, 0), datetime.date(2024, 1, 2)),
+    (4, "50 pct", None, datetime.datetime(2024, 1, 2, 12, 0), datetime.date(2024, 1, 2)),
+    (5, "", 40.0, None, None),
+    (6, None, 50.0, datetime.datetime(2024, 1, 3, 8, 0), datetime.date(2024, 1, 3)),
+    (7, "a_b", 60.0, datetime.datetime(2024, 1, 4, 0, 0), datetime.date(2024, 1, 4)),
+]
+ALL = {row[0] for row in ROWS}
+
+
+def text(type_, value=None):
+    return {"filterType": "text", "type": type_, "filter": value}
+
+
+def number(type_, value=None, to=None):
+    return {"filterType": "number", "type": type_, "filter": value, "filterTo": to}
+
+
+def date(type_, day=None, to=None):
+    # AgGrid sends dates with a time part.
+    return {
+        "filterType": "date",
+        "type": type_,
+        "dateFrom": f"{day} 00:00:00" if day else None,
+        "dateTo": f"{to} 00:00:00" if to else None,
+    }
+
+
+@pytest.fixture(scope="module", params=["sqlite", "duckdb"])
+def table(request, tmp_path_factory):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb_engine")
+    path = tmp_path_factory.mktemp(request.param) / "filters.db"
+    engine = create_engine(f"{request.param}:///{path}")
+    table = Table(
+        "items",
+        MetaData(),
+        Column("id", Integer),
+        Column("name", String),
+        Column("amount", Float),
+        Column("booked", DateTime),
+        Column("day", Date),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [dict(zip(["id", "name", "amount", "booked", "day"], row)) for row in ROWS])
+    table.engine = engine
+    yield table
+    engine.dispose()
+
+
+def matching_ids(table, filter_model):
+    stmt = select(table.c.id)
+    clause = filter_clause(table, filter_model)
+    if clause is not None:
+        stmt = stmt.where(clause)
+    with table.engine.connect() as conn:
+        return {row.id for row in conn.execute(stmt, filter_params(filter_model))}
+
+
+OPERATOR_CASES = [
+    ("name", text("equals", "apple"), {1}),
+    # NULLs never match a comparison.
+    ("name", text("notEqual", "apple"), {2, 3, 4, 5, 7}),
+    ("name", text("contains", "AN"), {2}),
+    ("name", text("notContains", "a"), {3, 4, 5}),
+    ("name", text("startsWith", "50"), {3, 4}),
+    ("name", text("endsWith", "B"), {7}),
+    ("name", text("blank"), {5, 6}),
+    ("name", text("notBlank"), {1, 2, 3, 4, 7}),
+    ("amount", number("equals", 20), {2}),
+    ("amount", number("notEqual", 20), {1, 3, 5, 6, 7}),
+    ("amount", number("greaterThan", 40), {6, 7}),
+    ("amount", number("greaterThanOrEqual", 40), {5, 6, 7}),
+    ("amount", number("lessThan", 20), {1}),
+    ("amount", number("lessThanOrEqual", 20), {1, 2}),
+    # Ranges exclude both ends.
+    ("amount", number("inRange", 10, 30), {2}),
+    ("amount", number("blank"), {4}),
+    ("amount", number("notBlank"), ALL - {4}),
+    # Dates compare whole days, also on timestamps late in the day.
+    ("booked", date("equals", "2024-01-01"), {1, 2}),
+    ("booked", date("notEqual", "2024-01-01"), {3, 4, 6, 7}),
+    ("booked", date("greaterThan", "2024-01-02"), {6, 7}),
+    ("booked", date("greaterThanOrEqual", "2024-01-02"), {3, 4, 6, 7}),
+    ("booked", date("lessThan", "2024-01-02"), {1, 2}),
+    ("booked", date("lessThanOrEqual", "2024-01-02"), {1, 2, 3, 4}),
+    ("booked", date("inRange", "2024-01-01", "2024-01-03"), {3, 4}),
+    ("booked", date("blank"), {5}),
+    ("booked", date("notBlank"), ALL - {5}),
+    ("day", date("equals", "2024-01-02"), {3, 4}),
+    ("day", date("lessThanOrEqual", "2024-01-02"), {1, 2, 3, 4}),
+    ("day", date("inRange", "2024-01-01", "2024-01-04"), {3, 4, 6}),
+]
+
+
+def test_every_operator_is_covered():
+    assert {(model["filterType"], model["type"]) for _, model, _ in OPERATOR_CASES} == set(FILTER_OPERATORS)
+
+
+@pytest.mark.parametrize("column, model, expected", OPERATOR_CASES)
+def test_operator(table, column, model, expected):
+    assert matching_ids(table, {column: model}) == expected
+
+
+@pytest.mark.parametrize(
+    "model, expected",
+    [
+        (text("contains", "%"), {3}),
+        (text("contains", "_"), {3, 7}),
+        (text("contains", "!"), {3}),
+        (text("startsWith", "50%"), {3}),
+        (text("endsWith", "_b"), {7}),
+        (text("notContains", "_"), {1, 2, 4, 5}),
+    ],
+)
+def test_like_wildcards_match_literally(table, model, expected):
+    assert matching_ids(table, {"name": model}) == expected
+
+
+def test_conditions(table):
+    model = {
+        "filterType": "number",
+        "operator": "OR",
+        "conditions": [{"type": "lessThan", "filter": 20}, {"type": "greaterThan", "filter": 50}],
+    }
+    assert matching_ids(table, {"amount": model}) == {1, 7}
+    model = {"filterType": "text", "operator": "AND", "conditions": [text("contains", "a"), text("notContains", "n")]}
+    assert matching_ids(table, {"name": model}) == {1, 7}
+
+
+def test_legacy_conditions(table):
+    model = {
+        "filterType": "text",
+        "operator": "OR",
+        "condition1": {"type": "equals", "filter": "apple"},
+        "condition2": {"type": "equals", "filter": "Banana"},
+    }
+    assert matching_ids(table, {"name": model}) == {1, 2}
+    model = {"filterType": "date", "operator": "AND", "condition1": date("greaterThan", "2024-01-01")}
+    assert matching_ids(table, {"booked": model}) == {3, 4, 6, 7}
+
+
+def test_multi(table):
+    model = {
+        "filterType": "multi",
+        "filterModels": [text("contains", "a"), None, {"filterType": "set", "values": ["apple", "a_b", "50 pct"]}],
+    }
+    assert matching_ids(table, {"name": model}) == {1, 7}
+    assert matching_ids(table, {"name": {"filterType": "multi", "filterModels": [None, None]}}) == ALL
+
+
+@pytest.mark.parametrize(
+    "values, expected",
+    [
+        (["apple", "Banana"], {1, 2}),
+        (["apple", None], {1, 6}),
+        ([None], {6}),
+        ([], set()),
+    ],
+)
+def test_set(table, values, expected):
+    assert matching_ids(table, {"name": {"filterType": "set", "values": values}}) == expected
+
+
+def test_columns_are_combined_with_and(table):
+    assert matching_ids(table, {"name": text("contains", "a"), "amount": number("greaterThan", 15)}) == {2, 7}
+    assert matching_ids(table, {}) == ALL
+    assert filter_clause(table, None) is None
+
+
+@pytest.mark.parametrize(
+    "filter_model",
+    [
+        {"name": text("bogus", "a")},
+        {"name": {"filterType": "geo", "type": "near"}},
+        {"name": text("equals")},
+        {"amount": number("inRange", 1)},
+        {"booked": date("equals")},
+        {"amount": {"filterType": "number", "operator": "XOR", "conditions": [number("equals", 1)]}},
+    ],
+)
+def test_untranslatable_filters_raise(table, filter_model):
+    with pytest.raises(ValueError):
+        filter_shape(filter_model)
+    with pytest.raises(ValueError):
+        filter_clause(table, filter_model)
+
+
+def test_unknown_column_raises(table):
+    with pytest.raises(ValueError, match="missing"):
+        filter_clause(table, {"missing": text("equals", "a")})
+
+
+def test_shape_ignores_values():
+    assert filter_shape({"name": text("contains", "a")}) == filter_shape({"name": text("contains", "zzz")})
+    assert filter_shape({"amount": number("inRange", 1, 2)}) == filter_shape({"amount": number("inRange", 5, 9)})
+    assert filter_shape({"booked": date("equals", "2024-01-01")}) == filter_shape({"booked": date("equals", "2025-06-30")})
+    # IN lists are expanded at execution, so their length isn't part of the shape.
+    assert filter_shape({"name": {"filterType": "set", "values": ["a"]}}) == filter_shape(
+        {"name": {"filterType": "set", "values": ["b", "c", "d"]}}
+    )
+
+
+def test_shape_changes_with_the_sql():
+    assert filter_shape({"name": text("contains", "a")}) != filter_shape({"name": text("startsWith", "a")})
+    assert filter_shape({"name": text("contains", "a")}) != filter_shape({"country": text("contains", "a")})
+    assert filter_shape({"name": {"filterType": "set", "values": ["a"]}}) != filter_shape(
+        {"name": {"filterType": "set", "values": ["a", None]}}
+    )
+
+
+def test_params():
+    assert filter_params({"amount": number("inRange", 1, 2), "name": text("contains", "50%")}) == {
+        "filter_0": 1,
+        "filter_0_to": 2,
+        "filter_1": "%50!%%",
+    }
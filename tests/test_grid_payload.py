@@ -0,0 +1,117 @@
+# tests/test_grid_payload.py
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from grid_payload import encode_columns, row_delta, with_row_ids
+
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+
+def decode_rows(payload):
+    """
+    decodeRows of assets/grid_payload.js, in Python.
+    """
+    rows = [{} for _ in range(payload["length"])]
+    for column in payload["columns"]:
+        if "codes" in column:
+            values = [None if code < 0 else column["dictionary"][code] for code in column["codes"]]
+        else:
+            values = column["values"]
+        for row, value in zip(rows, values):
+            row[column["name"]] = value
+    return rows
+
+
+def records(df):
+    # What df.to_dict("records") would send, with None for missing values.
+    return [
+        {name: (None if pd.isna(value) else value) for name, value in row.items()} for row in df.to_dict("records")
+    ]
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            "transaction_id": [1, 2, 3, 4, 5, 6],
+            "debit": [1.5, np.nan, 0.0, -2.25, 3.0, np.nan],
+            "approved": [True, False, True, True, False, True],
+            # Few distinct values: sent as a dictionary, with NULLs.
+            "region": ["EU", None, "APAC", "EU", None, "EU"],
+            # All distinct: sent as is.
+            "country": ["France", "Japan", None, "Spain", "India", "Chile"],
+        }
+    )
+
+
+def test_round_trip(df):
+    payload = encode_columns(df)
+    columns = {column["name"]: column for column in payload["columns"]}
+    assert columns["region"]["dictionary"] == ["EU", "APAC"]
+    assert columns["region"]["codes"] == [0, -1, 1, 0, -1, 0]
+    assert "values" in columns["country"]
+    # Plain JSON: no NaN, no numpy scalars.
+    assert json.loads(json.dumps(payload, allow_nan=False)) == payload
+    assert decode_rows(payload) == records(df)
+
+
+def test_empty_and_single_row(df):
+    assert decode_rows(encode_columns(df.iloc[:0])) == []
+    assert decode_rows(encode_columns(df.iloc[1:2])) == records(df.iloc[1:2])
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_round_trip_in_javascript(df):
+    payload = dict(encode_columns(df), rowCount=6)
+    script = (
+        "global.window = {dash_clientside: {no_update: null}};"
+        f"require({json.dumps(os.path.join(ASSETS, 'grid_payload.js'))});"
+        "const payload = JSON.parse(require('fs').readFileSync(0, 'utf8'));"
+        "console.log(JSON.stringify(window.dash_clientside.grid.decodeBlock(payload)));"
+    )
+    output = subprocess.run(
+        ["node", "-e", script], input=json.dumps(payload), capture_output=True, text=True, check=True
+    )
+    assert json.loads(output.stdout) == {"rowData": records(df), "rowCount": 6}
+
+
+def rows(*tuples):
+    return pd.DataFrame(tuples, columns=["region", "country", "debit"])
+
+
+def test_row_ids_are_unique():
+    df = with_row_ids(
+        rows(("EU", "France", 1.0), ("EU", "France", 2.0), ("EU", None, 3.0), ("EU", "France", 4.0)),
+        ["region", "country"],
+    )
+    assert df["_row_id"].tolist() == ["EU\x1fFrance", "EU\x1fFrance#1", "EU\x1fNone", "EU\x1fFrance#2"]
+    # Without the key columns, rows are numbered.
+    assert with_row_ids(rows(("EU", "France", 1.0)), "transaction_id")["_row_id"].tolist() == ["0"]
+
+
+def test_row_delta():
+    key = ["region", "country"]
+    old = with_row_ids(
+        rows(("EU", "France", 1.0), ("EU", "Spain", np.nan), ("APAC", "Japan", 3.0), ("APAC", "India", 4.0)), key
+    )
+    new = with_row_ids(
+        rows(("EU", "France", 1.0), ("EU", "Spain", np.nan), ("APAC", "Japan", -3.0), ("AMER", "USA", 5.0)), key
+    )
+    added, updated, removed = row_delta(old, new)
+    assert added[key].values.tolist() == [["AMER", "USA"]]
+    # NaN == NaN here: the unchanged EU/Spain row isn't sent again.
+    assert updated[[*key, "debit"]].values.tolist() == [["APAC", "Japan", -3.0]]
+    assert removed == ["APAC\x1fIndia"]
+    assert [len(part) for part in row_delta(new, new)] == [0, 0, 0]
+
+
+def test_row_delta_needs_unique_ids():
+    old = rows(("EU", "France", 1.0)).assign(_row_id=["a"])
+    new = rows(("EU", "France", 1.0), ("EU", "Spain", 2.0)).assign(_row_id=["a", "a"])
+    assert row_delta(old, new) is None
@@ -0,0 +1,120 @@
+# tests/test_keyset.py
+import datetime
+import decimal
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, PrimaryKeyConstraint, String, Table, create_engine, select
+
+from keyset import decode_cursor, encode_cursor, keyset_columns, keyset_select, seek_kind, seek_params
+
+# a, b, value: (a, b) is unique, value has ties and NULLs.
+ROWS = [
+    (1, 1, 10),
+    (1, 2, None),
+    (1, 3, 20),
+    (2, 1, 10),
+    (2, 2, 10),
+    (2, 3, None),
+    (3, 1, 30),
+    (3, 2, 20),
+    (3, 3, None),
+    (4, 1, 10),
+    (4, 2, 30),
+]
+
+
+@pytest.fixture(scope="module", params=["sqlite", "duckdb"])
+def table(request, tmp_path_factory):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb_engine")
+    path = tmp_path_factory.mktemp(request.param) / "keyset.db"
+    engine = create_engine(f"{request.param}:///{path}")
+    table = Table(
+        "items",
+        MetaData(),
+        Column("a", Integer),
+        Column("b", Integer),
+        Column("value", Integer),
+        Column("name", String),
+        PrimaryKeyConstraint("a", "b"),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(table.insert(), [{"a": a, "b": b, "value": value, "name": f"{a}-{b}"} for a, b, value in ROWS])
+    table.engine = engine
+    yield table
+    engine.dispose()
+
+
+def expected_order(sort_column, descending):
+    if not sort_column:
+        return sorted(ROWS)
+    with_values = sorted(
+        (row for row in ROWS if row[2] is not None),
+        key=lambda row: (-row[2] if descending else row[2], row[0], row[1]),
+    )
+    # NULLs last, in key order.
+    return with_values + sorted(row for row in ROWS if row[2] is None)
+
+
+def walk(table, key_columns, sort_column, descending, page_size):
+    """
+    Every row, read page by page with cursors like BrickSQLAlchemy.get_page.
+    """
+    ordering = (sort_column, descending, key_columns)
+    rows, cursor = [], None
+    with table.engine.connect() as conn:
+        while True:
+            position = decode_cursor(cursor, ordering) if cursor else None
+            kind = seek_kind(position, sort_column)
+            stmt = keyset_select(select(table), key_columns, sort_column, descending, kind).limit(page_size)
+            page = conn.execute(stmt, seek_params(kind, position)).fetchall()
+            rows.extend((row.a, row.b, row.value) for row in page)
+            if len(page) < page_size or len(rows) > len(ROWS):
+                return rows
+            last = page[-1]._mapping
+            cursor = encode_cursor(ordering, last[sort_column] if sort_column else None, [last[k] for k in key_columns])
+
+
+@pytest.mark.parametrize("page_size", [1, 2, 3, 5, len(ROWS)])
+@pytest.mark.parametrize("sort_column, descending", [(None, False), ("value", False), ("value", True)])
+def test_pages_cover_every_row_once_in_order(table, sort_column, descending, page_size):
+    assert walk(table, ["a", "b"], sort_column, descending, page_size) == expected_order(sort_column, descending)
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_page_break_on_a_null(table, descending):
+    # Pages of 2 after the last non-NULL value break inside the NULLs.
+    rows = walk(table, ["a", "b"], "value", descending, 2)
+    assert rows[-3:] == [(1, 2, None), (2, 3, None), (3, 3, None)]
+
+
+def test_ties_are_broken_by_every_key_column(table):
+    # Four rows share value 10, two of them a == 2; pages of one row break
+    # between each of them.
+    rows = walk(table, ["a", "b"], "value", False, 1)
+    assert rows[:4] == [(1, 1, 10), (2, 1, 10), (2, 2, 10), (4, 1, 10)]
+
+
+def test_keyset_columns(table):
+    assert keyset_columns(table) == ["a", "b"]
+    assert keyset_columns(table, ["name"]) == ["name"]
+    assert keyset_columns(table, ["missing"]) is None
+
+
+def test_cursor_round_trip():
+    ordering = ("booked", True, ["id", "day"])
+    values = [decimal.Decimal("1.50"), datetime.date(2024, 1, 2)]
+    token = encode_cursor(ordering, datetime.datetime(2024, 1, 2, 3, 4), values)
+    assert decode_cursor(token, ordering) == (datetime.datetime(2024, 1, 2, 3, 4), values)
+    # Made for another sort, key or direction: ignored.
+    assert decode_cursor(token, ("booked", False, ["id", "day"])) is None
+    assert decode_cursor(token, ("booked", True, ["id"])) is None
+    assert decode_cursor("not a cursor", ordering) is None
+
+
+def test_seek_kind():
+    assert seek_kind(None, "value") is None
+    assert seek_kind((None, [1]), None) == "key"
+    assert seek_kind((None, [1]), "value") == "null"
+    assert seek_kind((0, [1]), "value") == "value"
@@ -0,0 +1,179 @@
+# tests/test_query_cache.py
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from query_cache import MISS, QueryCache, SingleFlight, estimate_size
+from query_cancel import QueryCancelled
+
+
+def frame(n):
+    return pd.DataFrame({"value": range(n)})
+
+
+def test_entries_expire():
+    cache = QueryCache(ttl=0.1)
+    cache.put("k", frame(3))
+    assert cache.get("k") is not MISS
+    time.sleep(0.15)
+    assert cache.get("k") is MISS
+    assert cache.info()["expirations"] == 1
+
+
+def test_least_recently_used_evicted_by_size():
+    size = estimate_size(frame(100))
+    cache = QueryCache(max_bytes=int(size * 2.5))
+    cache.put("a", frame(100))
+    cache.put("b", frame(100))
+    cache.get("a")
+    cache.put("c", frame(100))
+    assert cache.get("b") is MISS
+    assert cache.get("a") is not MISS and cache.get("c") is not MISS
+    assert cache.info()["evictions"] == 1
+    assert cache.info()["bytes"] == 2 * size
+    # Bigger than the whole cache: not stored, nothing evicted for it.
+    cache.put("huge", frame(1000))
+    assert cache.get("huge") is MISS
+    assert cache.info()["entries"] == 2
+
+
+def test_invalidating_a_table_drops_its_results():
+    cache = QueryCache()
+    cache.put("t only", 1, tables=["t"])
+    cache.put("t and u", 2, tables=["t", "u"])
+    cache.put("u only", 3, tables=["u"])
+    assert cache.invalidate_table("t") == 2
+    assert [cache.get(key) for key in ("t only", "t and u", "u only")] == [MISS, MISS, 3]
+
+
+def test_invalidation_reaches_every_process(tmp_path):
+    pytest.importorskip("diskcache")
+    first = QueryCache(shared_dir=str(tmp_path), namespace="db")
+    second = QueryCache(shared_dir=str(tmp_path), namespace="db")
+    other_db = QueryCache(shared_dir=str(tmp_path), namespace="other")
+    first.put("k", "rows of t", tables=["t"])
+    first.put("j", "rows of u", tables=["u"])
+    assert second.get("k") == "rows of t"
+    assert second.info()["shared_hits"] == 1
+    assert other_db.get("k") is MISS
+    second.invalidate_table("t")
+    # first still holds k in memory, but the table's generation moved on.
+    assert first.get("k") is MISS
+    assert second.get("k") is MISS
+    assert first.get("j") == "rows of u"
+
+
+def follow(flight, key, fn, results, count):
+    """
+    Start `count` callers of flight.do(key, fn) and wait until they all
+    wait on the running call. Each thread appends its result (or exception).
+    """
+
+    def call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(count)]
+    followers = flight.stats["followers"]
+    for thread in threads:
+        thread.start()
+    while flight.stats["followers"] < followers + count:
+        time.sleep(0.01)
+    return threads
+
+
+def leading(flight, key, outcome):
+    """
+    Start a caller running key until `release` is set, then returning or
+    raising outcome. Returns (release, thread, calls, results).
+    """
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def fn():
+        calls.append(threading.current_thread().name)
+        started.set()
+        release.wait(5)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def run():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=run, name="leader")
+    thread.start()
+    started.wait(5)
+    return release, thread, calls, results
+
+
+def test_followers_share_the_result():
+    flight = SingleFlight()
+    release, leader, calls, results = leading(flight, "k", "rows")
+    threads = follow(flight, "k", lambda: "not run", results, 3)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join()
+    assert calls == ["leader"]
+    assert results == ["rows"] * 4
+
+
+def test_followers_share_the_exception():
+    flight = SingleFlight()
+    error = RuntimeError("warehouse down")
+    release, leader, calls, results = leading(flight, "k", error)
+    threads = follow(flight, "k", lambda: "not run", results, 2)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join()
+    assert calls == ["leader"]
+    assert results == [error] * 3
+
+
+def test_followers_rerun_on_retry_exceptions():
+    flight = SingleFlight(retry_on=(QueryCancelled,))
+    release, leader, calls, results = leading(flight, "k", QueryCancelled("superseded"))
+    threads = follow(flight, "k", lambda: "own rows", results, 2)
+    release.set()
+    for thread in [leader, *threads]:
+        thread.join()
+    assert sorted(map(str, results)) == ["own rows", "own rows", "superseded"]
+
+
+def test_processes_share_the_result(tmp_path):
+    pytest.importorskip("fcntl")
+    running = SingleFlight(shared_dir=str(tmp_path))
+    waiting = SingleFlight(shared_dir=str(tmp_path))
+    release, leader, calls, results = leading(running, "k", "rows")
+    waited = []
+    thread = threading.Thread(target=lambda: waited.append(waiting.do("k", lambda: "not run")))
+    thread.start()
+    time.sleep(0.1)
+    release.set()
+    for t in (leader, thread):
+        t.join()
+    assert waited == ["rows"]
+    assert waiting.stats["shared"] == 1
+    # A caller that didn't wait for it runs the query again.
+    assert waiting.do("k", lambda: "new rows") == "new rows"
+
+
+def test_gives_up_waiting_for_another_process(tmp_path):
+    pytest.importorskip("fcntl")
+    running = SingleFlight(shared_dir=str(tmp_path))
+    waiting = SingleFlight(shared_dir=str(tmp_path), wait_timeout=0.2)
+    release, leader, calls, results = leading(running, "k", "stuck")
+    started = time.monotonic()
+    assert waiting.do("k", lambda: "own rows") == "own rows"
+    assert 0.2 <= time.monotonic() - started < 2
+    assert waiting.stats["wait_timeouts"] == 1
+    release.set()
+    leader.join()
+    assert results == ["stuck"]
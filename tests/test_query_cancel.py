@@ -0,0 +1,88 @@
+# tests/test_query_cancel.py
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from query_cancel import QueryCancelled, QueryTimeout, QueryTracker, track_engine
+
+# Runs for several seconds on SQLite, unless it is interrupted.
+SLOW_QUERY = text(
+    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 100000000) SELECT count(*) FROM n"
+)
+
+
+def engine(tmp_path, timeout=0):
+    engine = create_engine(f"sqlite:///{tmp_path / 'queries.db'}")
+    track_engine(engine, timeout=timeout)
+    return engine
+
+
+def run_slow(engine, tracker, slot, key=None):
+    """
+    Run SLOW_QUERY as a request of slot in a thread. Returns the thread, an
+    event set once the request started, and a list receiving the outcome.
+    """
+    started, outcome = threading.Event(), []
+
+    def run():
+        try:
+            with tracker.request(slot, key=key):
+                started.set()
+                with engine.connect() as conn:
+                    outcome.append(conn.execute(SLOW_QUERY).scalar())
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    started.wait(5)
+    return thread, outcome
+
+
+def test_newer_request_cancels_the_running_one(tmp_path):
+    tracker = QueryTracker()
+    slow, outcome = run_slow(engine(tmp_path), tracker, "session", key="old filters")
+    time.sleep(0.2)
+    started = time.monotonic()
+    with tracker.request("session", key="new filters"):
+        slow.join(10)
+    assert isinstance(outcome[0], QueryCancelled)
+    assert time.monotonic() - started < 2
+    assert tracker.stats() == {"slots": 0, "requests": 0}
+
+
+def test_same_key_runs_side_by_side(tmp_path):
+    tracker = QueryTracker()
+    slow, outcome = run_slow(engine(tmp_path), tracker, "session", key="page")
+    with tracker.request("session", key="page"):
+        time.sleep(0.1)
+    assert not outcome
+    tracker.cancel("session")
+    slow.join(10)
+    assert isinstance(outcome[0], QueryCancelled)
+
+
+def test_cancelled_request_runs_no_more_queries(tmp_path):
+    tracker = QueryTracker()
+    checks = engine(tmp_path)
+    with pytest.raises(QueryCancelled):
+        with tracker.request("checks"):
+            tracker.cancel("checks")
+            with checks.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+
+def test_timeout(tmp_path):
+    timed = engine(tmp_path, timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(QueryTimeout):
+        with timed.connect() as conn:
+            conn.execute(SLOW_QUERY)
+    assert time.monotonic() - started < 2
+    # The timer of a finished statement doesn't hit the next one.
+    with timed.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+        time.sleep(0.3)
+        assert conn.execute(text("SELECT 2")).scalar() == 2
@@ -0,0 +1,126 @@
+# tests/test_replica.py
+import datetime
+
+import pytest
+from sqlalchemy import Column, DateTime, Float, Integer, MetaData, String, Table, create_engine, text
+
+import replica as replica_module
+from db_sql import BrickSQLAlchemy
+from replica import Replica, ReplicaTable
+
+pytest.importorskip("duckdb_engine")
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    url = f"sqlite:///{tmp_path / 'warehouse.db'}"
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("region", String),
+        Column("debit", Float),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(),
+            [{"transaction_id": i, "region": ["EU", "APAC"][i % 2], "debit": float(i)} for i in range(100)],
+        )
+    engine.dispose()
+    return url
+
+
+def connect(url, shared_dir=None):
+    return BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=None, rollups=[], replica_tables=[], shared_dir=shared_dir)
+
+
+def replica(brick, tmp_path, spec=None, **kwargs):
+    return Replica(brick, [spec or ReplicaTable("transactions")], directory=str(tmp_path / "replica"), **kwargs)
+
+
+def local_rows(replica):
+    return replica.local.count_rows("transactions")
+
+
+def test_other_processes_read_the_synced_copies(warehouse, tmp_path, monkeypatch):
+    pytest.importorskip("diskcache")
+    monkeypatch.setattr(replica_module, "STATE_RELOAD", 0)
+    shared_dir = str(tmp_path / "shared")
+    syncing = replica(connect(warehouse, shared_dir), tmp_path)
+    reading = replica(connect(warehouse, shared_dir), tmp_path, sync=False)
+    assert not reading.serves("transactions")
+    assert syncing.sync() == 1
+    assert reading.serves("transactions")
+    assert local_rows(reading) == 100
+    # An edit through either process stops both from serving it until the next sync.
+    with reading.brick.engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM transactions WHERE transaction_id >= 90")
+    reading.brick.writes.record("transactions")
+    assert not reading.serves("transactions") and not syncing.serves("transactions")
+    syncing.sync()
+    assert reading.serves("transactions")
+    assert local_rows(reading) == 90
+    assert reading.start()._thread is None
+
+
+def test_readers_need_shared_writes(warehouse, tmp_path):
+    syncing = replica(connect(warehouse), tmp_path)
+    syncing.sync()
+    assert not replica(connect(warehouse), tmp_path, sync=False).serves("transactions")
+
+
+@pytest.fixture
+def modified(tmp_path):
+    """
+    Warehouse whose rows have an updated_at column, a few of them without a key.
+    """
+    url = f"sqlite:///{tmp_path / 'modified.db'}"
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("debit", Float),
+        Column("updated_at", DateTime),
+    )
+    table.create(engine)
+    start = datetime.datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(),
+            [
+                {"transaction_id": i if i % 10 else None, "debit": float(i), "updated_at": start}
+                for i in range(1, 51)
+            ],
+        )
+    engine.dispose()
+    return url
+
+
+def test_delta_sync_keeps_rows_without_a_key(modified, tmp_path):
+    brick = connect(modified)
+    syncing = replica(brick, tmp_path, spec=ReplicaTable("transactions", "updated_at"))
+    syncing.sync()
+    with brick.engine.begin() as conn:
+        conn.execute(
+            text("UPDATE transactions SET debit = -debit, updated_at = :at WHERE transaction_id IN (1, 2)"),
+            {"at": datetime.datetime(2024, 2, 1)},
+        )
+    syncing.sync()
+    with syncing.local._connect() as conn:
+        rows = conn.execute(text("SELECT transaction_id, debit FROM transactions")).all()
+    assert len(rows) == 50
+    assert sum(1 for key, _ in rows if key is None) == 5
+    assert sorted(debit for key, debit in rows if key in (1, 2)) == [-2.0, -1.0]
+
+
+def test_watermark_reloads_as_a_date(modified, tmp_path):
+    brick = connect(modified)
+    replica(brick, tmp_path, spec=ReplicaTable("transactions", "updated_at")).sync()
+    reloaded = replica(brick, tmp_path, spec=ReplicaTable("transactions", "updated_at"))
+    assert reloaded._state["transactions"]["watermark"] == datetime.datetime(2024, 1, 1)
+    # So the next sync can compare it with the column again.
+    assert reloaded.sync() == 1
+    assert reloaded.local.count_rows("transactions") == 50
@@ -0,0 +1,108 @@
+# tests/test_rollups.py
+import time
+
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine
+
+import rollups as rollups_module
+from db_sql import BrickSQLAlchemy
+from rollups import Rollup, RollupManager
+
+
+@pytest.fixture
+def warehouse(tmp_path):
+    url = f"sqlite:///{tmp_path / 'warehouse.db'}"
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("region", String),
+        Column("debit", Float),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(),
+            [{"transaction_id": i, "region": ["EU", "APAC"][i % 2], "debit": float(i)} for i in range(100)],
+        )
+    engine.dispose()
+    return url
+
+
+def connect(url, shared_dir=None):
+    return BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=None, rollups=[], replica_tables=[], shared_dir=shared_dir)
+
+
+@pytest.fixture
+def brick(warehouse):
+    brick = connect(warehouse)
+    yield brick
+    brick.engine.dispose()
+
+
+def manager(brick, tmp_path, **kwargs):
+    rollup = Rollup("by_region", "transactions", ["region"], ["debit"], "transaction_id")
+    return RollupManager(brick, [rollup], store_url=f"sqlite:///{tmp_path / 'rollups.db'}", **kwargs)
+
+
+def route(rollups):
+    return rollups.route("transactions", ["region"], [{"column": "debit", "agg": "sum"}])
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_rebuild_waits_for_edits_to_stop(brick, tmp_path):
+    rollups = manager(brick, tmp_path, refresh_interval=60, rebuild_delay=0.5).start()
+    try:
+        assert wait_for(lambda: route(rollups) is not None)
+        # A burst of edits, each less than rebuild_delay after the last.
+        started = time.monotonic()
+        for _ in range(4):
+            brick.writes.record("transactions")
+            assert route(rollups) is None
+            time.sleep(0.2)
+        assert not rollups.stats()["by_region"]["ready"]
+        assert wait_for(lambda: route(rollups) is not None)
+        assert time.monotonic() - started >= 0.6 + 0.5
+    finally:
+        rollups.stop()
+
+
+def test_tables_edited_all_the_time_are_rebuilt_every_refresh_interval(brick, tmp_path):
+    rollups = manager(brick, tmp_path, refresh_interval=0.6, rebuild_delay=60).start()
+    try:
+        assert wait_for(lambda: route(rollups) is not None)
+        brick.writes.record("transactions")
+        assert route(rollups) is None
+        assert wait_for(lambda: route(rollups) is not None, timeout=3)
+    finally:
+        rollups.stop()
+
+
+def test_other_processes_read_the_built_rollups(warehouse, tmp_path, monkeypatch):
+    pytest.importorskip("diskcache")
+    monkeypatch.setattr(rollups_module, "STATE_RELOAD", 0)
+    shared_dir = str(tmp_path / "shared")
+    building = manager(connect(warehouse, shared_dir), tmp_path)
+    reading = manager(connect(warehouse, shared_dir), tmp_path, build=False)
+    assert route(reading) is None
+    building.refresh()
+    assert route(reading) is not None
+    # An edit through either process stops both from using it until it is rebuilt.
+    reading.brick.writes.record("transactions")
+    assert route(reading) is None and route(building) is None
+    building.refresh()
+    assert route(reading) is not None
+    assert reading.start()._thread is None
+
+
+def test_readers_need_shared_writes(brick, tmp_path):
+    assert route(manager(brick, tmp_path, build=False)) is None
@@ -0,0 +1,87 @@
+# tests/test_sampling.py
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine
+
+from db_sql import BrickSQLAlchemy
+from sampling import Z_95, add_error_bounds
+
+AGGREGATES = [("SUM_debit", "SUM"), ("COUNT_debit", "COUNT"), ("AVG_debit", "AVG")]
+
+
+def sampled_result(values, percent, rng):
+    """
+    What a sampled aggregate query returns for one group of `values`: the
+    scaled SUM and COUNT, the AVG, and the helper columns of each.
+    """
+    sample = values[rng.random(len(values)) < percent / 100]
+    row = {
+        "SUM_debit": sample.sum() * 100 / percent,
+        "COUNT_debit": len(sample) * 100 / percent,
+        "AVG_debit": sample.mean() if len(sample) else np.nan,
+    }
+    for label, _ in AGGREGATES:
+        row[f"__n_{label}"] = len(sample)
+        row[f"__s2_{label}"] = (sample * sample).sum()
+    return row
+
+
+def test_error_bounds_formulas():
+    # Four sampled values adding up to 8, their squares to 20.
+    row = {"SUM_debit": 80.0, "COUNT_debit": 40.0, "AVG_debit": 2.0}
+    for label, _ in AGGREGATES:
+        row.update({f"__n_{label}": 4, f"__s2_{label}": 20.0})
+    df = pd.DataFrame([row])
+    result = add_error_bounds(df, AGGREGATES, 10)
+    assert not [col for col in result.columns if col.startswith("__")]
+    row = result.iloc[0]
+    assert row["SUM_debit_error"] == pytest.approx(Z_95 * (0.9 * 20) ** 0.5 / 0.1)
+    assert row["COUNT_debit_error"] == pytest.approx(Z_95 * (0.9 * 4) ** 0.5 / 0.1)
+    # Sample variance (20 - 4 * 2²) / 3, over n.
+    assert row["AVG_debit_error"] == pytest.approx(Z_95 * (4 / 3 / 4) ** 0.5)
+    # A whole-table "sample" has no error on SUM and COUNT.
+    assert add_error_bounds(df, AGGREGATES, 100).iloc[0]["SUM_debit_error"] == 0
+
+
+@pytest.mark.parametrize("percent", [1, 10])
+def test_error_bounds_cover_95_percent(percent):
+    rng = np.random.default_rng(7)
+    values = rng.gamma(2.0, 50.0, size=20000)
+    exact = {"SUM": values.sum(), "COUNT": len(values), "AVG": values.mean()}
+    trials = pd.DataFrame([sampled_result(values, percent, rng) for _ in range(1000)])
+    result = add_error_bounds(trials, AGGREGATES, percent)
+    for label, agg_func in AGGREGATES:
+        covered = ((result[label] - exact[agg_func]).abs() <= result[f"{label}_error"]).mean()
+        assert 0.92 <= covered <= 0.98, (agg_func, covered)
+
+
+def test_sampled_group_by(tmp_path):
+    url = f"sqlite:///{tmp_path / 'sampled.db'}"
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("region", String),
+        Column("debit", Float),
+    )
+    table.create(engine)
+    rng = np.random.default_rng(3)
+    debits = rng.gamma(2.0, 50.0, size=40000)
+    rows = [
+        {"transaction_id": i, "region": ["EU", "APAC"][i % 2], "debit": float(debit)} for i, debit in enumerate(debits)
+    ]
+    with engine.begin() as conn:
+        conn.execute(table.insert(), rows)
+    brick = BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=None, rollups=[], replica_tables=[], shared_dir=None)
+    aggregates = [{"column": "debit", "agg": agg_func} for _, agg_func in AGGREGATES]
+    query = dict(table_name="transactions", group_by=["region"], aggregate_columns=aggregates, sort_column="region")
+    exact = brick.get_data_query(**query).set_index("region")
+    sampled = brick.get_data_query(sample=10, **query).set_index("region")
+    brick.engine.dispose()
+    for label, _ in AGGREGATES:
+        assert (sampled[f"{label}_error"] > 0).all()
+        # Well within the 95% bound's reach (3 sigma rather than 1.96).
+        assert ((sampled[label] - exact[label]).abs() <= 1.5 * sampled[f"{label}_error"]).all(), label
+    assert (sampled["COUNT_debit"] / exact["COUNT_debit"]).between(0.9, 1.1).all()
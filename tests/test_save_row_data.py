@@ -0,0 +1,144 @@
+# tests/test_save_row_data.py
+import re
+
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, select, text
+
+import db_sql
+from db_sql import BrickSQLAlchemy
+
+ROWS = 1200
+
+
+@pytest.fixture(params=["sqlite", "duckdb"])
+def brick(request, tmp_path):
+    if request.param == "duckdb":
+        pytest.importorskip("duckdb_engine")
+    url = f"{request.param}:///{tmp_path / 'edits.db'}"
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("debit", Float),
+        Column("region", String),
+        Column("country", String),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(),
+            [{"transaction_id": i, "debit": float(i), "region": "EU", "country": "France"} for i in range(ROWS)],
+        )
+    engine.dispose()
+    brick = BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=None, rollups=[], replica_tables=[], shared_dir=None)
+    yield brick
+    brick.engine.dispose()
+
+
+def edit(transaction_id, column, value):
+    return {"data": {"transaction_id": transaction_id}, "colId": column, "value": value}
+
+
+def stored(brick, *ids):
+    table = brick._internal_schema("transactions")
+    stmt = select(table).where(table.c.transaction_id.in_(ids)).order_by(table.c.transaction_id)
+    with brick.engine.connect() as conn:
+        return {row.transaction_id: tuple(row)[1:] for row in conn.execute(stmt)}
+
+
+def test_rows_with_different_columns(brick):
+    result = brick.save_row_data(
+        "transactions",
+        [
+            edit(1, "debit", 1.5),
+            edit(2, "region", "APAC"),
+            edit(2, "country", None),
+            edit(3, "debit", None),
+            edit(3, "debit", 3.5),  # the last edit of a cell wins
+            edit(4, "region", "AMER"),
+        ],
+    )
+    assert result["error"] is None
+    assert (result["rows_applied"], result["rows_failed"], result["cells"]) == (4, 0, 6)
+    assert stored(brick, 1, 2, 3, 4, 5) == {
+        1: (1.5, "EU", "France"),
+        2: (2.0, "APAC", None),
+        3: (3.5, "EU", "France"),
+        4: (4.0, "AMER", "France"),
+        5: (5.0, "EU", "France"),
+    }
+
+
+def test_unknown_rows_count_as_failed(brick):
+    result = brick.save_row_data(
+        "transactions", [edit(1, "debit", 0.0), edit(ROWS + 1, "debit", 0.0), edit(ROWS + 2, "region", "X")]
+    )
+    assert result["error"] is None
+    assert (result["rows_applied"], result["rows_failed"]) == (1, 2)
+    assert stored(brick, 1)[1][0] == 0.0
+
+
+def test_unknown_column_saves_nothing(brick):
+    result = brick.save_row_data("transactions", [edit(1, "debit", 0.0), edit(2, "missing", 1)])
+    assert "missing" in result["error"]
+    assert (result["rows_applied"], result["rows_failed"]) == (0, 2)
+    assert stored(brick, 1)[1][0] == 1.0
+
+
+def test_large_batch(brick):
+    changes = [edit(i, "debit", -float(i)) for i in range(0, ROWS, 2)]
+    changes += [edit(i, "country", None) for i in range(1, ROWS, 3)]
+    result = brick.save_row_data("transactions", changes)
+    edited = {change["data"]["transaction_id"] for change in changes}
+    assert (result["rows_applied"], result["rows_failed"]) == (len(edited), 0)
+    rows = stored(brick, *range(ROWS))
+    assert all(rows[i][0] == (-float(i) if i % 2 == 0 else float(i)) for i in range(ROWS))
+    assert all((rows[i][2] is None) == (i % 3 == 1) for i in range(ROWS))
+
+
+@pytest.fixture
+def merging(brick, monkeypatch):
+    """
+    brick taking the Databricks path of save_row_data, in chunks of 500 rows.
+    """
+    if brick.engine.dialect.name != "duckdb":
+        pytest.skip("MERGE runs on DuckDB here")
+    merge_statement = brick._merge_statement
+    brick.merges = []
+
+    def duckdb_merge(table, batch):
+        # DuckDB wants the SET targets unqualified; the rest is Databricks SQL as is.
+        brick.merges.append(batch)
+        stmt = merge_statement(table, batch)
+        return text(re.sub(r"(SET |, )t\.(\w+) =", r"\1\2 =", stmt.text)).bindparams(**stmt.compile().params)
+
+    monkeypatch.setattr(brick.engine.dialect, "name", "databricks")
+    monkeypatch.setattr(brick, "_merge_statement", duckdb_merge)
+    monkeypatch.setattr(db_sql, "MERGE_BATCH_ROWS", 500)
+    return brick
+
+
+def test_merge_statement(brick):
+    table = brick._internal_schema("transactions")
+    stmt = brick._merge_statement(table, [(1, {"debit": 1.5}), (2, {"region": None, "country": "Spain"})])
+    sql = " ".join(stmt.text.split())
+    # One flag per column, so rows keep the columns they don't set.
+    assert "AS s(transaction_id, c0, u0, c1, u1, c2, u2)" in sql
+    assert "CASE WHEN s.u0 THEN s.c0 ELSE t.country END" in sql
+    params = stmt.compile().params
+    assert params == {"k0": 1, "v0_1": 1.5, "k1": 2, "v1_0": "Spain", "v1_2": None}
+
+
+def test_merge_chunks(merging):
+    changes = [edit(i, "debit", -1.0) for i in range(ROWS)]
+    changes += [edit(i, "region", None) for i in range(0, ROWS, 7)]
+    changes += [edit(ROWS + i, "country", "Nowhere") for i in range(5)]
+    result = merging.save_row_data("transactions", changes)
+    assert result["error"] is None
+    assert [len(batch) for batch in merging.merges] == [500, 500, 205]
+    assert (result["rows_applied"], result["rows_failed"]) == (ROWS, 5)
+    rows = stored(merging, *range(ROWS))
+    assert all(row[0] == -1.0 for row in rows.values())
+    assert all((rows[i][1] is None) == (i % 7 == 0) for i in range(ROWS))
+    assert all(row[2] == "France" for row in rows.values())
@@ -0,0 +1,46 @@
+# tests/test_schema_snapshot.py
+import pickle
+import time
+
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine
+
+from db_sql import BrickSQLAlchemy
+
+
+def create_table(url, name):
+    engine = create_engine(url)
+    Table(name, MetaData(), Column("id", Integer)).create(engine)
+    engine.dispose()
+
+
+def connect(url, schema_cache_path):
+    return BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=schema_cache_path, rollups=[], replica_tables=[])
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_snapshot_table_names_are_refreshed(tmp_path):
+    url = f"sqlite:///{tmp_path / 'warehouse.db'}"
+    snapshot_path = str(tmp_path / "schema.pickle")
+    create_table(url, "transactions")
+    brick = connect(url, snapshot_path)
+    brick._internal_schema("transactions")
+    brick.engine.dispose()
+
+    create_table(url, "accounts")
+    brick = connect(url, snapshot_path)
+    try:
+        # Reflected tables come from the snapshot, new ones are listed in the background.
+        assert "transactions" in brick.metadata.tables
+        assert wait_for(lambda: brick.get_table_names() == ["accounts", "transactions"])
+        with open(snapshot_path, "rb") as f:
+            assert pickle.load(f)["table_names"] == ["accounts", "transactions"]
+    finally:
+        brick.engine.dispose()
@@ -0,0 +1,95 @@
+# tests/test_table_stats.py
+import threading
+import time
+
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine
+
+from db_sql import BrickSQLAlchemy
+from table_stats import TableStats
+
+
+def make_warehouse(url, rows=100):
+    engine = create_engine(url)
+    table = Table(
+        "transactions",
+        MetaData(),
+        Column("transaction_id", Integer),
+        Column("region", String),
+        Column("debit", Float),
+    )
+    table.create(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            table.insert(),
+            [{"transaction_id": i, "region": ["EU", "APAC"][i % 2], "debit": float(i)} for i in range(rows)],
+        )
+    engine.dispose()
+    return url
+
+
+def connect(url):
+    return BrickSQLAlchemy(url, cache_ttl=0, schema_cache_path=None, rollups=[], replica_tables=[])
+
+
+@pytest.fixture
+def blocked_stats(tmp_path, monkeypatch):
+    """
+    TableStats on SQLite whose column statistics wait for the returned event.
+    """
+    brick = connect(make_warehouse(f"sqlite:///{tmp_path / 'warehouse.db'}"))
+    release = threading.Event()
+    columns = TableStats._metadata_columns
+
+    def blocked(self, table, row_count):
+        release.wait(5)
+        return columns(self, table, row_count)
+
+    monkeypatch.setattr(TableStats, "_metadata_columns", blocked)
+    stats = TableStats(brick)
+    yield stats, release
+    release.set()
+    brick.engine.dispose()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_row_count_before_the_column_statistics(blocked_stats):
+    stats, release = blocked_stats
+    assert stats.row_count("transactions") is None
+    assert wait_for(lambda: stats.row_count("transactions") == 100)
+    assert stats._stats.get("transactions") is None
+    release.set()
+    assert stats.get("transactions", timeout=5)["row_count"] == 100
+
+
+def test_early_row_count_is_dropped_after_a_write(blocked_stats):
+    stats, release = blocked_stats
+    stats.row_count("transactions")
+    assert wait_for(lambda: stats.row_count("transactions") == 100)
+    stats.brick.writes.record("transactions")
+    assert stats.row_count("transactions") is None
+
+
+def test_no_estimate_on_sqlite(blocked_stats):
+    stats, release = blocked_stats
+    assert stats._metadata_row_count("transactions") is None
+
+
+def test_estimate_from_duckdb_catalog(tmp_path):
+    pytest.importorskip("duckdb_engine")
+    brick = connect(make_warehouse(f"duckdb:///{tmp_path / 'warehouse.duckdb'}", rows=250))
+    try:
+        stats = TableStats(brick)
+        assert stats._metadata_row_count("transactions") == 250
+        assert stats.estimated_row_count("transactions") == 250
+        assert stats._metadata_row_count("missing") is None
+    finally:
+        brick.engine.dispose()
@@ -0,0 +1,17 @@
+# wsgi.py
+"""
+WSGI entry point for production serving:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app module is imported once by the gunicorn master; each worker sets
+itself up (warehouse engine, pool, table list, background threads) after
+it is forked, see app.init_worker.
+"""
+from app import init_worker, server
+
+
+def application(environ, start_response):
+    # A no-op once this worker is set up (gunicorn's post_fork normally does it).
+    init_worker()
+    return server(environ, start_response)